@@ -0,0 +1,187 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional, Tuple
+from retrieval import tokenize
+
+# Cache settings (overridable from .env)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))
+# Token overlap (0-1) for near-identical questions to share an answer; 0 (the
+# default) only reuses answers for the same normalized question
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+
+# Trailing punctuation and Thai polite particles don't change the question
+_TRAILING_RE = re.compile(r"(?:\s|[?!.。]|ครับ|คับ|ค่ะ|คะ|จ้า|นะ)+$")
+_SPACE_RE = re.compile(r"\s+")
+# Numbers, dates, times and day/month words: near-identical questions only
+# share an answer when these are the same, in the same order
+_TEMPORAL_RE = re.compile(
+    r"\d+(?:[.:/-]\d+)*"
+    r"|\b(?:today|tonight|tomorrow|yesterday|now|morning|afternoon|evening|night"
+    r"|am|pm|next|last|this|week|month|year"
+    r"|mon|tue|wed|thu|fri|sat|sun|monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+    r"|jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec|january|february|march|april|june"
+    r"|july|august|september|october|november|december)\b"
+    r"|วันนี้|คืนนี้|พรุ่งนี้|มะรืน|เมื่อวาน|ตอนนี้|เช้า|บ่าย|เย็น|ค่ำ|ทุ่ม|ตี|โมง"
+    r"|สัปดาห์|อาทิตย์|เดือน|ปี|หน้า|ที่แล้ว"
+    r"|จันทร์|อังคาร|พุธ|พฤหัส|ศุกร์|เสาร์"
+)
+# Continuations and words pointing back at earlier turns
+_FOLLOW_UP_RE = re.compile(
+    r"^(?:and|also|then|so|but|what about|how about)\b"
+    r"|\b(?:it|its|that|those|these|them|they|he|she|him|her|there|else|again|same|one)\b"
+    r"|^(?:แล้ว|และ)|ล่ะ|อันนั้น|อันนี้|นั้น|มัน|เมื่อกี้|อีก"
+)
+_THAI_RE = re.compile(r"[\u0e00-\u0e7f]")
+
+
+def normalize_question(question: str) -> str:
+    question = _SPACE_RE.sub(" ", question.strip().lower())
+    return _TRAILING_RE.sub("", question)
+
+
+def temporal_terms(normalized: str) -> tuple:
+    return tuple(_TEMPORAL_RE.findall(normalized))
+
+
+def is_follow_up(normalized: str) -> bool:
+    """Whether a question only makes sense with the conversation before it
+    ("and tomorrow?", "what about that one")."""
+    if _FOLLOW_UP_RE.search(normalized):
+        return True
+    # Very short English questions; Thai is written without spaces
+    return not _THAI_RE.search(normalized) and len(normalized.split()) <= 2
+
+
+def context_key(normalized: str, context: str) -> str:
+    """Short hash of the conversation context for follow-up questions, ""
+    for questions that stand on their own."""
+    if not context or not is_follow_up(normalized):
+        return ""
+    return hashlib.blake2b(context.encode(), digest_size=8).hexdigest()
+
+
+class AnswerCache:
+    """LRU + TTL cache of LLM answers keyed on (collection, version, context,
+    question).
+
+    Each collection has a version that is bumped on every write, so answers
+    computed against older data are never served. The key includes a hash
+    of the conversation context only for follow-up questions, so "and
+    tomorrow?" never gets another conversation's answer while a question
+    that stands on its own is shared across and within chats. With `similarity` > 0, near-identical
+    questions share an answer, but only when their numbers, dates and times
+    match exactly.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.similarity = similarity
+        self.entries: "OrderedDict[Tuple[str, int, str, str], Tuple[float, frozenset, tuple, str]]" = OrderedDict()
+        self.versions: Dict[str, int] = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+        self.similar_hits = 0
+        self._lock = threading.Lock()
+
+    def version(self, collection_name: str) -> int:
+        return self.versions[collection_name]
+
+    def get(self, collection_name: str, question: str, context: str = "") -> Optional[str]:
+        normalized = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            version = self.versions[collection_name]
+            key = (collection_name, version, context_key(normalized, context), normalized)
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None and self.similarity > 0:
+                key, entry = self._find_similar(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def _find_similar(self, key, now):
+        normalized = key[3]
+        terms = frozenset(tokenize(normalized))
+        if not terms:
+            return key, None
+        temporal = temporal_terms(normalized)
+        for other_key, entry in reversed(self.entries.items()):
+            # Same collection, version and context; same numbers and dates
+            if other_key[:3] != key[:3] or now - entry[0] > self.ttl or entry[2] != temporal:
+                continue
+            other_terms = entry[1]
+            overlap = len(terms & other_terms) / len(terms | other_terms)
+            if overlap >= self.similarity:
+                self.similar_hits += 1
+                return other_key, entry
+        return key, None
+
+    def put(
+        self,
+        collection_name: str,
+        question: str,
+        answer: str,
+        version: Optional[int] = None,
+        context: str = "",
+    ) -> None:
+        """Store an answer. Pass the `version` read before computing it so an
+        answer that raced with a write is discarded."""
+        normalized = normalize_question(question)
+        with self._lock:
+            if version is None:
+                version = self.versions[collection_name]
+            if version != self.versions[collection_name]:
+                return
+            key = (collection_name, version, context_key(normalized, context), normalized)
+            self.entries[key] = (
+                time.monotonic(),
+                frozenset(tokenize(normalized)),
+                temporal_terms(normalized),
+                answer,
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, collection_name: str) -> None:
+        """Call after writing to a collection: bumps its version and drops its
+        cached answers."""
+        with self._lock:
+            self.versions[collection_name] += 1
+            for key in [k for k in self.entries if k[0] == collection_name]:
+                del self.entries[key]
+        logging.info(f"Answer cache invalidated for '{collection_name}'")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "versions": dict(self.versions),
+            }
+
+
+# Shared by the analyzer (lookups) and every writer (invalidation)
+answer_cache = AnswerCache()
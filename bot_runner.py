@@ -0,0 +1,243 @@
+import os
+import socket
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from concurrency import run_db
+from database import get_db
+from write_buffer import write_buffer
+
+# Where the bot runs (overridable from .env):
+#   embedded - inside the single FastAPI process (default, as before)
+#   leader   - every API worker competes for a MongoDB lease; the holder runs it
+#   external - API workers never run it; start `python bot_worker.py` instead
+BOT_RUNNER = os.getenv("BOT_RUNNER", "embedded").lower()
+BOT_LEASE_TTL = float(os.getenv("BOT_LEASE_TTL", "30"))
+BOT_LEASE_RENEW_INTERVAL = float(os.getenv("BOT_LEASE_RENEW_INTERVAL", "10"))
+BOT_UPDATE_POLL_INTERVAL = float(os.getenv("BOT_UPDATE_POLL_INTERVAL", "0.5"))
+
+# Update ingestion: "polling" or "webhook" (shared by telegram_bot and the
+# /telegram/webhook route, which mustn't import the bot to check them)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Required in webhook mode: Telegram sends it with every update, and updates
+# without it are rejected
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+LEASE_COLLECTION = "bot_lease"
+LEASE_ID = "telegram_bot"
+# Webhook updates received by a worker that isn't running the bot
+UPDATES_COLLECTION = "bot_updates"
+
+
+class BotLease:
+    """Single-holder lease in MongoDB, renewed by a heartbeat.
+
+    Acquiring is one `find_one_and_update` that only matches if we already
+    hold the lease or it has expired; otherwise the upsert hits the unique
+    `_id` and fails, so at most one process holds it at a time.
+    """
+
+    def __init__(self, collection, ttl: float = BOT_LEASE_TTL, name: str = LEASE_ID):
+        self.collection = collection
+        self.ttl = ttl
+        self.name = name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.expires_at: Optional[datetime] = None
+
+    def try_acquire(self, info: Dict[str, Any]) -> bool:
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        try:
+            self.collection.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}],
+                },
+                {
+                    "$set": {
+                        **info,
+                        "owner": self.owner,
+                        "host": socket.gethostname(),
+                        "pid": os.getpid(),
+                        "heartbeat_at": now,
+                        "expires_at": expires_at,
+                    }
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return False
+        self.expires_at = expires_at
+        return True
+
+    def release(self) -> None:
+        """Expire the lease now so a standby process can take over."""
+        self.collection.update_one(
+            {"_id": self.name, "owner": self.owner},
+            {"$set": {"status": "stopped", "expires_at": datetime.utcnow()}},
+        )
+        self.expires_at = None
+
+
+class BotRunner:
+    """Runs the bot in whichever process holds the lease.
+
+    Every `renew_interval` seconds the lease is acquired or renewed. The
+    holder starts the bot; a process that loses the lease (or can't reach
+    MongoDB until its lease would have expired) stops it.
+    """
+
+    def __init__(
+        self,
+        lease: BotLease,
+        start: Callable[[], Awaitable[Any]],
+        stop: Callable[[], Awaitable[Any]],
+        renew_interval: float = BOT_LEASE_RENEW_INTERVAL,
+        info: Optional[Dict[str, Any]] = None,
+    ):
+        self.lease = lease
+        self.info = info or {}
+        self.start_bot = start
+        self.stop_bot = stop
+        self.renew_interval = renew_interval
+        self.leading = False
+        self.running = False
+        self._task: Optional[asyncio.Task] = None
+        self._consumer: Optional[asyncio.Task] = None
+
+    async def _renew(self) -> bool:
+        status = "running" if self.running else "starting"
+        return await run_db(self.lease.try_acquire, {**self.info, "status": status})
+
+    async def _tick(self) -> None:
+        try:
+            acquired = await self._renew()
+        except Exception as e:
+            logging.error(f"Bot lease renewal failed: {str(e)}")
+            expires_at = self.lease.expires_at
+            # Keep running until our lease could have been taken over
+            acquired = self.leading and expires_at is not None and datetime.utcnow() < expires_at
+
+        if acquired and not self.running:
+            self.leading = True
+            logging.info(f"Acquired bot lease as {self.lease.owner}, starting bot")
+            try:
+                await self.start_bot()
+                self.running = True
+                if self.info.get("bot_mode") == "webhook":
+                    self._consumer = asyncio.create_task(consume_relayed_updates())
+                # Publish "running" right away rather than on the next tick
+                await self._renew()
+            except Exception as e:
+                logging.error(f"Failed to start telegram bot: {str(e)}")
+        elif not acquired and self.leading:
+            logging.warning("Lost the bot lease, stopping bot")
+            await self._stop_local()
+
+    async def _stop_local(self) -> None:
+        self.leading = False
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
+        if self.running:
+            self.running = False
+            await self.stop_bot()
+
+    async def run(self) -> None:
+        while True:
+            await self._tick()
+            await asyncio.sleep(self.renew_interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        was_leading = self.leading
+        await self._stop_local()
+        if was_leading:
+            try:
+                await run_db(self.lease.release)
+            except Exception as e:
+                logging.error(f"Failed to release bot lease: {str(e)}")
+
+
+async def relay_update(data: dict) -> bool:
+    """Route a webhook update to the bot, wherever it runs.
+
+    In the process running the bot it goes straight to the local queue
+    (False when full, for backpressure). Elsewhere it is stored in MongoDB
+    for the bot process to pick up.
+    """
+    import telegram_bot
+
+    if BOT_MODE != "webhook":
+        # Nothing would ever read relayed updates
+        return False
+    if telegram_bot.update_queue is not None:
+        return telegram_bot.enqueue_update(data)
+    if BOT_RUNNER == "embedded":
+        return False
+    await write_buffer.insert(
+        UPDATES_COLLECTION, {"update": data, "received_at": datetime.utcnow()}
+    )
+    return True
+
+
+async def consume_relayed_updates() -> None:
+    """In the bot process: move updates stored by other workers into the
+    local webhook queue, oldest first, each claimed by exactly one reader."""
+    import telegram_bot
+
+    collection = get_db()[UPDATES_COLLECTION]
+    while True:
+        queue = telegram_bot.update_queue
+        if queue is None or queue.full():
+            # Not started yet, or the handlers are behind
+            await asyncio.sleep(BOT_UPDATE_POLL_INTERVAL)
+            continue
+        try:
+            doc = await run_db(collection.find_one_and_delete, {}, sort=[("_id", 1)])
+        except Exception as e:
+            logging.error(f"Error reading relayed updates: {str(e)}")
+            doc = None
+        if doc is None:
+            await asyncio.sleep(BOT_UPDATE_POLL_INTERVAL)
+            continue
+        telegram_bot.enqueue_update(doc["update"])
+
+
+def create_runner() -> BotRunner:
+    from telegram_bot import start_bot, stop_bot
+
+    return BotRunner(
+        BotLease(get_db()[LEASE_COLLECTION]),
+        start_bot,
+        stop_bot,
+        info={"runner": BOT_RUNNER, "bot_mode": BOT_MODE},
+    )
+
+
+async def read_status(runner: Optional[BotRunner] = None) -> Dict[str, Any]:
+    """Bot status as published in MongoDB by whichever process runs it."""
+    doc = await run_db(get_db()[LEASE_COLLECTION].find_one, {"_id": LEASE_ID})
+    if doc is None:
+        return {"status": "not_initialized", "runner": BOT_RUNNER}
+    alive = doc["expires_at"] > datetime.utcnow()
+    return {
+        "status": doc.get("status", "running") if alive else "stopped",
+        "runner": doc.get("runner", BOT_RUNNER),
+        "bot_mode": doc.get("bot_mode"),
+        "leader": doc["owner"],
+        "host": doc.get("host"),
+        "pid": doc.get("pid"),
+        "heartbeat_at": doc["heartbeat_at"].isoformat(),
+        "this_process": runner is not None and doc["owner"] == runner.lease.owner,
+    }
@@ -0,0 +1,39 @@
+"""Run the Telegram bot in its own process (BOT_RUNNER=external).
+
+The FastAPI app can then run with several workers:
+
+    BOT_RUNNER=external uvicorn main:app --workers 4
+    BOT_RUNNER=external python bot_worker.py
+
+Start more than one bot worker for a hot standby: they share the MongoDB
+lease, so only one runs the bot and another takes over within
+BOT_LEASE_TTL seconds if it dies.
+"""
+import signal
+import asyncio
+import logging
+from database import get_client, close_client
+from bot_runner import create_runner
+
+
+async def main():
+    get_client()
+    runner = create_runner()
+    runner.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logging.info("Stopping bot worker")
+    from telegram_bot import shutdown_bot
+
+    await runner.stop()
+    await shutdown_bot()
+    close_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
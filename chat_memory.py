@@ -0,0 +1,162 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional
+
+# Memory settings (overridable from .env)
+CHAT_MEMORY_MAX_TURNS = int(os.getenv("CHAT_MEMORY_MAX_TURNS", "10"))
+CHAT_MEMORY_MAX_CHARS = int(os.getenv("CHAT_MEMORY_MAX_CHARS", "2000"))
+CHAT_MEMORY_SUMMARY_CHARS = int(os.getenv("CHAT_MEMORY_SUMMARY_CHARS", "500"))
+CHAT_MEMORY_MAX_CHATS = int(os.getenv("CHAT_MEMORY_MAX_CHATS", "1000"))
+# "none", "mongo" or "file"
+CHAT_MEMORY_STORE = os.getenv("CHAT_MEMORY_STORE", "none").lower()
+CHAT_MEMORY_PATH = os.getenv("CHAT_MEMORY_PATH", "chat_memory")
+
+
+def compact_summary(summary: str, turns: List[str], max_chars: int = CHAT_MEMORY_SUMMARY_CHARS) -> str:
+    """Fold old turns into the running summary without an LLM call.
+
+    Each turn is shortened to its first line (max 120 chars) and only the last
+    `max_chars` of the summary are kept.
+    """
+    lines = [summary] if summary else []
+    for turn in turns:
+        first = turn.split("\n", 1)[0]
+        lines.append(first if len(first) <= 120 else first[:117] + "...")
+    merged = "\n".join(lines)
+    return merged[-max_chars:]
+
+
+class ChatState:
+    def __init__(self, turns: Optional[List[str]] = None, summary: str = ""):
+        self.turns: Deque[str] = deque(turns or [])
+        self.summary = summary
+
+    def to_dict(self) -> Dict:
+        return {"turns": list(self.turns), "summary": self.summary}
+
+
+class MongoChatStore:
+    """Persists chat memory in a MongoDB collection, one document per chat."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def load(self, chat_id: int) -> Optional[Dict]:
+        return self.collection.find_one({"chat_id": chat_id}, {"_id": 0})
+
+    def save(self, chat_id: int, state: Dict) -> None:
+        self.collection.update_one(
+            {"chat_id": chat_id},
+            {"$set": {**state, "updated_at": datetime.utcnow()}},
+            upsert=True,
+        )
+
+
+class FileChatStore:
+    """Persists chat memory as one small JSON file per chat."""
+
+    def __init__(self, path: str = CHAT_MEMORY_PATH):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def load(self, chat_id: int) -> Optional[Dict]:
+        file = self.path / f"{chat_id}.json"
+        if not file.exists():
+            return None
+        return json.loads(file.read_text(encoding="utf-8"))
+
+    def save(self, chat_id: int, state: Dict) -> None:
+        file = self.path / f"{chat_id}.json"
+        tmp = file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(file)
+
+
+class ChatMemory:
+    """Bounded per-chat conversation history.
+
+    Each chat keeps at most `max_turns` recent turns and `max_chars` of text;
+    anything older is folded once into a short summary that is sent instead.
+    Only the `max_chats` most recently active chats stay in RAM, the rest are
+    reloaded from the store (if any) when they come back.
+    """
+
+    def __init__(
+        self,
+        max_turns: int = CHAT_MEMORY_MAX_TURNS,
+        max_chars: int = CHAT_MEMORY_MAX_CHARS,
+        max_chats: int = CHAT_MEMORY_MAX_CHATS,
+        store=None,
+        summarizer: Callable[[str, List[str]], str] = compact_summary,
+    ):
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.max_chats = max_chats
+        self.store = store
+        self.summarizer = summarizer
+        self.chats: "OrderedDict[int, ChatState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, chat_id: int) -> ChatState:
+        state = self.chats.get(chat_id)
+        if state is None:
+            saved = self.store.load(chat_id) if self.store else None
+            state = ChatState(saved.get("turns"), saved.get("summary", "")) if saved else ChatState()
+            self.chats[chat_id] = state
+            while len(self.chats) > self.max_chats:
+                # Already persisted on every exchange, so just drop it
+                self.chats.popitem(last=False)
+        self.chats.move_to_end(chat_id)
+        return state
+
+    def _trim(self, state: ChatState) -> None:
+        evicted = []
+        while state.turns and (
+            len(state.turns) > self.max_turns
+            or sum(len(t) for t in state.turns) > self.max_chars
+        ):
+            evicted.append(state.turns.popleft())
+        if evicted:
+            state.summary = self.summarizer(state.summary, evicted)
+
+    def context(self, chat_id: int, pending: str = "") -> str:
+        """Conversation context for the prompt: summary, recent turns and the
+        not-yet-recorded `pending` turn."""
+        with self._lock:
+            state = self._state(chat_id)
+            parts = []
+            if state.summary:
+                parts.append(f"Summary of earlier conversation:\n{state.summary}")
+            parts.extend(state.turns)
+            if pending:
+                parts.append(pending)
+            return "\n".join(parts)
+
+    def record_exchange(self, chat_id: int, user_text: str, reply: str) -> None:
+        with self._lock:
+            state = self._state(chat_id)
+            state.turns.append(f"User: {user_text}")
+            state.turns.append(f"Assistant: {reply}")
+            self._trim(state)
+            snapshot = state.to_dict()
+        if self.store:
+            try:
+                self.store.save(chat_id, snapshot)
+            except Exception as e:
+                logging.error(f"Failed to persist chat memory for {chat_id}: {str(e)}")
+
+
+def create_chat_memory(db=None) -> ChatMemory:
+    """Build the ChatMemory configured by CHAT_MEMORY_STORE."""
+    store = None
+    if CHAT_MEMORY_STORE == "mongo" and db is not None:
+        store = MongoChatStore(db["chat_memory"])
+        store.collection.create_index("chat_id", unique=True)
+    elif CHAT_MEMORY_STORE == "file":
+        store = FileChatStore(CHAT_MEMORY_PATH)
+    return ChatMemory(store=store)
@@ -0,0 +1,104 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+# Max blocking calls in flight at once (overridable from .env)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "16"))
+
+
+class BoundedExecutor:
+    """Runs blocking calls off the event loop with a fixed concurrency limit.
+
+    Calls beyond `max_workers` wait in the pool's queue instead of blocking
+    the loop that also serves the FastAPI app and the other chats.
+    """
+
+    def __init__(self, max_workers: int, name: str):
+        self.max_workers = max_workers
+        self.name = name
+        self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=self.name
+            )
+        return self._executor
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), partial(func, *args, **kwargs)
+        )
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+            logging.info(f"Executor '{self.name}' shut down")
+
+
+# Shared executors: Gemini calls are slow, so they get their own pool and can't
+# starve MongoDB reads/writes.
+llm_executor = BoundedExecutor(LLM_MAX_CONCURRENCY, "llm")
+db_executor = BoundedExecutor(DB_MAX_CONCURRENCY, "mongo")
+
+
+async def run_llm(func: Callable, *args, **kwargs) -> Any:
+    return await llm_executor.run(func, *args, **kwargs)
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    return await db_executor.run(func, *args, **kwargs)
+
+
+def shutdown_executors(wait: bool = True) -> None:
+    llm_executor.shutdown(wait=wait)
+    db_executor.shutdown(wait=wait)
+
+
+# Benchmark: N concurrent chats against a fake LLM that takes `latency` seconds
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chat throughput benchmark")
+    parser.add_argument("--chats", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=LLM_MAX_CONCURRENCY)
+    args = parser.parse_args()
+
+    def fake_llm(question: str) -> str:
+        time.sleep(args.latency)
+        return f"answer to {question}"
+
+    async def blocking_chat(i: int) -> str:
+        # What the handlers did before: call the LLM directly on the loop
+        return fake_llm(f"q{i}")
+
+    async def offloaded_chat(executor: BoundedExecutor, i: int) -> str:
+        return await executor.run(fake_llm, f"q{i}")
+
+    async def bench():
+        start = time.perf_counter()
+        await asyncio.gather(*(blocking_chat(i) for i in range(args.chats)))
+        blocking = time.perf_counter() - start
+
+        executor = BoundedExecutor(args.workers, "bench")
+        start = time.perf_counter()
+        await asyncio.gather(*(offloaded_chat(executor, i) for i in range(args.chats)))
+        offloaded = time.perf_counter() - start
+        executor.shutdown()
+
+        print(f"{args.chats} chats, {args.latency}s fake LLM latency")
+        print(f"blocking:  {blocking:.2f}s ({args.chats / blocking:.1f} msg/s)")
+        print(
+            f"executor:  {offloaded:.2f}s ({args.chats / offloaded:.1f} msg/s, "
+            f"{args.workers} workers)"
+        )
+
+    asyncio.run(bench())
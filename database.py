@@ -0,0 +1,69 @@
+import os
+import logging
+import threading
+import pymongo
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Connection settings (overridable from .env)
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+MONGODB_DB = os.getenv("MONGODB_DB", "telegram-secretary-bot")
+# Restaurant data (`about` from init_db.py, `menus` from restaurant.menus.json)
+RESTAURANT_DB = os.getenv("RESTAURANT_DB", "restaurant")
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")
+)
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "30000"))
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_client() -> pymongo.MongoClient:
+    """Return the application-wide MongoClient, creating it on first use.
+
+    MongoClient is thread-safe and pools its own connections, so the API
+    routes, the bot, the analyzer and the fetch helpers all share this one.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = pymongo.MongoClient(
+                    MONGODB_URI,
+                    maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                    minPoolSize=MONGODB_MIN_POOL_SIZE,
+                    serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+                )
+                logging.info(
+                    f"MongoDB client created (pool size {MONGODB_MAX_POOL_SIZE})"
+                )
+    return _client
+
+
+def set_client(client) -> None:
+    """Use an existing client (e.g. mongomock in loadtest.py) instead of
+    connecting to MONGODB_URI."""
+    global _client
+    with _lock:
+        _client = client
+
+
+def get_db(db_name: str = MONGODB_DB):
+    return get_client()[db_name]
+
+
+def close_client() -> None:
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            logging.info("MongoDB client closed")
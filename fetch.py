@@ -1,62 +1,115 @@
-import pymongo
-from bson import ObjectId
-from datetime import datetime
-from typing import List, Dict, Any, Union
-import json
-
-class JSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, ObjectId):
-            return str(obj)
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        if hasattr(obj, '__dict__'):
-            return obj.__dict__
-        return super().default(obj)
-
-def fetch_formatted_data(collection_name: str = "data") -> List[Dict[str, Any]]:
-    client = pymongo.MongoClient("mongodb://localhost:27017/")
-    db = client["telegram-secretary-bot"]
-    collection = db[collection_name]
+from bson import ObjectId, json_util
+from typing import List, Dict, Any, Optional, Iterator
+import os
+import time
+import base64
+from database import get_db
+from serialization import to_jsonable
 
-    try:
-        # Fetch all data
-        all_data = list(collection.find())
-
-        # Format the data
-        formatted_data = []
-        for item in all_data:
-            formatted_item = {}
-            for key, value in item.items():
-                if isinstance(value, ObjectId):
-                    formatted_item[key] = str(value)
-                elif isinstance(value, datetime):
-                    formatted_item[key] = value.isoformat()
-                elif isinstance(value, (dict, list)):
-                    # Handle nested structures
-                    formatted_item[key] = json.loads(
-                        json.dumps(value, cls=JSONEncoder)
-                    )
-                else:
-                    formatted_item[key] = value
-            formatted_data.append(formatted_item)
-
-        return formatted_data
-    finally:
-        client.close()
+# Seconds the collection list is reused before asking MongoDB again
+COLLECTIONS_CACHE_TTL = float(os.getenv("COLLECTIONS_CACHE_TTL", "30"))
+_collections_cache = {"names": None, "expires": 0.0}
 
 def get_all_collections() -> List[str]:
-    client = pymongo.MongoClient("mongodb://localhost:27017/")
-    db = client["telegram-secretary-bot"]
+    now = time.monotonic()
+    if _collections_cache["names"] is None or now >= _collections_cache["expires"]:
+        _collections_cache["names"] = get_db().list_collection_names()
+        _collections_cache["expires"] = now + COLLECTIONS_CACHE_TTL
+    return _collections_cache["names"]
+
+def iter_collection_page(
+    collection_name: str, limit: int = 100, after: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """Yield up to `limit` JSON-safe documents in `_id` order, starting after
+    the `after` id, as they come off the cursor."""
+    query = {}
+    if after:
+        if not ObjectId.is_valid(after):
+            raise ValueError(f"Invalid cursor: {after}")
+        query = {"_id": {"$gt": ObjectId(after)}}
+    cursor = get_db()[collection_name].find(query).sort("_id", 1).limit(limit)
+    for doc in cursor:
+        yield to_jsonable(doc)
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Opaque page cursor holding a document's (time, _id) sort key."""
+    key = json_util.dumps([doc.get("time"), doc["_id"]])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
     try:
-        return db.list_collection_names()
-    finally:
-        client.close()
+        time_value, doc_id = json_util.loads(
+            base64.urlsafe_b64decode(cursor.encode()).decode()
+        )
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return time_value, doc_id
+
+def _keyset_filter(cursor: str, older: bool) -> Dict[str, Any]:
+    """Match documents strictly after (older) or before (newer) a cursor
+    in (time desc, _id desc) order. Missing times sort last."""
+    time_value, doc_id = decode_cursor(cursor)
+    op = "$lt" if older else "$gt"
+    same_time = {"time": time_value, "_id": {op: doc_id}}
+    if time_value is None:
+        if older:
+            return same_time
+        return {"$or": [{"time": {"$ne": None}}, same_time]}
+    clauses = [{"time": {op: time_value}}, same_time]
+    if older:
+        clauses.append({"time": None})
+    return {"$or": clauses}
+
+def fetch_data_page(
+    collection_name: str = "data",
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    doc_type: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    include_total: bool = False,
+) -> Dict[str, Any]:
+    """Fetch one page of documents, newest first, using keyset pagination.
+
+    `before` returns the page of older documents following a cursor, `after`
+    the page of newer ones preceding it. Only `limit + 1` documents are read
+    so cost does not depend on collection size.
+    """
+    if before and after:
+        raise ValueError("Use either 'before' or 'after', not both")
+
+    collection = get_db()[collection_name]
+    base_filter: Dict[str, Any] = {"type": doc_type} if doc_type else {}
+    query = dict(base_filter)
+    if before:
+        query = {"$and": [base_filter, _keyset_filter(before, older=True)]}
+    elif after:
+        query = {"$and": [base_filter, _keyset_filter(after, older=False)]}
+
+    projection = None
+    if fields:
+        # time and _id are always needed to build cursors
+        projection = {field: 1 for field in fields}
+        projection["time"] = 1
+
+    direction = 1 if after else -1
+    docs = list(
+        collection.find(query, projection)
+        .sort([("time", direction), ("_id", direction)])
+        .limit(limit + 1)
+    )
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if after:
+        docs.reverse()
 
+    page = {
+        "docs": docs,
+        "next_cursor": encode_cursor(docs[-1]) if docs and (has_more or after) else None,
+        "prev_cursor": encode_cursor(docs[0]) if docs and (before or (after and has_more)) else None,
+    }
+    if include_total:
+        page["total"] = collection.count_documents(base_filter)
+    return page
 
-if __name__ == "__main__":
-    data = fetch_formatted_data()
-    for item in data:
-        print(f"Description: {item.get('description')}")
-        print(f"Type: {item.get('type')}")
-        print("-" * 50)
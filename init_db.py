@@ -1,10 +1,9 @@
-import pymongo
 from datetime import datetime
+from database import RESTAURANT_DB, get_db
 
 def init_about_collection():
-    # Connect to MongoDB
-    client = pymongo.MongoClient("mongodb://localhost:27017/")
-    db = client["restaurant"]
+    # Shared client (MONGODB_URI)
+    db = get_db(RESTAURANT_DB)
     about_collection = db["about"]
 
     # Clear existing data
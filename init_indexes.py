@@ -0,0 +1,88 @@
+import argparse
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from database import RESTAURANT_DB, get_db, close_client
+from schema import local_time, parse_time
+
+# Indexes for the `data` collection
+DATA_INDEXES = [
+    ([("chat_id", ASCENDING), ("type", ASCENDING), ("time", DESCENDING)], "chat_type_time"),
+    ([("type", ASCENDING), ("time", DESCENDING), ("_id", DESCENDING)], "type_time_id"),
+    ([("time", DESCENDING), ("_id", DESCENDING)], "time_id"),
+]
+
+# Menu lookups by price from the intent router (`menus` in RESTAURANT_DB)
+MENU_INDEXES = [
+    ([("price", ASCENDING)], "price"),
+]
+
+
+def ensure_indexes(db=None, menu_db=None):
+    """Create the `data` and `menus` indexes (no-op if they already exist)."""
+    db = db if db is not None else get_db()
+    menu_db = menu_db if menu_db is not None else get_db(RESTAURANT_DB)
+    for collection, indexes in ((db["data"], DATA_INDEXES), (menu_db["menus"], MENU_INDEXES)):
+        for keys, name in indexes:
+            collection.create_index(keys, name=name)
+        print(f"Indexes ensured on '{collection.full_name}': {[name for _, name in indexes]}")
+
+
+def migrate_documents(db=None, batch_size: int = 1000) -> int:
+    """One-shot migration of old documents to the normalized schema.
+
+    String times become datetimes, notes without a time get their creation
+    time (local, like task times), and `created_at` (UTC, from the ObjectId)
+    and `chat_id` are filled in (the chat of old documents is unknown and
+    left as null).
+    """
+    db = db if db is not None else get_db()
+    collection = db["data"]
+    query = {
+        "$or": [
+            {"time": {"$not": {"$type": "date"}}},
+            {"created_at": {"$exists": False}},
+            {"chat_id": {"$exists": False}},
+        ]
+    }
+
+    updates = []
+    migrated = 0
+    for doc in collection.find(query):
+        created_at = doc.get("created_at")
+        if not isinstance(created_at, datetime):
+            created_at = doc["_id"].generation_time.replace(tzinfo=None)
+
+        changes = {"created_at": created_at, "chat_id": doc.get("chat_id")}
+        time_value = parse_time(doc.get("time"))
+        if time_value is None:
+            if doc.get("time") is not None:
+                print(f"Unparseable time {doc['time']!r} on {doc['_id']}, using created_at")
+            time_value = local_time(created_at)
+        changes["time"] = time_value
+
+        updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": changes}))
+        if len(updates) >= batch_size:
+            migrated += collection.bulk_write(updates, ordered=False).modified_count
+            updates = []
+
+    if updates:
+        migrated += collection.bulk_write(updates, ordered=False).modified_count
+    print(f"Migrated {migrated} documents in 'data'")
+    return migrated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create indexes for the data collection")
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="also normalize existing documents to the current schema",
+    )
+    args = parser.parse_args()
+
+    try:
+        if args.migrate:
+            migrate_documents()
+        ensure_indexes()
+    finally:
+        close_client()
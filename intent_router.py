@@ -0,0 +1,381 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from database import RESTAURANT_DB, get_db
+from metrics import metrics
+from snapshots import detect_language
+from time_parser import find_date
+
+# Router settings (overridable from .env)
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+INTENT_ROUTER_MAX_ITEMS = int(os.getenv("INTENT_ROUTER_MAX_ITEMS", "20"))
+
+_THAI_DIGITS = str.maketrans("๐๑๒๓๔๕๖๗๘๙", "0123456789")
+_L = r"(?<![a-z0-9])"
+_R = r"(?![a-z0-9])"
+
+
+def _words(*words: str) -> "re.Pattern":
+    """Any of `words`, longest first; English ones only as whole words."""
+    parts = [
+        re.escape(w) if re.match(r"[฀-๿]", w) else _L + re.escape(w) + _R
+        for w in sorted(words, key=len, reverse=True)
+    ]
+    return re.compile("|".join(parts))
+
+
+_TASK_WORDS = _words(
+    "task", "tasks", "todo", "todos", "to-do", "to do", "meeting", "meetings",
+    "appointment", "appointments", "schedule", "agenda", "plans", "events",
+    "งาน", "นัด", "นัดหมาย", "ประชุม", "ตารางงาน", "ตาราง", "ภารกิจ", "สิ่งที่ต้องทำ",
+)
+_NOTE_WORDS = _words("note", "notes", "memo", "memos", "โน้ต", "โน๊ต", "บันทึก")
+_MENU_WORDS = _words(
+    "menu", "menus", "dish", "dishes", "food", "foods", "drinks", "items",
+    "เมนู", "อาหาร", "เครื่องดื่ม", "รายการอาหาร",
+)
+_ABOUT_WORDS = _words(
+    "restaurant", "opening hours", "open hours", "founder", "founded", "history",
+    "address", "location", "award", "awards",
+    "ร้าน", "ร้านอาหาร", "เปิดกี่โมง", "เวลาเปิด", "ที่อยู่", "ผู้ก่อตั้ง", "ก่อตั้ง", "ประวัติ", "รางวัล",
+)
+# Words that carry no information once the intent is known
+_FILLER = _words(
+    "what", "whats", "what's", "which", "do", "does", "did", "i", "have", "got",
+    "my", "me", "are", "is", "there", "any", "the", "a", "an", "all", "list",
+    "show", "tell", "please", "give", "get", "for", "on", "in", "of", "at", "with",
+    "upcoming", "next", "due", "scheduled", "pending", "latest", "recent", "can",
+    "you", "item", "cost", "costs", "that", "price", "priced", "baht", "thb",
+    "มี", "อะไร", "บ้าง", "ไหม", "มั้ย", "ของ", "ฉัน", "ผม", "เรา", "หนู", "ครับ",
+    "ค่ะ", "คะ", "นะ", "หน่อย", "ขอ", "ดู", "แสดง", "รายการ", "ทั้งหมด", "ที่", "ต้อง",
+    "ทำ", "ช่วย", "บอก", "ราคา", "บาท", "ล่าสุด", "จ้า", "จ๊ะ", "วัน", "ใน", "เลย",
+)
+_PUNCTUATION = re.compile(r"[?!.,:;\"'()\-฿]")
+_RESIDUE = re.compile(r"[a-z0-9฀-๿]")
+
+_PRICE = re.compile(
+    r"(under|below|less than|cheaper than|at most|up to|no more than|ไม่เกิน|ต่ำกว่า|น้อยกว่า|ถูกกว่า"
+    r"|over|above|more than|at least|มากกว่า|เกิน|แพงกว่า)\s*(\d+)"
+)
+_PRICE_OPERATORS = {
+    "under": "$lt", "below": "$lt", "less than": "$lt", "cheaper than": "$lt",
+    "ต่ำกว่า": "$lt", "น้อยกว่า": "$lt", "ถูกกว่า": "$lt",
+    "at most": "$lte", "up to": "$lte", "no more than": "$lte", "ไม่เกิน": "$lte",
+    "over": "$gt", "above": "$gt", "more than": "$gt", "มากกว่า": "$gt", "เกิน": "$gt",
+    "แพงกว่า": "$gt", "at least": "$gte",
+}
+
+# "this week" / "next week"; checked before single days so that
+# "อาทิตย์นี้" (this week) isn't read as Sunday, unlike "วันอาทิตย์นี้"
+_WEEK = re.compile(
+    _L + r"(this|next) week" + _R + r"|(?:สัปดาห์|(?<!วัน)อาทิตย์)(นี้|หน้า)"
+)
+
+TEMPLATES = {
+    "tasks_on": {
+        "en": ("📅 Tasks{label}:", "No tasks{label}."),
+        "th": ("📅 งาน{label}:", "ไม่มีงาน{label}"),
+    },
+    "upcoming_tasks": {
+        "en": ("📅 Upcoming tasks:", "You have no upcoming tasks."),
+        "th": ("📅 งานที่กำลังจะถึง:", "ไม่มีงานที่กำลังจะถึง"),
+    },
+    "notes": {
+        "en": ("📝 Your notes{label}:", "No notes found{label}."),
+        "th": ("📝 โน้ตของคุณ{label}:", "ไม่พบโน้ต{label}"),
+    },
+    "menu": {
+        "en": ("🍽️ Menu items{label}:", "No menu items{label}."),
+        "th": ("🍽️ เมนู{label}:", "ไม่มีเมนู{label}"),
+    },
+}
+_MORE = {"en": "…and more, ask me for details.", "th": "…และยังมีอีก ถามเพิ่มได้เลย"}
+
+
+@dataclass
+class Intent:
+    name: str
+    language: str
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    label: str = ""
+    price: Optional[Tuple[str, int]] = None
+
+
+@dataclass
+class RoutedAnswer:
+    intent: str
+    reply: str
+    count: int
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def _date_label(day: datetime, today: datetime, language: str) -> str:
+    offset = (day - today).days
+    if language == "th":
+        names = {0: "วันนี้", 1: "พรุ่งนี้", 2: "มะรืนนี้"}
+        return names.get(offset, f"วันที่ {day.strftime('%d/%m/%Y')}")
+    names = {0: "today", 1: "tomorrow"}
+    return names.get(offset, f"on {day.strftime('%a %d %b')}")
+
+
+def parse_intent(text: str, now: Optional[datetime] = None) -> Optional[Intent]:
+    """Recognize a structured lookup, or None for open-ended questions.
+
+    A message only counts as structured if nothing is left once its
+    keywords, date/price expression and filler words are removed, so
+    "summarize my notes" or "what did I note about groceries?" still go
+    to the LLM.
+    """
+    now = now or datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    language = detect_language(text)
+    normalized = text.lower().translate(_THAI_DIGITS)
+    rest = normalized
+
+    start = end = None
+    label = ""
+    week = _WEEK.search(rest)
+    if week:
+        this_week = week.group(1) == "this" or week.group(2) == "นี้"
+        monday = today - timedelta(days=today.weekday())
+        start = today if this_week else monday + timedelta(days=7)
+        end = monday + timedelta(days=7 if this_week else 14)
+        if language == "th":
+            label = "สัปดาห์นี้" if this_week else "สัปดาห์หน้า"
+        else:
+            label = "this week" if this_week else "next week"
+        rest = rest[: week.start()] + " " + rest[week.end() :]
+    else:
+        found = find_date(rest, now)
+        if found:
+            (start, span) = found
+            end = start + timedelta(days=1)
+            label = _date_label(start, today, language)
+            rest = rest[: span[0]] + " " + rest[span[1] :]
+
+    price = None
+    price_match = _PRICE.search(rest)
+    if price_match:
+        price = (_PRICE_OPERATORS[price_match.group(1)], int(price_match.group(2)))
+        rest = rest[: price_match.start()] + " " + rest[price_match.end() :]
+
+    kinds = set()
+    for kind, pattern in (("task", _TASK_WORDS), ("note", _NOTE_WORDS), ("menu", _MENU_WORDS)):
+        rest, count = pattern.subn(" ", rest)
+        if count:
+            kinds.add(kind)
+    rest = _PUNCTUATION.sub(" ", _FILLER.sub(" ", rest))
+    if _RESIDUE.search(rest):
+        return None
+
+    if kinds == {"menu"} or (price and not kinds):
+        return Intent("menu", language, price=price)
+    if price:
+        return None
+    if kinds == {"note"}:
+        return Intent("notes", language, start, end, label)
+    if kinds <= {"task"} and (kinds or start):
+        if start is None:
+            return Intent("upcoming_tasks", language)
+        return Intent("tasks_on", language, start, end, label)
+    return None
+
+
+def collection_for(text: str) -> str:
+    """Collection an open-ended question is about: the restaurant's `menus`
+    or `about` (in RESTAURANT_DB), else the user's own `data`."""
+    normalized = text.lower()
+    if _TASK_WORDS.search(normalized) or _NOTE_WORDS.search(normalized):
+        return "data"
+    if _MENU_WORDS.search(normalized):
+        return "menus"
+    if _ABOUT_WORDS.search(normalized):
+        return "about"
+    return "data"
+
+
+def _price_label(price: Optional[Tuple[str, int]], language: str) -> str:
+    if price is None:
+        return ""
+    operator, amount = price
+    if language == "th":
+        words = {"$lt": "ต่ำกว่า", "$lte": "ไม่เกิน", "$gt": "มากกว่า", "$gte": "ตั้งแต่"}
+        return f"ราคา{words[operator]} {amount} บาท"
+    words = {"$lt": "under", "$lte": "up to", "$gt": "over", "$gte": "from"}
+    return f" {words[operator]} {amount} baht"
+
+
+class IntentRouter:
+    """Answers structured lookups (tasks by day, upcoming tasks, notes, menu
+    items by price) with an indexed MongoDB query and a reply template,
+    so only open-ended questions reach Gemini.
+    """
+
+    def __init__(
+        self,
+        get_database: Callable[[], Any] = get_db,
+        max_items: int = INTENT_ROUTER_MAX_ITEMS,
+        enabled: bool = INTENT_ROUTER_ENABLED,
+        get_menu_database: Callable[[], Any] = lambda: get_db(RESTAURANT_DB),
+    ):
+        self.get_database = get_database
+        self.get_menu_database = get_menu_database
+        self.max_items = max_items
+        self.enabled = enabled
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.total_ms: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def _chat_filter(self, chat_id: Optional[int]) -> Dict:
+        # The chat's own entries plus those added without a chat (API)
+        return {} if chat_id is None else {"chat_id": {"$in": [chat_id, None]}}
+
+    def _query(self, intent: Intent, chat_id: Optional[int], now: datetime) -> List[Dict]:
+        # One extra document tells whether there are more than max_items
+        limit = self.max_items + 1
+        if intent.name == "menu":
+            query = {"price": {intent.price[0]: intent.price[1]}} if intent.price else {}
+            menus = self.get_menu_database()["menus"]
+            return list(menus.find(query).sort("price", 1).limit(limit))
+
+        db = self.get_database()
+        query = self._chat_filter(chat_id)
+        if intent.name == "notes":
+            query["type"] = "note"
+            if intent.start is not None:
+                query["time"] = {"$gte": intent.start, "$lt": intent.end}
+            return list(db["data"].find(query).sort("time", -1).limit(limit))
+
+        query["type"] = "task"
+        if intent.name == "tasks_on":
+            query["time"] = {"$gte": intent.start, "$lt": intent.end}
+        else:
+            query["time"] = {"$gte": now}
+        return list(db["data"].find(query).sort("time", 1).limit(limit))
+
+    def _format(self, intent: Intent, docs: List[Dict]) -> str:
+        language = intent.language
+        header, empty = TEMPLATES[intent.name][language]
+        if intent.name == "menu":
+            label = _price_label(intent.price, language)
+        elif intent.label and intent.name == "notes":
+            label = f" ({intent.label})"
+        elif intent.label:
+            label = intent.label if language == "th" else f" {intent.label}"
+        else:
+            label = ""
+        if not docs:
+            return empty.format(label=label)
+
+        # Times of day are enough for a single day's tasks
+        single_day = intent.name == "tasks_on" and intent.end - intent.start <= timedelta(days=1)
+        layout = "%H:%M" if single_day else "%Y-%m-%d %H:%M"
+        lines = [header.format(label=label)]
+        for doc in docs[: self.max_items]:
+            if intent.name == "menu":
+                name = doc.get("nameE") if language == "en" and doc.get("nameE") else doc.get("name")
+                unit = "บาท" if language == "th" else "baht"
+                lines.append(f"• {name} - {doc.get('price')} {unit}")
+                continue
+            when = doc.get("time")
+            when = when.strftime(layout) if isinstance(when, datetime) else when
+            prefix = f"{when} - " if when else ""
+            lines.append(f"• {prefix}{doc.get('description', '')}")
+        if len(docs) > self.max_items:
+            lines.append(_MORE[language])
+        return "\n".join(lines)
+
+    def route(
+        self, text: str, chat_id: Optional[int] = None, now: Optional[datetime] = None
+    ) -> Optional[RoutedAnswer]:
+        """Answer `text` without the LLM if it is a structured lookup."""
+        if not self.enabled:
+            return None
+        now = now or datetime.now()
+        started = time.perf_counter()
+        intent = parse_intent(text, now)
+        matched = time.perf_counter()
+        metrics.observe_stage("route_match", matched - started)
+        if intent is None:
+            logging.info(f"Router: open-ended, sending to LLM (match {(matched - started) * 1000:.2f} ms)")
+            self._record("llm", matched - started)
+            return None
+
+        docs = self._query(intent, chat_id, now)
+        queried = time.perf_counter()
+        reply = self._format(intent, docs)
+        formatted = time.perf_counter()
+        metrics.observe_stage("route_query", queried - matched)
+        metrics.observe_stage("route_format", formatted - queried)
+
+        timings = {
+            "match_ms": (matched - started) * 1000,
+            "query_ms": (queried - matched) * 1000,
+            "format_ms": (formatted - queried) * 1000,
+        }
+        self._record(intent.name, formatted - started)
+        logging.info(
+            f"Router: {intent.name} for chat {chat_id}, {min(len(docs), self.max_items)} results "
+            f"(match {timings['match_ms']:.2f} ms, query {timings['query_ms']:.2f} ms, "
+            f"format {timings['format_ms']:.2f} ms)"
+        )
+        return RoutedAnswer(intent.name, reply, min(len(docs), self.max_items), timings)
+
+    def _record(self, route: str, seconds: float) -> None:
+        with self._lock:
+            self.counts[route] += 1
+            self.total_ms[route] += seconds * 1000
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                "enabled": self.enabled,
+                "messages": total,
+                "routed_share": (total - self.counts.get("llm", 0)) / total if total else 0.0,
+                "routes": {
+                    route: {"count": count, "avg_ms": self.total_ms[route] / count}
+                    for route, count in self.counts.items()
+                },
+            }
+
+
+intent_router = IntentRouter()
+
+
+# Which sample questions are routed, and the routing cost per message:
+# python intent_router.py
+if __name__ == "__main__":
+    samples = [
+        "what tasks do I have today?",
+        "do I have a meeting tomorrow?",
+        "งานวันนี้มีอะไรบ้าง",
+        "มีนัดอะไรพรุ่งนี้",
+        "งานสัปดาห์นี้",
+        "what are my tasks?",
+        "list my notes",
+        "โน้ตทั้งหมดของฉัน",
+        "menu items under 80 baht",
+        "เมนูราคาไม่เกิน 60 บาท",
+        "summarize my notes",
+        "what did I note about groceries?",
+        "what should I cook tonight?",
+        "which meeting is the most important this week?",
+    ]
+    now = datetime(2025, 1, 6, 9, 0)
+    for sample in samples:
+        intent = parse_intent(sample, now)
+        print(f"{sample:50s} -> {intent.name if intent else 'LLM'}")
+
+    runs = 2000
+    start = time.perf_counter()
+    for i in range(runs):
+        parse_intent(samples[i % len(samples)], now)
+    print(f"parse_intent: {(time.perf_counter() - start) / runs * 1e6:.1f} µs per message")
@@ -1,12 +1,19 @@
 import pymongo
-from bson import ObjectId
-import google.generativeai as genai
-import pandas as pd
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 import os
+import time
 from dotenv import load_dotenv
-import json
 import logging
+from answer_cache import answer_cache
+from response_cache import response_cache
+from metadata import CollectionMetadata
+from schema import BOOKKEEPING_FIELDS
+from metrics import metrics
+from database import RESTAURANT_DB
+from llm_backend import GEMINI_MODEL, LLMBackend, create_backend, supports_context_caching
+from snapshots import ContextSnapshots, GeminiContextCache, detect_language
+from serialization import dumps
+from retrieval import DocumentRetriever, RETRIEVAL_TOP_K, RETRIEVAL_TOKEN_BUDGET
 
 # Configure logging
 logging.basicConfig(
@@ -16,19 +23,92 @@ logging.basicConfig(
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Collections read from RESTAURANT_DB instead of the analyzer's database
+RESTAURANT_COLLECTIONS = ("about", "menus")
+
+# Generation settings for chat answers
+GENERATION_KWARGS = {
+    "generation_config": {"temperature": 0.2, "max_output_tokens": 150},
+    "safety_settings": [
+        {
+            "category": "HARM_CATEGORY_HARASSMENT",
+            "threshold": "BLOCK_MEDIUM_AND_ABOVE",
+        },
+        {
+            "category": "HARM_CATEGORY_HATE_SPEECH",
+            "threshold": "BLOCK_MEDIUM_AND_ABOVE",
+        },
+        {
+            "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+            "threshold": "BLOCK_MEDIUM_AND_ABOVE",
+        },
+        {
+            "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+            "threshold": "BLOCK_MEDIUM_AND_ABOVE",
+        },
+    ],
+}
 
 
 class MongoDBLLMAnalyzer:
-    def __init__(self, connection_string: str, db_name: str):
+    def __init__(
+        self,
+        connection_string: str,
+        db_name: str,
+        top_k: int = RETRIEVAL_TOP_K,
+        token_budget: int = RETRIEVAL_TOKEN_BUDGET,
+        client: Optional[pymongo.MongoClient] = None,
+        model: Optional[LLMBackend] = None,
+        retriever: Optional[DocumentRetriever] = None,
+        restaurant_db_name: str = RESTAURANT_DB,
+        metadata: Optional[CollectionMetadata] = None,
+    ):
         try:
-            self.client = pymongo.MongoClient(connection_string)
+            # A shared client (see database.py) is owned by the app, not by us
+            self.owns_client = client is None
+            self.client = client or pymongo.MongoClient(connection_string)
             self.client.admin.command("ping")
             logging.info(f"Connected to MongoDB successfully")
 
             self.db = self.client[db_name]
-            self.model = genai.GenerativeModel("gemini-2.0-flash")
+            # Gemini by default; LLM_BACKEND=fake or `model=` for offline runs
+            self.model = model or create_backend()
+            # Pass the app's shared retriever (search.note_search) to index once
+            self.retriever = retriever or DocumentRetriever(
+                self.db, top_k=top_k, token_budget=token_budget
+            )
+            # Pass the app's shared metadata (metadata.collection_metadata) to
+            # watch the database once. Reminder claims don't change a task's
+            # content: keep caches and the index
+            self.owns_metadata = metadata is None
+            self.metadata = metadata or CollectionMetadata(
+                self.db, ignored_fields=BOOKKEEPING_FIELDS
+            )
+            self.metadata.add_listener(self._on_collection_change)
+            self.metadata.start()
+            # The restaurant's about/menus collections live in their own database
+            if restaurant_db_name == db_name:
+                self.restaurant_db = self.db
+                self.restaurant_metadata = self.metadata
+                self.restaurant_retriever = self.retriever
+            else:
+                self.restaurant_db = self.client[restaurant_db_name]
+                self.restaurant_metadata = CollectionMetadata(self.restaurant_db)
+                self.restaurant_metadata.add_listener(self._on_collection_change)
+                self.restaurant_metadata.start()
+                self.restaurant_retriever = DocumentRetriever(
+                    self.restaurant_db, top_k=top_k, token_budget=token_budget
+                )
+            # Minified per-language context for those nearly static collections
+            self.snapshots = ContextSnapshots(
+                self.restaurant_db,
+                self.restaurant_metadata,
+                context_cache=(
+                    GeminiContextCache(getattr(self.model, "model_name", GEMINI_MODEL))
+                    if supports_context_caching(self.model)
+                    else None
+                ),
+            )
 
             collections = self.db.list_collection_names()
             logging.info(f"Available collections: {collections}")
@@ -36,19 +116,29 @@ class MongoDBLLMAnalyzer:
             logging.error(f"Failed to initialize MongoDB connection: {str(e)}")
             raise
 
-    def get_collection_info(self, collection_name: str) -> dict:
-        try:
-            collection = self.db[collection_name]
-            doc_count = collection.count_documents({})
+    def _on_collection_change(self, collection_name: str, operation: str) -> None:
+        # Also catches writes made outside the app (shell, other services)
+        answer_cache.invalidate(collection_name)
+        response_cache.invalidate(collection_name)
+        if operation != "insert":
+            # The retriever only picks up new _ids incrementally
+            self._source(collection_name)[1].invalidate(collection_name)
 
-            sample = None
-            if doc_count > 0:
-                sample = collection.find_one()
+    def _source(self, collection_name: str) -> Tuple[CollectionMetadata, DocumentRetriever]:
+        """Metadata and retriever for the database holding `collection_name`."""
+        if collection_name in RESTAURANT_COLLECTIONS:
+            return self.restaurant_metadata, self.restaurant_retriever
+        return self.metadata, self.retriever
 
+    def get_collection_info(self, collection_name: str) -> dict:
+        try:
+            # Served from the metadata cache, no MongoDB round-trip
+            info = self._source(collection_name)[0].get(collection_name)
             return {
-                "exists": True,
-                "document_count": doc_count,
-                "sample_keys": list(sample.keys()) if sample else None,
+                "exists": info["exists"],
+                "document_count": info["document_count"],
+                "sample_keys": info["sample_keys"],
+                "version": info["version"],
             }
         except Exception as e:
             logging.error(
@@ -56,123 +146,126 @@ class MongoDBLLMAnalyzer:
             )
             return {"exists": False, "error": str(e)}
 
-    def _convert_dates_to_str(self, doc: Dict) -> Dict:
-        """Helper method to convert dates to strings"""
-        converted = {}
-        for key, value in doc.items():
-            if isinstance(value, dict):
-                converted[key] = self._convert_dates_to_str(value)
-            elif isinstance(value, (list, tuple)):
-                converted[key] = [
-                    self._convert_dates_to_str(item) if isinstance(item, dict) else item
-                    for item in value
-                ]
+    def build_prompt(
+        self, collection_name: str, question: str, context: str = ""
+    ) -> Tuple[Optional[str], Optional[str], LLMBackend]:
+        """Build the Gemini prompt for a question.
+
+        Returns (prompt, None, model), or (None, reply, model) when the
+        question can be answered without the model (missing or empty
+        collection). `model` is a context-cached model when the collection's
+        snapshot is cached by Gemini, else self.model.
+        """
+        collection_info = self.get_collection_info(collection_name)
+        if not collection_info["exists"]:
+            return None, f"Collection '{collection_name}' does not exist.", self.model
+
+        logging.info(
+            f"Analyzing collection '{collection_name}' with {collection_info['document_count']} documents"
+        )
+        logging.info(f"User question: {question}")
+
+        model = self.model
+        language = detect_language(question)
+        with metrics.timer("snapshot"):
+            snapshot = self.snapshots.get(collection_name, language)
+
+        if snapshot is not None:
+            # Pre-rendered once per collection version
+            if collection_info["document_count"] == 0:
+                return None, f"The collection '{collection_name}' is empty.", model
+            cached_model = self.snapshots.model_for(collection_name, language, snapshot)
+            if cached_model is not None:
+                model = cached_model
+                json_data = "(provided in the cached context)"
             else:
-                converted[key] = str(value) if hasattr(value, "strftime") else value
-        return converted
+                json_data = snapshot.text
+        else:
+            # Only send the documents relevant to the question
+            retriever = self._source(collection_name)[1]
+            with metrics.timer("mongo_fetch"):
+                retriever.refresh(collection_name)
+            with metrics.timer("retrieve"):
+                relevant_docs = retriever.retrieve(
+                    collection_name, question, refresh=False
+                )
+
+            if not relevant_docs:
+                return None, f"The collection '{collection_name}' is empty.", model
+
+            # Single pass from BSON to JSON text
+            with metrics.timer("serialize"):
+                json_data = dumps(relevant_docs, indent=True)
+
+        if collection_name == "about":
+            prompt_template = """
+            You are a restaurant chat assistant. Answer questions about the restaurant information concisely.
+            
+            The restaurant information is stored in the "about" collection:
+            {json_data}
+            
+            Previous conversation context:
+            {context}
+            
+            Question about the restaurant: {question}
+            
+            Important instructions:
+            1. Answer directly and concisely in less than 50 words
+            2. If the question is in Thai, answer in Thai. If the question is in English, answer in English
+            3. Only mention relevant information that directly answers the question
+            4. Consider the conversation context when appropriate
+            5. You MUST respond in English for English questions
+            """
+        else:
+            prompt_template = """
+            You are a restaurant chat assistant. Answer questions about the menu items concisely.
+            
+            The menu information is stored in the "{collection_name}" collection:
+            {json_data}
+            
+            Previous conversation context:
+            {context}
+            
+            Question about the menu: {question}
+            
+            Important instructions:
+            1. Answer directly and concisely in less than 50 words
+            2. If the question is in Thai, answer in Thai. If the question is in English, answer in English
+            3. Only mention menu items that directly answer the question
+            4. Consider the conversation context when appropriate
+            5. You MUST respond in English for English questions
+            """
+
+        prompt = prompt_template.format(
+            json_data=json_data,
+            question=question,
+            collection_name=collection_name,
+            context=context,
+        )
+
+        return prompt, None, model
 
     def analyze_collection_with_llm(
-        self, collection_name: str, question: str, context: str = ""
+        self, collection_name: str, question: str, context: str = "", check_cache: bool = True
     ) -> str:
+        """Answer a question about a collection. Pass `check_cache=False` if
+        the caller already looked the question up in the answer cache."""
         try:
-            collection_info = self.get_collection_info(collection_name)
-            if not collection_info["exists"]:
-                return f"Collection '{collection_name}' does not exist."
+            version = answer_cache.version(collection_name)
+            cached = answer_cache.get(collection_name, question, context) if check_cache else None
+            if cached is not None:
+                logging.info(f"Answer cache hit for question: {question}")
+                return cached
 
-            logging.info(
-                f"Analyzing collection '{collection_name}' with {collection_info['document_count']} documents"
-            )
-            logging.info(f"User question: {question}")
-
-            collection = self.db[collection_name]
-            all_docs = list(collection.find())
-
-            if not all_docs:
-                return f"The collection '{collection_name}' is empty."
-
-            simplified_docs = []
-            for doc in all_docs:
-                if "_id" in doc and isinstance(doc["_id"], ObjectId):
-                    doc["_id"] = str(doc["_id"])
-                doc_copy = self._convert_dates_to_str(doc)
-                simplified_docs.append(doc_copy)
-
-            json_data = json.dumps(simplified_docs, ensure_ascii=False, indent=2)
-
-            # Detect if question is in English (you can add more sophisticated language detection if needed)
-            is_english = not any(
-                "\u0E00" <= c <= "\u0E7F" for c in question
-            )  # Simple Thai character range check
-
-            if collection_name == "about":
-                prompt_template = """
-                You are a restaurant chat assistant. Answer questions about the restaurant information concisely.
-                
-                The restaurant information is stored in the "about" collection:
-                {json_data}
-                
-                Previous conversation context:
-                {context}
-                
-                Question about the restaurant: {question}
-                
-                Important instructions:
-                1. Answer directly and concisely in less than 50 words
-                2. If the question is in Thai, answer in Thai. If the question is in English, answer in English
-                3. Only mention relevant information that directly answers the question
-                4. Consider the conversation context when appropriate
-                5. You MUST respond in English for English questions
-                """
-            else:
-                prompt_template = """
-                You are a restaurant chat assistant. Answer questions about the menu items concisely.
-                
-                The menu information is stored in the "{collection_name}" collection:
-                {json_data}
-                
-                Previous conversation context:
-                {context}
-                
-                Question about the menu: {question}
-                
-                Important instructions:
-                1. Answer directly and concisely in less than 50 words
-                2. If the question is in Thai, answer in Thai. If the question is in English, answer in English
-                3. Only mention menu items that directly answer the question
-                4. Consider the conversation context when appropriate
-                5. You MUST respond in English for English questions
-                """
-
-            prompt = prompt_template.format(
-                json_data=json_data,
-                question=question,
-                collection_name=collection_name,
-                context=context,
-            )
+            prompt, reply, model = self.build_prompt(collection_name, question, context)
+            if prompt is None:
+                return reply
 
-            response = self.model.generate_content(
-                prompt,
-                generation_config={"temperature": 0.2, "max_output_tokens": 150},
-                safety_settings=[
-                    {
-                        "category": "HARM_CATEGORY_HARASSMENT",
-                        "threshold": "BLOCK_MEDIUM_AND_ABOVE",
-                    },
-                    {
-                        "category": "HARM_CATEGORY_HATE_SPEECH",
-                        "threshold": "BLOCK_MEDIUM_AND_ABOVE",
-                    },
-                    {
-                        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        "threshold": "BLOCK_MEDIUM_AND_ABOVE",
-                    },
-                    {
-                        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                        "threshold": "BLOCK_MEDIUM_AND_ABOVE",
-                    },
-                ],
-            )
+            with metrics.timer("model_call"):
+                response = model.generate_content(prompt, **GENERATION_KWARGS)
+            metrics.record_call("answer", prompt, response.text, response)
 
+            answer_cache.put(collection_name, question, response.text, version, context)
             return response.text
 
         except Exception as e:
@@ -180,16 +273,66 @@ class MongoDBLLMAnalyzer:
             logging.error(error_msg)
             return error_msg
 
+    def stream_collection_with_llm(
+        self, collection_name: str, question: str, context: str = "", check_cache: bool = True
+    ) -> Iterator[str]:
+        """Like analyze_collection_with_llm, but yields text chunks as Gemini
+        generates them."""
+        version = answer_cache.version(collection_name)
+        cached = answer_cache.get(collection_name, question, context) if check_cache else None
+        if cached is not None:
+            logging.info(f"Answer cache hit for question: {question}")
+            yield cached
+            return
+
+        prompt, reply, model = self.build_prompt(collection_name, question, context)
+        if prompt is None:
+            yield reply
+            return
+
+        answer = ""
+        chunk = None
+        start = time.perf_counter()
+        for chunk in model.generate_content(
+            prompt, stream=True, **GENERATION_KWARGS
+        ):
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunk without text parts (e.g. only safety/finish metadata)
+                continue
+            if text:
+                if not answer:
+                    metrics.observe_stage("model_first_token", time.perf_counter() - start)
+                answer += text
+                yield text
+        metrics.observe_stage("model_call", time.perf_counter() - start)
+        # Usage metadata arrives with the last chunk
+        metrics.record_call("answer", prompt, answer, chunk)
+
+        if answer:
+            answer_cache.put(collection_name, question, answer, version, context)
+        else:
+            logging.warning(f"Empty streamed answer (blocked?) for question: {question}")
+
     def close_connection(self):
-        self.client.close()
-        logging.info("MongoDB connection closed")
+        self.metadata.remove_listener(self._on_collection_change)
+        if self.owns_metadata:
+            self.metadata.stop()
+        if self.restaurant_metadata is not self.metadata:
+            self.restaurant_metadata.stop()
+        if self.owns_client:
+            self.client.close()
+            logging.info("MongoDB connection closed")
 
 
 # Example usage
 if __name__ == "__main__":
+    from database import MONGODB_URI
+
     # Initialize analyzer
     analyzer = MongoDBLLMAnalyzer(
-        connection_string="mongodb://localhost:27017/", db_name="restaurant"
+        connection_string=MONGODB_URI, db_name=RESTAURANT_DB
     )
 
     # Analyze collection
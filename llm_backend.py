@@ -0,0 +1,152 @@
+import os
+import time
+import json
+import random
+import re
+import threading
+from datetime import datetime
+from typing import Any, Callable, Iterator, List, Optional, Protocol, Union
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Backend settings (overridable from .env)
+# "gemini" or "fake"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+FAKE_LLM_FIRST_TOKEN_DELAY = float(os.getenv("FAKE_LLM_FIRST_TOKEN_DELAY", "0.5"))
+FAKE_LLM_CHUNK_DELAY = float(os.getenv("FAKE_LLM_CHUNK_DELAY", "0.05"))
+FAKE_LLM_JITTER = float(os.getenv("FAKE_LLM_JITTER", "0"))
+
+
+class LLMBackend(Protocol):
+    """What MongoDBLLMAnalyzer.model must provide: the subset of
+    genai.GenerativeModel used by the analyzer and the bot.
+
+    Without `stream` the result has `.text` (and optionally
+    `.usage_metadata`); with `stream=True` it is an iterable of such chunks.
+    """
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs) -> Any:
+        ...
+
+
+class FakeUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeStreamChunk:
+    def __init__(self, text: str, usage_metadata: Optional[FakeUsage] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+_TASK_RE = re.compile(r'Parse this Thai task with time: "(.*)"')
+_TODAY_RE = re.compile(r"Today's date is: (\d{4}-\d{2}-\d{2})")
+
+
+def canned_reply(prompt: str, default: str) -> str:
+    """Deterministic reply for a prompt: valid JSON for the /task parser
+    prompt, `default` for everything else."""
+    task = _TASK_RE.search(prompt)
+    if task:
+        today = _TODAY_RE.search(prompt)
+        day = today.group(1) if today else datetime.now().strftime("%Y-%m-%d")
+        return json.dumps(
+            {
+                "description": task.group(1),
+                "time": f"{day} 09:00",
+                "has_explicit_date": False,
+            },
+            ensure_ascii=False,
+        )
+    return default
+
+
+class FakeModel:
+    """Stand-in for genai.GenerativeModel for tests, benchmarks and load
+    tests without the Gemini API.
+
+    Replies are deterministic (see `canned_reply`) and streamed word by word.
+    Latency is `first_token_delay` plus `chunk_delay` per extra word, each
+    scaled by up to +/- `jitter` from a seeded RNG, so runs are repeatable.
+    """
+
+    def __init__(
+        self,
+        reply: str = "This is a streamed answer from the fake model.",
+        first_token_delay: float = FAKE_LLM_FIRST_TOKEN_DELAY,
+        chunk_delay: float = FAKE_LLM_CHUNK_DELAY,
+        jitter: float = FAKE_LLM_JITTER,
+        seed: int = 0,
+        responder: Optional[Callable[[str, str], str]] = canned_reply,
+    ):
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.jitter = jitter
+        self.responder = responder
+        self.prompts: List[str] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _delay(self, seconds: float) -> float:
+        if not self.jitter or not seconds:
+            return seconds
+        with self._lock:
+            return seconds * (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def _reply_for(self, prompt: str) -> str:
+        return self.responder(prompt, self.reply) if self.responder else self.reply
+
+    @staticmethod
+    def _chunks(reply: str) -> List[str]:
+        words = reply.split(" ")
+        return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+    @staticmethod
+    def _usage(prompt: str, reply: str) -> FakeUsage:
+        return FakeUsage(len(prompt) // 4 + 1, len(reply) // 4 + 1)
+
+    def generate_content(
+        self, prompt: str, stream: bool = False, **kwargs
+    ) -> Union[FakeStreamChunk, Iterator[FakeStreamChunk]]:
+        self.prompts.append(prompt)
+        reply = self._reply_for(prompt)
+        if not stream:
+            chunks = self._chunks(reply)
+            time.sleep(
+                self._delay(self.first_token_delay)
+                + self._delay(self.chunk_delay) * (len(chunks) - 1)
+            )
+            return FakeStreamChunk(reply, self._usage(prompt, reply))
+        return self._stream(prompt, reply)
+
+    def _stream(self, prompt: str, reply: str) -> Iterator[FakeStreamChunk]:
+        time.sleep(self._delay(self.first_token_delay))
+        chunks = self._chunks(reply)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(self._delay(self.chunk_delay))
+            # Like Gemini, usage metadata comes with the last chunk
+            usage = self._usage(prompt, reply) if i == len(chunks) - 1 else None
+            yield FakeStreamChunk(chunk, usage)
+
+
+def supports_context_caching(model) -> bool:
+    """True for google.generativeai models (see snapshots.GeminiContextCache)."""
+    return type(model).__module__.startswith("google.generativeai")
+
+
+def create_backend(name: str = LLM_BACKEND) -> LLMBackend:
+    """Build the model configured by LLM_BACKEND."""
+    if name == "fake":
+        return FakeModel()
+    if name == "gemini":
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        return genai.GenerativeModel(GEMINI_MODEL)
+    raise ValueError(f"Unknown LLM_BACKEND: {name!r} (expected 'gemini' or 'fake')")
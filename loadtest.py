@@ -0,0 +1,232 @@
+"""Replay synthetic Telegram updates through the bot's handlers, offline.
+
+Uses the fake LLM backend, a fake Bot API transport and mongomock (or a
+local mongod via --mongo-uri), then reports latency percentiles and
+throughput:
+
+    pip install mongomock
+    python loadtest.py --messages 500 --chats 50 --concurrency 32 --latency 0.5
+
+Latency is measured per update, from dispatch until its handler returns
+(including the per-chat debounce window and the Gemini rate limiter).
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+QUESTIONS = [
+    "what are my tasks?",
+    "do I have a meeting tomorrow?",
+    "what did I note about groceries?",
+    "งานวันนี้มีอะไรบ้าง",
+    "มีนัดอะไรพรุ่งนี้",
+    "summarize my notes",
+]
+NOTES = ["buy milk", "call the bank", "ซื้อของเข้าบ้าน", "ideas for the trip"]
+TASKS = [
+    "Buy groceries at 14:30",
+    "Meeting tomorrow at 10am",
+    "ประชุม พรุ่งนี้ 10 โมง",
+    "Dentist appointment next monday 15:00",
+    "call mom sometime soon",  # no time: falls back to the (fake) LLM
+]
+
+
+class FakeBotRequest(BaseRequest):
+    """Answers Bot API calls locally after `latency` seconds instead of
+    talking to api.telegram.org, and counts calls per method."""
+
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+        elif api_method in ("sendMessage", "editMessageText"):
+            result = {
+                "message_id": params.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def make_workload(args, chat_ids: List[int]) -> List[Tuple[str, int, str]]:
+    rng = random.Random(args.seed)
+    workload = []
+    for _ in range(args.messages):
+        chat_id = rng.choice(chat_ids)
+        roll = rng.random()
+        if roll < args.questions:
+            workload.append(("question", chat_id, rng.choice(QUESTIONS)))
+        elif roll < args.questions + args.notes:
+            workload.append(("note", chat_id, "/note " + rng.choice(NOTES)))
+        else:
+            workload.append(("task", chat_id, "/task " + rng.choice(TASKS)))
+    return workload
+
+
+def report(results: Dict[str, List[float]], elapsed: float, fake_request, model) -> None:
+    total = sum(len(v) for v in results.values())
+    print(f"{total} updates in {elapsed:.2f}s -> {total / elapsed:.1f} messages/s")
+    print(f"{'kind':10s} {'count':>6s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'max ms':>9s}")
+    everything = sorted(v for values in results.values() for v in values)
+    for kind, values in sorted(results.items()) + [("all", everything)]:
+        values = sorted(values)
+        print(
+            f"{kind:10s} {len(values):6d} "
+            + " ".join(f"{percentile(values, p) * 1000:9.1f}" for p in (50, 95, 99))
+            + f" {values[-1] * 1000 if values else 0:9.1f}"
+        )
+    print(f"LLM calls: {len(model.prompts)}, Bot API calls: {dict(fake_request.calls)}")
+
+
+async def run(args) -> None:
+    # Imported after the environment is set up in __main__
+    import database
+    import telegram_bot
+    from llm_backend import FakeModel
+    from scheduler import chat_scheduler, gemini_bucket
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("telegram_bot").setLevel(logging.WARNING)
+
+    if not args.mongo_uri:
+        import mongomock
+
+        database.set_client(mongomock.MongoClient())
+
+    db = database.get_db()
+    rng = random.Random(args.seed)
+    if args.seed_docs and db["data"].estimated_document_count() == 0:
+        db["data"].insert_many(
+            {
+                "description": f"{rng.choice(NOTES + TASKS)} #{i}",
+                "type": rng.choice(["note", "task"]),
+                "time": datetime(2025, 1, i % 28 + 1, 10, 0),
+                "chat_id": 0,
+            }
+            for i in range(args.seed_docs)
+        )
+
+    chat_scheduler.debounce = args.debounce
+    gemini_bucket.rate = args.rate / 60.0
+
+    fake_request = FakeBotRequest(args.api_latency)
+    model = FakeModel(
+        first_token_delay=args.latency,
+        chunk_delay=args.chunk_delay,
+        jitter=args.jitter,
+        seed=args.seed,
+    )
+    application = await telegram_bot.setup_bot(request=fake_request, model=model)
+
+    # Synthetic chats must pass the ALLOWED_CHAT_IDS check
+    allowed = telegram_bot.ALLOWED_CHAT_IDS
+    chat_ids = allowed if allowed else list(range(1000, 1000 + args.chats))
+    workload = make_workload(args, chat_ids)
+
+    from telegram import Update
+    from webhook_harness import make_update
+
+    results: Dict[str, List[float]] = defaultdict(list)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def send(kind: str, chat_id: int, text: str) -> None:
+        async with semaphore:
+            update = Update.de_json(make_update(chat_id, text), application.bot)
+            start = time.perf_counter()
+            await application.process_update(update)
+            results[kind].append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    tasks = []
+    for kind, chat_id, text in workload:
+        tasks.append(asyncio.create_task(send(kind, chat_id, text)))
+        if args.arrival_gap:
+            await asyncio.sleep(args.arrival_gap)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    report(results, elapsed, fake_request, model)
+    print(f"scheduler: {chat_scheduler.stats()}")
+    await telegram_bot.shutdown_bot()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=32, help="updates in flight at once")
+    parser.add_argument("--arrival-gap", type=float, default=0.0, help="seconds between dispatches")
+    parser.add_argument("--questions", type=float, default=0.6, help="share of free-text questions")
+    parser.add_argument("--notes", type=float, default=0.2, help="share of /note (rest is /task)")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake LLM first-token latency")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="fake LLM delay per word")
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- fraction of latency")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="fake Bot API latency")
+    parser.add_argument("--debounce", type=float, default=0.4, help="per-chat coalescing window")
+    parser.add_argument("--rate", type=float, default=6000, help="Gemini calls per minute")
+    parser.add_argument("--seed-docs", type=int, default=200, help="documents to pre-load")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo-uri", default="", help="local mongod (default: mongomock)")
+    parser.add_argument("--db", default="loadtest", help="database name (will be written to)")
+    parser.add_argument("--verbose", action="store_true", help="keep INFO logging")
+    args = parser.parse_args()
+
+    # Offline settings must be in place before the app modules read them
+    os.environ["MONGODB_DB"] = args.db
+    if args.mongo_uri:
+        os.environ["MONGODB_URI"] = args.mongo_uri
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:loadtest")
+    os.environ["CHAT_MEMORY_STORE"] = "none"
+
+    asyncio.run(run(args))
@@ -1,26 +1,67 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from pathlib import Path
 from bson import ObjectId
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+import hmac
+import importlib
+import itertools
 import json
+import os
+import sys
 import logging
 import traceback
-from pymongo import MongoClient
-from fetch import fetch_formatted_data, get_all_collections, JSONEncoder
+from contextlib import asynccontextmanager
+from database import get_client, get_db, close_client
+from schema import build_document
+from answer_cache import answer_cache
+from response_cache import COMPRESS_MIN_BYTES, GZIP_LEVEL, conditional_response, response_cache
+from time_parser import parser_stats
+from scheduler import chat_scheduler
+from metrics import metrics
+from write_buffer import write_buffer
+from search import note_search
+from metadata import collection_metadata
+from reminders import reminder_scheduler
+from intent_router import intent_router
+from live_updates import live_feed, sse_events
+from bot_runner import (
+    BOT_MODE,
+    BOT_RUNNER,
+    WEBHOOK_SECRET,
+    create_runner,
+    read_status as read_bot_status,
+    relay_update,
+)
+from fetch import (
+    fetch_data_page,
+    get_all_collections,
+    iter_collection_page,
+)
+from serialization import dumps, to_jsonable
 from pydantic import BaseModel
 import asyncio
 
 
+# Upper bound for /add-data/batch
+MAX_BATCH_ENTRIES = int(os.getenv("MAX_BATCH_ENTRIES", "1000"))
+# "background": serve HTTP right away and set the bot up in a task (readiness
+# in /health); "blocking": finish bot setup before serving (overridable from .env)
+BOT_STARTUP = os.getenv("BOT_STARTUP", "background").lower()
+
+
 # Add this class for request validation
 class DataEntry(BaseModel):
     description: str
     type: str
     time: str
+    chat_id: Optional[int] = None
 
 
 # Configure logging
@@ -28,7 +69,31 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled MongoDB client for the whole app, shared with the bot
+    get_client()
+    # Edits and deletes by any process reach the search index, with or
+    # without the bot in this process
+    metadata_start = asyncio.create_task(start_metadata())
+    await startup_event()
+    yield
+    await shutdown_event()
+    await metadata_start
+    collection_metadata.stop()
+    live_feed.stop()
+    close_client()
+
+
+async def start_metadata():
+    try:
+        await run_in_threadpool(collection_metadata.start)
+    except Exception as e:
+        logging.error(f"Failed to start collection metadata: {str(e)}")
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Create static directory if it doesn't exist
 static_dir = Path("static")
@@ -50,9 +115,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses that aren't served (precompressed) from the
+# response cache; event streams are left alone
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES, compresslevel=GZIP_LEVEL)
+
 # Telegram bot initialization
 telegram_setup_task = None
 telegram_bot = None
+bot_runner = None
+# not_started, starting, running, leader (runner started), external or failed
+bot_state = "not_started"
 
 
 # Add favicon endpoint
@@ -84,163 +156,462 @@ async def root():
     return FileResponse("index.html")
 
 
-@app.get("/health")
-async def health_check():
+async def check_readiness() -> Dict[str, Any]:
+    """Readiness: MongoDB answers and bot setup is no longer in progress
+    (a failed bot doesn't keep the API from serving data)."""
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["telegram-secretary-bot"]
-        collections = db.list_collection_names()
-        client.close()
-        return {"status": "healthy", "collections": collections}
+        collections = await run_in_threadpool(get_db().list_collection_names)
+        database = "ok"
     except Exception as e:
         logging.error(f"Health check failed: {str(e)}")
+        collections = None
+        database = f"error: {str(e)}"
+    return {
+        "ready": collections is not None and bot_state != "starting",
+        "database": database,
+        "bot": bot_state,
+        "collections": collections,
+    }
+
+
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: the process serves HTTP; no dependencies are checked."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """200 once the app can serve traffic, 503 while starting or without MongoDB."""
+    readiness = await check_readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+
+@app.get("/health")
+async def health_check(request: Request):
+    # Always checks MongoDB (a cached answer could hide an outage), but
+    # pollers that send If-None-Match get a 304 while nothing changed
+    readiness = await check_readiness()
+    if readiness["collections"] is None:
         raise HTTPException(
-            status_code=500, detail=f"Database connection error: {str(e)}"
+            status_code=500, detail=f"Database connection {readiness['database']}"
         )
+    body = dumps(
+        {
+            "status": "healthy" if readiness["ready"] else "starting",
+            "live": True,
+            **readiness,
+        }
+    ).encode()
+    return conditional_response(request, body, "application/json")
 
 
 @app.get("/telegram-data")
-async def get_telegram_data() -> Dict[str, Any]:
-    client = None
-    try:
-        # Create a new client connection to telegram-secretary-bot database
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["telegram-secretary-bot"]
-        collection = db["data"]
-
-        # Fetch all documents and sort by time in descending order
-        docs = list(collection.find().sort("time", -1))
+async def get_telegram_data(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    type: Optional[str] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
+):
+    async def render():
+        field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+        # Fetch one page sorted by time in descending order (off the event loop)
+        page = await run_in_threadpool(
+            fetch_data_page,
+            "data",
+            limit=limit,
+            before=before,
+            after=after,
+            doc_type=type,
+            fields=field_list,
+            include_total=include_total,
+        )
 
         # Convert ObjectId to string and format dates
         formatted_docs = []
-        for doc in docs:
-            formatted_doc = {}
-            for key, value in doc.items():
-                if key == "_id":
-                    formatted_doc[key] = str(value)
-                elif isinstance(value, datetime):
-                    # Format datetime to a more readable string
-                    formatted_doc[key] = value.strftime("%Y-%m-%d %H:%M:%S")
-                else:
-                    formatted_doc[key] = value
-            formatted_docs.append(formatted_doc)
+        for doc in page["docs"]:
+            if field_list:
+                doc = {k: v for k, v in doc.items() if k in field_list or k == "_id"}
+            formatted_docs.append(to_jsonable(doc, datetime_format="%Y-%m-%d %H:%M:%S"))
 
-        return {
+        response = {
             "status": "success",
             "count": len(formatted_docs),
             "data": formatted_docs,
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"],
         }
+        if include_total:
+            response["total"] = page["total"]
+        return dumps(response).encode(), "application/json"
+
+    try:
+        # Rendered once per data version; repeat polls get the cached body or a 304
+        return await response_cache.serve(request, ["data"], render)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logging.error(f"Error fetching telegram data: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch data: {str(e)}")
-    finally:
-        if client:
-            client.close()
 
 
-@app.get("/table")
-async def table_view(request: Request, collection: str = "data"):
+@app.get("/telegram-data/stream")
+async def stream_telegram_data(request: Request):
+    """Server-Sent Events with new, changed and deleted documents, so the
+    dashboard applies deltas instead of refetching its page. All open
+    dashboards share one change-stream reader per process."""
+    events = sse_events(
+        live_feed, request.headers.get("last-event-id"), request.is_disconnected
+    )
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Keep proxies (nginx) from buffering or caching the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/telegram-data/stream/stats")
+async def stream_stats():
+    """Change source (change_stream or pubsub), open dashboards and events sent."""
+    return live_feed.stats()
+
+
+@app.get("/search")
+async def search_data(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    type: Optional[str] = None,
+    chat_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Keyword search over notes and tasks (Thai and English), best match
+    first, answered from the local index without Gemini."""
     try:
-        # Get data using the fetch module
-        formatted_docs = fetch_formatted_data(collection)
-        collections = get_all_collections()
+        found = await run_in_threadpool(
+            note_search.search, q, limit=limit, doc_type=type, chat_id=chat_id
+        )
+        formatted_docs = [
+            {**to_jsonable(doc, datetime_format="%Y-%m-%d %H:%M:%S"), "score": round(score, 3)}
+            for doc, score in found["results"]
+        ]
+        return {
+            "status": "success",
+            "query": q,
+            "count": len(formatted_docs),
+            "indexed": found["indexed"],
+            "took_ms": round(found["took_ms"], 2),
+            "data": formatted_docs,
+        }
+    except Exception as e:
+        logging.error(f"Error searching data: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to search data: {str(e)}")
+
+
+@app.get("/search/stats")
+async def search_stats():
+    """Documents and terms in the search index, searches served, mean latency."""
+    return note_search.stats()
 
-        # Convert to JSON string with custom encoder
-        json_data = json.dumps(formatted_docs, cls=JSONEncoder, indent=2)
 
-        return templates.TemplateResponse(
-            "table.html",
+@app.get("/table")
+async def table_view(
+    request: Request,
+    collection: str = "data",
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = None,
+    columns: Optional[str] = None,
+    raw: bool = False,
+):
+    try:
+        cached = response_cache.cached_response(request, [collection])
+        if cached is not None:
+            return cached
+
+        # Get one page of data using the fetch module (queries run off the event loop)
+        collections = await run_in_threadpool(get_all_collections)
+        docs = iter_collection_page(collection, limit=limit, after=after)
+
+        # Use the requested columns, or the keys of the first document
+        first = await run_in_threadpool(next, docs, None)
+        if columns:
+            column_list = [c.strip() for c in columns.split(",") if c.strip()]
+        else:
+            column_list = list(first.keys()) if first else []
+        rows = itertools.chain([first], docs) if first else iter(())
+
+        json_data = None
+        if raw:
+            # Raw JSON needs the whole page up front
+            rows = await run_in_threadpool(list, rows)
+            json_data = dumps(rows, indent=True)
+
+        template = templates.get_template("table.html")
+        stream = template.stream(
             {
                 "request": request,
                 "collection": collection,
                 "collections": collections,
-                "formatted_docs": formatted_docs,
+                "columns": column_list,
+                "rows": rows,
+                "limit": limit,
+                "columns_param": columns or "",
+                "raw": raw,
                 "json_data": json_data,
-            },
+            }
+        )
+        # Flush every few rows so the first rows reach the browser right away
+        stream.enable_buffering(20)
+        # Streamed on a miss and cached once fully sent
+        return StreamingResponse(
+            response_cache.tee(request, [collection], stream, "text/html; charset=utf-8"),
+            media_type="text/html",
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _entry_document(data: DataEntry) -> Dict[str, Any]:
+    # Time is stored as a datetime
+    return build_document(
+        data.description, data.type, datetime.fromisoformat(data.time), data.chat_id
+    )
+
+
 @app.post("/add-data")
 async def add_data(data: DataEntry) -> Dict[str, Any]:
-    client = None
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["telegram-secretary-bot"]
-        collection = db["data"]
-
-        # Convert string time to datetime object
-        time_obj = datetime.fromisoformat(data.time)
-
-        # Create document to insert
-        document = {
-            "description": data.description,
-            "type": data.type,
-            "time": time_obj,
-            "created_at": datetime.utcnow(),
-        }
-
-        # Insert the document
-        result = collection.insert_one(document)
+        document = _entry_document(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        return {
-            "status": "success",
-            "message": "Data added successfully",
-            "id": str(result.inserted_id),
-        }
+    try:
+        # Batched with other writes; returns once the document is stored
+        inserted_id = await write_buffer.insert("data", document)
     except Exception as e:
         logging.error(f"Error adding data: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to add data: {str(e)}")
-    finally:
-        if client:
-            client.close()
+
+    # Only schedules when the bot (and its reminders) runs in this process
+    reminder_scheduler.add(document)
+    return {
+        "status": "success",
+        "message": "Data added successfully",
+        "id": str(inserted_id),
+    }
+
+
+@app.post("/add-data/batch")
+async def add_data_batch(entries: List[DataEntry]) -> Dict[str, Any]:
+    """Insert many entries in one request. Per-item results are returned in
+    order; items that fail to write don't fail the others."""
+    if len(entries) > MAX_BATCH_ENTRIES:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MAX_BATCH_ENTRIES} entries per batch"
+        )
+    documents = []
+    for index, data in enumerate(entries):
+        try:
+            documents.append(_entry_document(data))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Entry {index}: {str(e)}")
+
+    try:
+        results = await write_buffer.insert_many("data", documents, return_exceptions=True)
+    except Exception as e:
+        logging.error(f"Error adding data batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to add data: {str(e)}")
+    for document, result in zip(documents, results):
+        if not isinstance(result, Exception):
+            reminder_scheduler.add(document)
+
+    items = [
+        {"error": str(result)} if isinstance(result, Exception) else {"id": str(result)}
+        for result in results
+    ]
+    failed = sum("error" in item for item in items)
+    return {
+        "status": "success" if not failed else "partial" if failed < len(items) else "error",
+        "inserted": len(items) - failed,
+        "failed": failed,
+        "items": items,
+    }
+
+
+@app.get("/write-buffer/stats")
+async def write_buffer_stats():
+    """Batches written, average batch size, retries and pending documents."""
+    return write_buffer.stats()
+
+
+@app.get("/reminders/stats")
+async def reminders_stats():
+    """Scheduled task reminders, next due time and reminders sent so far."""
+    return reminder_scheduler.stats()
+
+
+@app.get("/router/stats")
+async def router_stats():
+    """Messages answered per route (or sent to the LLM) and mean latency."""
+    return intent_router.stats()
+
+
+@app.get("/response-cache/stats")
+async def response_cache_stats():
+    """Hits, misses and 304s of the /telegram-data and /table response cache."""
+    return response_cache.stats()
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the chat answer cache."""
+    return answer_cache.stats()
+
+
+@app.get("/task-parser/stats")
+async def task_parser_stats():
+    """How often /task times were parsed locally vs. by the LLM."""
+    return parser_stats.stats()
+
+
+@app.post("/telegram/webhook")
+async def telegram_webhook(request: Request):
+    """Receive a Telegram update (BOT_MODE=webhook) and queue it for the bot."""
+    if BOT_MODE != "webhook":
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    # An unset secret never matches (webhook mode refuses to start without one)
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token, WEBHOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+
+    data = await request.json()
+    # Local queue if the bot runs here, else relayed through MongoDB
+    if not await relay_update(data):
+        # Telegram retries non-2xx responses, which gives us backpressure
+        raise HTTPException(status_code=503, detail="Update queue unavailable")
+    return {"ok": True}
+
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """Chat coalescing counters and Gemini rate-limit queue depth/wait times."""
+    return chat_scheduler.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage timings and prompt size/token histograms, Prometheus text format."""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/metadata/stats")
+async def metadata_stats():
+    """Cached collection counts/versions, how they are kept fresh, and the
+    prompt context snapshots built from them (with the bot in this process)."""
+    stats = collection_metadata.stats()
+    bot_module = sys.modules.get("telegram_bot")
+    analyzer = bot_module.analyzer if bot_module is not None else None
+    if analyzer is not None:
+        stats["restaurant"] = analyzer.restaurant_metadata.stats()
+        stats["snapshots"] = analyzer.snapshots.stats()
+    return stats
 
 
 @app.get("/bot/status")
 async def bot_status():
     """Get the current status of the Telegram bot."""
     global telegram_bot
+    if BOT_RUNNER != "embedded":
+        # The bot may run in another worker; its heartbeat is in MongoDB
+        try:
+            return await read_bot_status(bot_runner)
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"Bot status unavailable: {str(e)}")
     if telegram_bot and hasattr(telegram_bot, "running"):
-        return {"status": "running" if telegram_bot.running else "stopped"}
-    return {"status": "not_initialized"}
+        return {
+            "status": "running" if telegram_bot.running else "stopped",
+            "runner": BOT_RUNNER,
+        }
+    status = bot_state if bot_state in ("starting", "failed") else "not_initialized"
+    return {"status": status, "runner": BOT_RUNNER}
 
 
-@app.on_event("startup")
 async def startup_event():
     """Start the Telegram bot safely when FastAPI starts up."""
+    global telegram_setup_task, bot_state
+    if BOT_STARTUP == "blocking":
+        await setup_telegram_bot()
+    else:
+        # Serve requests right away; /health/ready turns 200 once it's done
+        # (not ready before the task first runs either)
+        bot_state = "starting"
+        telegram_setup_task = asyncio.create_task(setup_telegram_bot())
+
+
+async def setup_telegram_bot():
+    """Start the bot, or its runner, the BOT_RUNNER way."""
+    global telegram_bot, bot_runner, bot_state
+    if BOT_RUNNER == "external":
+        logging.info("BOT_RUNNER=external: the bot runs in bot_worker.py")
+        bot_state = "external"
+        return
+    bot_state = "starting"
     try:
-        # Import the telegram_bot module here to avoid circular imports
-        from telegram_bot import setup_bot, start_polling
-
-        # Setup the bot first
-        bot = await setup_bot()
-
-        # Set the global variable
-        global telegram_bot
-        telegram_bot = bot
-
-        # Start polling in the background
-        asyncio.create_task(start_polling())
-
-        logging.info("Telegram bot successfully initialized and started polling")
+        # python-telegram-bot and the LLM client are slow to import; do it
+        # off the event loop (and only here, not when main is imported)
+        await run_in_threadpool(importlib.import_module, "telegram_bot")
+        if BOT_RUNNER == "leader":
+            # Only the worker holding the MongoDB lease runs the bot
+            bot_runner = create_runner()
+            bot_runner.start()
+            bot_state = "leader"
+            return
+
+        from telegram_bot import start_bot
+
+        telegram_bot = await start_bot()
+        bot_state = "running"
+        logging.info("Telegram bot successfully initialized")
     except Exception as e:
+        bot_state = "failed"
         logging.error(f"Failed to start telegram bot: {str(e)}")
         logging.error(traceback.format_exc())
 
 
-@app.on_event("shutdown")
 async def shutdown_event():
-    """Shutdown the Telegram bot when FastAPI shuts down."""
+    """Shutdown the Telegram bot and write out buffered inserts when FastAPI
+    shuts down."""
     try:
-        from telegram_bot import shutdown_bot
-
-        # Shutdown the bot
-        await shutdown_bot()
-        logging.info("Telegram bot successfully shutdown")
+        if telegram_setup_task is not None and not telegram_setup_task.done():
+            telegram_setup_task.cancel()
+            await asyncio.gather(telegram_setup_task, return_exceptions=True)
+
+        if bot_runner is not None:
+            # Hand the lease to another worker right away
+            await bot_runner.stop()
+        # Only loaded if the bot was set up in this process
+        if "telegram_bot" in sys.modules:
+            from telegram_bot import shutdown_bot
+
+            await shutdown_bot()
+            logging.info("Telegram bot successfully shutdown")
     except Exception as e:
         logging.error(f"Error shutting down telegram bot: {str(e)}")
 
+    try:
+        # /add-data writes are buffered too, with or without the bot in this
+        # process (nothing left to write if shutdown_bot flushed already)
+        await write_buffer.close()
+    except Exception as e:
+        logging.error(f"Error flushing write buffer: {str(e)}")
+
 
 if __name__ == "__main__":
     import uvicorn
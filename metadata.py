@@ -0,0 +1,233 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from database import get_db
+from schema import BOOKKEEPING_FIELDS, is_bookkeeping_update
+
+# Metadata cache settings (overridable from .env)
+METADATA_SAMPLE_SIZE = int(os.getenv("METADATA_SAMPLE_SIZE", "20"))
+METADATA_POLL_SECONDS = float(os.getenv("METADATA_POLL_SECONDS", "30"))
+
+
+class CollectionMetadata:
+    """Cached per-collection metadata: estimated document count, the keys
+    seen in a small document sample, and a version bumped on every change.
+
+    Kept fresh in a background thread by a MongoDB change stream, or by
+    polling `estimated_document_count` and the newest `_id` when change
+    streams aren't available (standalone mongod). Polling only notices
+    inserts and deletes, not in-place updates, and only samples keys again
+    when the count or newest `_id` changed. Updates that only touch
+    `ignored_fields` (bookkeeping such as reminder claims) don't count as
+    changes. Without `db`, `get_database()` is used once it is first needed.
+    """
+
+    def __init__(
+        self,
+        db=None,
+        sample_size: int = METADATA_SAMPLE_SIZE,
+        poll_interval: float = METADATA_POLL_SECONDS,
+        ignored_fields: Iterable[str] = (),
+        get_database: Callable[[], Any] = get_db,
+    ):
+        self._db = db
+        self.get_database = get_database
+        self.ignored_fields = frozenset(ignored_fields)
+        self.sample_size = sample_size
+        self.poll_interval = poll_interval
+        self.entries: Dict[str, Dict] = {}
+        self.listeners: List[Callable[[str, str], None]] = []
+        self.mode = "stopped"
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._owns_db = db is None
+
+    @property
+    def db(self):
+        # Resolved on first use so importing this module doesn't connect
+        if self._db is None:
+            self._db = self.get_database()
+        return self._db
+
+    def add_listener(self, listener: Callable[[str, str], None]) -> None:
+        """Call `listener(collection_name, operation)` after each change."""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, str], None]) -> None:
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _sample_keys(self, collection) -> List[str]:
+        keys = {}
+        pipeline = [{"$sample": {"size": self.sample_size}}]
+        for doc in collection.aggregate(pipeline):
+            keys.update(dict.fromkeys(doc))
+        return list(keys)
+
+    def _load(self, collection_name: str) -> Dict:
+        collection = self.db[collection_name]
+        doc_count = collection.estimated_document_count()
+        newest = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        return {
+            "exists": True,
+            "document_count": doc_count,
+            "sample_keys": None,
+            "last_id": newest["_id"] if newest else None,
+            "refreshed_at": time.time(),
+        }
+
+    def get(self, collection_name: str) -> Dict:
+        """Cached metadata; only the first lookup of a collection hits MongoDB."""
+        with self._lock:
+            entry = self.entries.get(collection_name)
+        if entry is None:
+            entry = self.refresh(collection_name)
+        return entry
+
+    def version(self, collection_name: str) -> int:
+        return self.get(collection_name)["version"]
+
+    def refresh(self, collection_name: str, operation: Optional[str] = None) -> Dict:
+        """Reload one collection's metadata. A change is detected from
+        `operation` (change stream event) or by comparing count and newest
+        `_id` (polling); listeners are notified either way."""
+        loaded = self._load(collection_name)
+        with self._lock:
+            previous = self.entries.get(collection_name)
+        if previous is not None and operation is None and (
+            loaded["document_count"] != previous["document_count"]
+            or loaded["last_id"] != previous["last_id"]
+        ):
+            operation = (
+                "delete" if loaded["document_count"] < previous["document_count"] else "insert"
+            )
+        if previous is None or operation is not None:
+            # Keys are only sampled again when something changed
+            if loaded["document_count"]:
+                loaded["sample_keys"] = self._sample_keys(self.db[collection_name])
+        else:
+            loaded["sample_keys"] = previous["sample_keys"]
+        with self._lock:
+            current = self.entries.get(collection_name, previous)
+            loaded["version"] = 0 if current is None else current["version"]
+            if current is not None and operation is not None:
+                loaded["version"] += 1
+            self.entries[collection_name] = loaded
+
+        if previous is not None and operation is not None:
+            for listener in self.listeners:
+                try:
+                    listener(collection_name, operation)
+                except Exception as e:
+                    logging.error(
+                        f"Metadata listener failed for '{collection_name}': {str(e)}"
+                    )
+        return loaded
+
+    def start(self) -> None:
+        """Warm the cache for every collection and start the refresh thread
+        (no-op if already started)."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            for name in self.db.list_collection_names():
+                self.refresh(name)
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="metadata-refresh", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._start_lock:
+            if self._thread is not None:
+                self._thread.join(timeout=5)
+                self._thread = None
+            if self._owns_db:
+                # Picked up again from get_database() (e.g. a new client)
+                self._db = None
+                self.entries.clear()
+        self.mode = "stopped"
+
+    def _run(self) -> None:
+        try:
+            self._watch()
+            reason = "change stream closed"
+        except Exception as e:
+            reason = f"change streams unavailable: {str(e)}"
+        if self._stop.is_set():
+            return
+        logging.info(
+            f"Polling collection metadata every {self.poll_interval}s ({reason})"
+        )
+        self._poll()
+
+    def _watch(self) -> None:
+        pipeline = [
+            {
+                "$project": {
+                    "operationType": 1,
+                    "ns": 1,
+                    "updateDescription.updatedFields": 1,
+                    "updateDescription.removedFields": 1,
+                }
+            }
+        ]
+        with self.db.watch(pipeline, max_await_time_ms=1000) as stream:
+            self.mode = "change_stream"
+            logging.info("Watching collection metadata with a change stream")
+            while stream.alive and not self._stop.is_set():
+                # Drain a burst of events, then refresh each collection once
+                changed = {}
+                change = stream.try_next()
+                while change is not None:
+                    name = change.get("ns", {}).get("coll")
+                    if self.ignored_fields and is_bookkeeping_update(change, self.ignored_fields):
+                        name = None
+                    if name and changed.get(name, "insert") == "insert":
+                        # Anything but an insert takes precedence
+                        changed[name] = change["operationType"]
+                    change = stream.try_next() if len(changed) < 100 else None
+                for name, operation in changed.items():
+                    try:
+                        self.refresh(name, operation)
+                    except Exception as e:
+                        logging.error(f"Error refreshing metadata for '{name}': {str(e)}")
+
+    def _poll(self) -> None:
+        self.mode = "polling"
+        while not self._stop.wait(self.poll_interval):
+            try:
+                names = self.db.list_collection_names()
+            except Exception as e:
+                logging.error(f"Error listing collections: {str(e)}")
+                continue
+            for name in names:
+                try:
+                    self.refresh(name)
+                except Exception as e:
+                    logging.error(f"Error refreshing metadata for '{name}': {str(e)}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "collections": {
+                    name: {
+                        "document_count": entry["document_count"],
+                        "version": entry["version"],
+                        "refreshed_at": entry["refreshed_at"],
+                    }
+                    for name, entry in self.entries.items()
+                },
+            }
+
+
+# The data database's metadata, shared by the API (search index) and the
+# analyzer (caches, prompts) so each process watches it once
+collection_metadata = CollectionMetadata(ignored_fields=BOOKKEEPING_FIELDS)
@@ -0,0 +1,162 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from retrieval import estimate_tokens
+
+# Bucket upper bounds
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144)
+TOKENS_BUCKETS = (32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+class Histogram:
+    """Prometheus-style histogram with one series per label value.
+
+    `observe` is a bisect plus a few increments under a lock (about a
+    microsecond), so it can stay on in production.
+    """
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        # label value -> [per-bucket counts (+Inf last), sum, count]
+        self.series: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.series[label_value] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = [(key, list(s[0]), s[1], s[2]) for key, s in self.series.items()]
+        for label_value, counts, total, count in sorted(snapshot):
+            labels = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+            yield f"{self.name}_sum{{{labels}}} {total}"
+            yield f"{self.name}_count{{{labels}}} {count}"
+
+
+class Metrics:
+    """Per-stage timings and per-call prompt sizes for Gemini requests."""
+
+    def __init__(self):
+        self.stage_seconds = Histogram(
+            "secretary_stage_seconds",
+            "Time spent in each stage of answering a message.",
+            "stage",
+            SECONDS_BUCKETS,
+        )
+        self.prompt_bytes = Histogram(
+            "secretary_prompt_bytes",
+            "UTF-8 size of prompts sent to Gemini.",
+            "operation",
+            BYTES_BUCKETS,
+        )
+        self.prompt_tokens = Histogram(
+            "secretary_prompt_tokens",
+            "Prompt tokens per Gemini call (reported usage, else estimated).",
+            "operation",
+            TOKENS_BUCKETS,
+        )
+        self.output_tokens = Histogram(
+            "secretary_output_tokens",
+            "Output tokens per Gemini call (reported usage, else estimated).",
+            "operation",
+            TOKENS_BUCKETS,
+        )
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        self.stage_seconds.observe(stage, seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Time the enclosed block as `stage`, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.observe(stage, time.perf_counter() - start)
+
+    def record_call(
+        self, operation: str, prompt: str, output: str = "", response=None
+    ) -> None:
+        """Record prompt size and token counts of one Gemini call. Token
+        counts come from the response's usage metadata when available."""
+        prompt_tokens, output_tokens = _usage(response)
+        self.prompt_bytes.observe(operation, len(prompt.encode("utf-8")))
+        self.prompt_tokens.observe(
+            operation, prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt)
+        )
+        self.output_tokens.observe(
+            operation, output_tokens if output_tokens is not None else estimate_tokens(output)
+        )
+
+    def render(self) -> str:
+        """All histograms in Prometheus text exposition format."""
+        lines = []
+        for histogram in (
+            self.stage_seconds,
+            self.prompt_bytes,
+            self.prompt_tokens,
+            self.output_tokens,
+        ):
+            lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
+
+
+def _usage(response) -> Tuple[Optional[int], Optional[int]]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    return (
+        getattr(usage, "prompt_token_count", None) or None,
+        getattr(usage, "candidates_token_count", None) or None,
+    )
+
+
+# Shared by the analyzer, the bot and the /metrics endpoint
+metrics = Metrics()
+
+
+# Overhead check: python metrics.py
+if __name__ == "__main__":
+    bench = Metrics()
+    n = 200_000
+    start = time.perf_counter()
+    for i in range(n):
+        bench.observe_stage("model_call", (i % 1000) / 100)
+    observe_us = (time.perf_counter() - start) / n * 1e6
+
+    start = time.perf_counter()
+    for _ in range(n):
+        with bench.timer("retrieve"):
+            pass
+    timer_us = (time.perf_counter() - start) / n * 1e6
+
+    prompt = "x" * 8000
+    start = time.perf_counter()
+    for _ in range(n // 10):
+        bench.record_call("answer", prompt, "short reply")
+    record_us = (time.perf_counter() - start) / (n // 10) * 1e6
+
+    print(f"observe_stage  {observe_us:6.2f} us/call")
+    print(f"timer          {timer_us:6.2f} us/call")
+    print(f"record_call    {record_us:6.2f} us/call (8 KB prompt)")
+    print(bench.render().splitlines()[0:4])
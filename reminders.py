@@ -0,0 +1,478 @@
+import os
+import heapq
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from pymongo import ReturnDocument
+from concurrency import run_db
+from database import get_db
+from retrieval import find_newer
+
+# Reminder settings (overridable from .env)
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "true").lower() == "true"
+# Remind this many seconds before a task's time
+REMINDER_LEAD_SECONDS = float(os.getenv("REMINDER_LEAD_SECONDS", "0"))
+# Tasks due within this window are kept in memory (at most REMINDER_HEAP_SIZE)
+REMINDER_WINDOW_HOURS = float(os.getenv("REMINDER_WINDOW_HOURS", "24"))
+REMINDER_HEAP_SIZE = int(os.getenv("REMINDER_HEAP_SIZE", "10000"))
+# Seconds between checks for tasks written by other processes
+REMINDER_SYNC_SECONDS = float(os.getenv("REMINDER_SYNC_SECONDS", "60"))
+# Overdue tasks older than this (e.g. while the bot was down) are not reminded
+REMINDER_MAX_LATE_SECONDS = float(os.getenv("REMINDER_MAX_LATE_SECONDS", "3600"))
+REMINDER_RETRY_SECONDS = float(os.getenv("REMINDER_RETRY_SECONDS", "60"))
+
+
+class SystemClock:
+    """Wall-clock time, naive like the stored task times (see schema.py)."""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+
+class FakeClock:
+    """Manually advanced clock for tests and simulations.
+
+    `sleep` returns once `advance` has moved the time past its deadline.
+    `sleeps` counts sleep calls; since the scheduler goes back to sleep
+    whenever it is idle, `wait_for_sleep(n)` waits (in real time, as its
+    MongoDB calls run in executor threads) until it has done its work.
+    """
+
+    def __init__(self, start: Optional[datetime] = None, timeout: float = 30.0):
+        self.current = start or datetime(2025, 1, 1)
+        self.timeout = timeout
+        self.sleepers: List[Tuple[datetime, int, asyncio.Future]] = []
+        self.sleeps = 0
+
+    def now(self) -> datetime:
+        return self.current
+
+    async def sleep(self, seconds: float) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self.sleeps += 1
+        heapq.heappush(
+            self.sleepers, (self.current + timedelta(seconds=seconds), self.sleeps, future)
+        )
+        await future
+
+    async def wait_for_sleep(self, after: int) -> None:
+        """Wait until there have been more than `after` sleep calls (at
+        most `timeout` real seconds)."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        while self.sleeps <= after:
+            if loop.time() > deadline:
+                raise TimeoutError("nothing went to sleep on the fake clock")
+            await asyncio.sleep(0.0005)
+
+    async def advance(self, seconds: float) -> None:
+        """Move time forward, waking sleepers in deadline order and letting
+        each finish its work before the clock moves on."""
+        target = self.current + timedelta(seconds=seconds)
+        while self.sleepers and self.sleepers[0][0] <= target:
+            deadline, _, future = heapq.heappop(self.sleepers)
+            if future.done():
+                continue
+            self.current = max(self.current, deadline)
+            before = self.sleeps
+            future.set_result(None)
+            await self.wait_for_sleep(before)
+        self.current = target
+
+
+def _pending_query(start: datetime, end: datetime) -> Dict[str, Any]:
+    # Served by the type_time_id index (see init_indexes.py)
+    return {
+        "type": "task",
+        "time": {"$gte": start, "$lt": end},
+        "chat_id": {"$ne": None},
+        "reminded_at": {"$exists": False},
+    }
+
+
+class ReminderScheduler:
+    """Sends a Telegram reminder when a stored task comes due.
+
+    Only the next due tasks are kept in memory, in a min-heap ordered by
+    reminder time: those due within `window` (at most `heap_size` of them),
+    loaded with one indexed range query. Everything before `horizon` is
+    known to be in the heap; when time reaches the horizon the next range is
+    loaded. New tasks are pushed by `add` when written from this process and
+    picked up every `sync_interval` seconds (documents with a newer `_id`,
+    see retrieval.find_newer) when written elsewhere, so the collection is
+    never scanned in full.
+
+    Before sending, a reminder is claimed in MongoDB by setting
+    `reminded_at`, which also skips tasks that were deleted, rescheduled or
+    already reminded by another process.
+    """
+
+    def __init__(
+        self,
+        get_collection: Callable[[], Any] = lambda: get_db()["data"],
+        clock=None,
+        lead: float = REMINDER_LEAD_SECONDS,
+        window: float = REMINDER_WINDOW_HOURS * 3600,
+        heap_size: int = REMINDER_HEAP_SIZE,
+        sync_interval: float = REMINDER_SYNC_SECONDS,
+        max_late: float = REMINDER_MAX_LATE_SECONDS,
+        retry_delay: float = REMINDER_RETRY_SECONDS,
+    ):
+        self.get_collection = get_collection
+        self.clock = clock or SystemClock()
+        self.lead = timedelta(seconds=lead)
+        self.window = timedelta(seconds=window)
+        self.heap_size = heap_size
+        self.sync_interval = sync_interval
+        self.max_late = timedelta(seconds=max_late)
+        self.retry_delay = timedelta(seconds=retry_delay)
+        # (remind_at, task time, _id); `scheduled` maps _id -> task time so
+        # stale heap entries (rescheduled tasks) are skipped when popped
+        self.heap: List[Tuple[datetime, datetime, Any]] = []
+        self.scheduled: Dict[Any, datetime] = {}
+        self.horizon: Optional[datetime] = None
+        self.last_id = None
+        self.send: Optional[Callable[[Dict], Awaitable[Any]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.loads = 0
+        self.syncs = 0
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def _push(self, task_id: Any, task_time: datetime) -> bool:
+        if self.scheduled.get(task_id) == task_time:
+            return False
+        self.scheduled[task_id] = task_time
+        heapq.heappush(self.heap, (task_time - self.lead, task_time, task_id))
+        return True
+
+    def add(self, document: Dict) -> None:
+        """Schedule a task just written by this process (no-op for notes,
+        tasks without a chat, and tasks beyond the loaded horizon).
+
+        Never raises: the task is already stored, so a failure here must not
+        fail the write (a retry would store it twice); the next sync picks
+        the task up instead.
+        """
+        try:
+            self._add(document)
+        except Exception as e:
+            logging.error(f"Error scheduling reminder for {document.get('_id')}: {str(e)}")
+
+    def _add(self, document: Dict) -> None:
+        if not self.running or document.get("type") != "task":
+            return
+        task_time = document.get("time")
+        if document.get("chat_id") is None or not isinstance(task_time, datetime):
+            return
+        if self.horizon is not None and task_time >= self.horizon:
+            return
+        if task_time < self.clock.now() - self.max_late:
+            return
+        if self._push(document["_id"], task_time) and self.heap[0][2] == document["_id"]:
+            # New earliest reminder: re-arm the sleep
+            self._wakeup.set()
+
+    def _find_pending(self, start: datetime, end: datetime) -> List[Dict]:
+        return list(
+            self.get_collection()
+            .find(_pending_query(start, end), {"time": 1})
+            .sort("time", 1)
+            .limit(self.heap_size)
+        )
+
+    def _find_newer(self, last_id: Any) -> List[Dict]:
+        # Tasks read again by the overlap window are deduplicated by _push
+        return find_newer(
+            self.get_collection(),
+            last_id,
+            lambda task_id: task_id in self.scheduled,
+            {"type": "task", "reminded_at": {"$exists": False}},
+            {"type": 1, "time": 1, "chat_id": 1},
+        )
+
+    def _newest_id(self) -> Any:
+        newest = list(self.get_collection().find({}, {"_id": 1}).sort("_id", -1).limit(1))
+        return newest[0]["_id"] if newest else None
+
+    async def _load(self, start: datetime) -> int:
+        """Push pending tasks from `start` up to the window end (or the first
+        `heap_size`) and move the horizon there."""
+        end = self.clock.now() + self.window
+        docs = await run_db(self._find_pending, start, end)
+        for doc in docs:
+            self._push(doc["_id"], doc["time"])
+        # A full page means later tasks exist: stop at the last one loaded
+        # (tasks at exactly that time are loaded again and deduplicated)
+        self.horizon = docs[-1]["time"] if len(docs) >= self.heap_size else end
+        self.loads += 1
+        return len(docs)
+
+    async def _sync(self) -> int:
+        """Schedule tasks written by other processes since the last sync."""
+        docs = await run_db(self._find_newer, self.last_id)
+        self.syncs += 1
+        added = 0
+        not_before = self.clock.now() - self.max_late
+        for doc in docs:
+            if self.last_id is None or doc["_id"] > self.last_id:
+                self.last_id = doc["_id"]
+            task_time = doc.get("time")
+            if (
+                doc.get("type") == "task"
+                and doc.get("chat_id") is not None
+                and isinstance(task_time, datetime)
+                and not_before <= task_time < self.horizon
+            ):
+                added += self._push(doc["_id"], task_time)
+        return added
+
+    def _claim(self, task_id: Any, task_time: datetime) -> Optional[Dict]:
+        return self.get_collection().find_one_and_update(
+            {"_id": task_id, "time": task_time, "reminded_at": {"$exists": False}},
+            {"$set": {"reminded_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _unclaim(self, task_id: Any) -> None:
+        self.get_collection().update_one({"_id": task_id}, {"$unset": {"reminded_at": ""}})
+
+    async def _fire(self, task_time: datetime, task_id: Any) -> None:
+        try:
+            task = await run_db(self._claim, task_id, task_time)
+        except Exception as e:
+            logging.error(f"Error claiming reminder for task {task_id}: {str(e)}")
+            self._retry(task_id, task_time)
+            return
+        if task is None:
+            # Deleted, rescheduled or already reminded elsewhere
+            self.skipped += 1
+            return
+        try:
+            await self.send(task)
+            self.sent += 1
+        except Exception as e:
+            logging.error(f"Error sending reminder for task {task_id}: {str(e)}")
+            self.failed += 1
+            try:
+                await run_db(self._unclaim, task_id)
+                self._retry(task_id, task_time)
+            except Exception as e:
+                logging.error(f"Error releasing reminder for task {task_id}: {str(e)}")
+
+    def _retry(self, task_id: Any, task_time: datetime) -> None:
+        retry_at = self.clock.now() + self.retry_delay
+        self.scheduled[task_id] = task_time
+        heapq.heappush(self.heap, (retry_at, task_time, task_id))
+
+    async def _fire_due(self) -> None:
+        now = self.clock.now()
+        while self.heap and self.heap[0][0] <= now:
+            _, task_time, task_id = heapq.heappop(self.heap)
+            if self.scheduled.get(task_id) != task_time:
+                continue
+            del self.scheduled[task_id]
+            await self._fire(task_time, task_id)
+
+    async def _sleep(self, seconds: float) -> None:
+        """Sleep until `seconds` pass or `add` schedules an earlier task."""
+        self._wakeup.clear()
+        sleeper = asyncio.ensure_future(self.clock.sleep(max(seconds, 0)))
+        waker = asyncio.ensure_future(self._wakeup.wait())
+        try:
+            await asyncio.wait({sleeper, waker}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sleeper.cancel()
+            waker.cancel()
+
+    async def run(self) -> None:
+        next_sync = self.clock.now()
+        while True:
+            try:
+                if self.horizon is None:
+                    # Heap changes happen on the event loop; only queries run in threads
+                    self.last_id = await run_db(self._newest_id)
+                    await self._load(self.clock.now() - self.max_late)
+                    logging.info(
+                        f"Reminder scheduler started, {len(self.heap)} tasks due before {self.horizon}"
+                    )
+                    next_sync = self.clock.now() + timedelta(seconds=self.sync_interval)
+                await self._fire_due()
+                now = self.clock.now()
+                if now >= next_sync:
+                    added = await self._sync()
+                    if added:
+                        logging.info(f"Scheduled {added} reminders written by other processes")
+                    next_sync = now + timedelta(seconds=self.sync_interval)
+                if now >= self.horizon - self.lead:
+                    # Everything before the horizon is done: load the next range
+                    start = self.horizon
+                    await self._load(start)
+                    if self.horizon <= start:
+                        logging.warning(
+                            f"More than {self.heap_size} tasks at {start}, raise REMINDER_HEAP_SIZE"
+                        )
+                        self.horizon = start + timedelta(seconds=1)
+                    continue
+                wake_at = min(next_sync, self.horizon - self.lead)
+                if self.heap:
+                    wake_at = min(wake_at, self.heap[0][0])
+            except Exception as e:
+                logging.error(f"Reminder scheduler error: {str(e)}")
+                wake_at = self.clock.now() + self.retry_delay
+            await self._sleep((wake_at - self.clock.now()).total_seconds())
+
+    def start(self, send: Callable[[Dict], Awaitable[Any]]) -> None:
+        """Run on the current event loop; `send(task)` delivers a reminder."""
+        if self._task is not None:
+            return
+        self.send = send
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.heap.clear()
+        self.scheduled.clear()
+        self.horizon = None
+        self.last_id = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "scheduled": len(self.scheduled),
+            "next_due": self.heap[0][0].isoformat() if self.heap else None,
+            "horizon": self.horizon.isoformat() if self.horizon else None,
+            "loads": self.loads,
+            "syncs": self.syncs,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }
+
+
+def format_reminder(task: Dict) -> str:
+    return f"⏰ Reminder: {task.get('description', '')} at {task['time'].strftime('%Y-%m-%d %H:%M')}"
+
+
+# Runs with the bot (see telegram_bot.start_bot)
+reminder_scheduler = ReminderScheduler()
+
+
+# Fake-clock simulation: seeds tasks over the coming days, runs the
+# scheduler through a stretch of simulated time and checks every due task
+# was reminded exactly once, on time, without full scans:
+# python reminders.py --tasks 100000 --hours 6
+if __name__ == "__main__":
+    import time
+    import random
+    import argparse
+    from bson import ObjectId
+
+    parser = argparse.ArgumentParser(description="Reminder scheduler simulation")
+    parser.add_argument("--tasks", type=int, default=20000, help="pending tasks to seed")
+    parser.add_argument("--days", type=float, default=30, help="spread the tasks over this many days")
+    parser.add_argument("--hours", type=float, default=6, help="simulated time to run")
+    parser.add_argument("--heap-size", type=int, default=500)
+    parser.add_argument("--mongo-uri", default="", help="default: mongomock")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        import pymongo
+
+        db = pymongo.MongoClient(args.mongo_uri)["reminders_sim"]
+    else:
+        import mongomock
+
+        db = mongomock.MongoClient()["reminders_sim"]
+
+    async def simulate():
+        collection = db["data"]
+        collection.drop()
+        # mongomock scans the whole collection per claim, so allow slow steps
+        clock = FakeClock(datetime(2025, 1, 1, 8, 0), timeout=600)
+        start = clock.now()
+        end = start + timedelta(hours=args.hours)
+        rng = random.Random(0)
+        span = args.days * 86400
+        docs = [
+            {
+                "_id": ObjectId(),
+                "description": f"task {i}",
+                "type": "task" if i % 4 else "note",
+                # Some are already overdue when the scheduler starts
+                "time": start + timedelta(seconds=rng.uniform(-7200, span)),
+                "chat_id": rng.randrange(100),
+            }
+            for i in range(args.tasks)
+        ]
+        collection.insert_many(docs)
+        not_before = start - timedelta(hours=1)
+        expected = {
+            doc["_id"] for doc in docs if doc["type"] == "task" and not_before <= doc["time"] < end
+        }
+
+        delivered = []
+
+        async def send(task):
+            delivered.append((clock.now(), task))
+
+        scheduler = ReminderScheduler(
+            lambda: collection, clock=clock, heap_size=args.heap_size, sync_interval=600
+        )
+        started = time.perf_counter()
+        scheduler.start(send)
+        await clock.wait_for_sleep(0)
+
+        # One task added by this process, one by another process, one deleted
+        local = {"_id": ObjectId(), "description": "added here", "type": "task",
+                 "time": start + timedelta(minutes=30), "chat_id": 1}
+        collection.insert_one(dict(local))
+        scheduler.add(local)
+        external = {"_id": ObjectId(), "description": "added elsewhere", "type": "task",
+                    "time": start + timedelta(hours=1), "chat_id": 2}
+        collection.insert_one(dict(external))
+        midway = start + (end - start) / 2
+        deleted = min(
+            (doc for doc in docs if doc["_id"] in expected and doc["time"] > midway),
+            key=lambda doc: doc["time"],
+        )
+        collection.delete_one({"_id": deleted["_id"]})
+        expected |= {local["_id"], external["_id"]}
+        expected.discard(deleted["_id"])
+
+        while clock.now() < end:
+            await clock.advance(60)
+        elapsed = time.perf_counter() - started
+        await scheduler.stop()
+
+        sent_ids = [task["_id"] for _, task in delivered]
+        lateness = [(at - task["time"]).total_seconds() for at, task in delivered if task["time"] >= start]
+        print(f"{args.tasks} documents, {args.hours}h simulated in {elapsed:.2f}s real")
+        print(
+            f"reminders: {len(sent_ids)} sent, {len(expected)} expected, "
+            f"missing {len(expected - set(sent_ids))}, unexpected {len(set(sent_ids) - expected)}, "
+            f"duplicates {len(sent_ids) - len(set(sent_ids))}"
+        )
+        print(f"max lateness on the fake clock: {max(lateness, default=0):.0f}s")
+        print(f"queries: {scheduler.loads} range loads, {scheduler.syncs} syncs, "
+              f"{scheduler.sent + scheduler.skipped} claims; {scheduler.stats()}")
+
+    asyncio.run(simulate())
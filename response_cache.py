@@ -0,0 +1,297 @@
+import os
+import gzip
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    # Optional: pip install brotli (otherwise gzip only)
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response cache settings (overridable from .env)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+# Upper bound on staleness after writes made by other processes
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+
+def entity_tag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """Conditional GET check; If-None-Match takes precedence over
+    If-Modified-Since (RFC 9110)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: W/"x" matches "x"
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        tags = [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+def accepted_encoding(request: Request) -> Optional[str]:
+    """Best of br/gzip the client accepts (ignoring q-values other than 0)."""
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def conditional_response(request: Request, body: bytes, media_type: str) -> Response:
+    """Uncached response with an ETag, or 304 if the client already has it."""
+    etag = entity_tag(body)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    media_type: str
+    versions: Tuple[int, ...]
+    etag: str
+    last_modified: float
+    created: float = field(default_factory=time.monotonic)
+    # Compressed once, on first request per encoding
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    def encode(self, encoding: str) -> bytes:
+        data = self.encoded.get(encoding)
+        if data is None:
+            if encoding == "br":
+                data = brotli.compress(self.body, quality=BROTLI_QUALITY)
+            else:
+                data = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+            self.encoded[encoding] = data
+        return data
+
+
+class ResponseCache:
+    """In-process cache of rendered GET responses with ETag/Last-Modified.
+
+    Entries are keyed on path and query string and tagged with the versions
+    of the collections they were rendered from. `invalidate` (called by the
+    write buffer after each batch) bumps a collection's version, so the next
+    request renders again. The ETag is a hash of the body, which stays
+    correct across restarts and workers; Last-Modified only moves when the
+    body actually changed. Bodies are compressed once per encoding and the
+    compressed bytes are kept with the entry.
+    """
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.versions: Dict[str, int] = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(request: Request) -> str:
+        return f"{request.url.path}?{request.url.query}"
+
+    def current_versions(self, collections: Iterable[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self.versions[name] for name in collections)
+
+    def get(self, key: str, versions: Tuple[int, ...]) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if (
+                entry is None
+                or entry.versions != versions
+                or time.monotonic() - entry.created > self.ttl
+            ):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(
+        self, key: str, versions: Tuple[int, ...], body: bytes, media_type: str
+    ) -> CachedResponse:
+        """Store a freshly rendered body. Pass the `versions` read before
+        rendering; if a write happened meanwhile the entry is simply never
+        served (its versions are already outdated)."""
+        etag = entity_tag(body)
+        with self._lock:
+            previous = self.entries.get(key)
+            if previous is not None and previous.etag == etag:
+                last_modified = previous.last_modified
+            else:
+                last_modified = time.time()
+            entry = CachedResponse(body, media_type, versions, etag, last_modified)
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, collection_name: str) -> None:
+        """Call after writing to a collection: bumps its version, so cached
+        responses rendered from it are rendered again."""
+        with self._lock:
+            self.versions[collection_name] += 1
+        logging.info(f"Response cache invalidated for '{collection_name}'")
+
+    def respond(self, request: Request, entry: CachedResponse) -> Response:
+        headers = {
+            "ETag": entry.etag,
+            "Last-Modified": formatdate(entry.last_modified, usegmt=True),
+            # Cacheable, but revalidated on every use
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if is_not_modified(request, entry.etag, entry.last_modified):
+            with self._lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        body = entry.body
+        encoding = accepted_encoding(request) if len(body) >= COMPRESS_MIN_BYTES else None
+        if encoding is not None:
+            body = entry.encode(encoding)
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=entry.media_type, headers=headers)
+
+    def cached_response(self, request: Request, collections: Iterable[str]) -> Optional[Response]:
+        """Response (or 304) from a fresh cache entry, None on a miss."""
+        entry = self.get(self.key(request), self.current_versions(collections))
+        return self.respond(request, entry) if entry is not None else None
+
+    async def serve(
+        self,
+        request: Request,
+        collections: Iterable[str],
+        render: Callable[[], Awaitable[Tuple[bytes, str]]],
+    ) -> Response:
+        """Cached (or 304) response for `request`; `render()` returns
+        (body, media type) and only runs on a miss."""
+        key = self.key(request)
+        versions = self.current_versions(collections)
+        entry = self.get(key, versions)
+        if entry is None:
+            body, media_type = await render()
+            entry = self.put(key, versions, body, media_type)
+        return self.respond(request, entry)
+
+    def tee(
+        self,
+        request: Request,
+        collections: Iterable[str],
+        chunks: Iterable[str],
+        media_type: str,
+    ) -> Iterator[str]:
+        """Pass a streamed body through and cache it once fully sent, so
+        streaming responses keep their first-byte latency on a miss."""
+        key = self.key(request)
+        # Read now, before any of the body is rendered
+        versions = self.current_versions(collections)
+
+        def passthrough() -> Iterator[str]:
+            parts = []
+            for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+            self.put(key, versions, "".join(parts).encode(), media_type)
+
+        return passthrough()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "compression": "br, gzip" if brotli is not None else "gzip",
+                "versions": dict(self.versions),
+            }
+
+
+# Shared by the read endpoints (lookups) and every writer (invalidation)
+response_cache = ResponseCache()
+
+
+# Latency of /telegram-data and /table rendered on every hit vs. served from
+# the cache vs. answered with a 304, and bytes on the wire per encoding
+# (mongomock): python response_cache.py --docs 5000
+if __name__ == "__main__":
+    import argparse
+    from datetime import datetime, timedelta
+    import mongomock
+    from fastapi.testclient import TestClient
+    import database
+
+    parser = argparse.ArgumentParser(description="Response cache benchmark")
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    database.set_client(mongomock.MongoClient())
+    start_time = datetime(2025, 1, 1)
+    database.get_db()["data"].insert_many(
+        {"description": f"note {i} about the weekly team meeting", "type": "note",
+         "time": start_time + timedelta(minutes=i)}
+        for i in range(args.docs)
+    )
+    import main
+
+    # The instance main.py uses (this file runs as __main__, a separate copy)
+    from response_cache import response_cache as cache
+
+    def measure(client, url, headers=None) -> float:
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            client.get(url, headers=headers)
+        return (time.perf_counter() - start) / args.requests * 1000
+
+    with TestClient(main.app) as client:
+        for url in ("/telegram-data?limit=50&fields=description,type,time", "/table?limit=100"):
+            cache.ttl = 0
+            rendered = measure(client, url)
+            cache.ttl = RESPONSE_CACHE_TTL
+            client.get(url)
+            cached = measure(client, url)
+            etag = client.get(url).headers["etag"]
+            revalidated = measure(client, url, {"If-None-Match": etag})
+            entry = next(reversed(cache.entries.values()))
+            sizes = f"{len(entry.body)} B raw, {len(entry.encode('gzip'))} B gzip"
+            if brotli is not None:
+                sizes += f", {len(entry.encode('br'))} B br"
+            print(f"{url}: rendered {rendered:.2f} ms, cached {cached:.2f} ms, "
+                  f"304 {revalidated:.2f} ms; {sizes}")
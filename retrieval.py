@@ -0,0 +1,385 @@
+import heapq
+import itertools
+import math
+import os
+import re
+import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from bson import ObjectId
+from serialization import dumps
+
+# Retrieval settings (overridable from .env)
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "20"))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "3000"))
+# Thai word segmentation: "bigram" (no dependency) or "pythainlp" (dictionary)
+THAI_SEGMENTER = os.getenv("THAI_SEGMENTER", "bigram").lower()
+# Incremental reads (overridable from .env): documents up to this many
+# seconds older than the newest one seen are read again, since ObjectIds
+# are made by the writing client and a smaller one can commit later (batched
+# unordered inserts, other processes, clock skew)
+NEWER_OVERLAP_SECONDS = float(os.getenv("NEWER_OVERLAP_SECONDS", "60"))
+
+# Latin words/numbers, or runs of Thai characters
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[฀-๿]+")
+_THAI_RE = re.compile(r"[฀-๿]")
+
+# BM25 parameters
+_K1 = 1.5
+_B = 0.75
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate for prompt budgeting (~4 chars per token)."""
+    return len(text) // 4 + 1
+
+
+def _thai_bigrams(run: str) -> List[str]:
+    return [run[i : i + 2] for i in range(len(run) - 1)]
+
+
+def _load_thai_segmenter() -> Callable[[str], List[str]]:
+    if THAI_SEGMENTER == "pythainlp":
+        try:
+            from pythainlp.tokenize import word_tokenize
+
+            return lambda run: [
+                word for word in word_tokenize(run, engine="newmm", keep_whitespace=False)
+                if word.strip()
+            ]
+        except ImportError:
+            logging.warning("THAI_SEGMENTER=pythainlp but pythainlp is not installed, using bigrams")
+    return _thai_bigrams
+
+
+_segment_thai = _load_thai_segmenter()
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into index terms.
+
+    Thai is written without spaces, so Thai runs are segmented into words
+    with pythainlp when THAI_SEGMENTER=pythainlp, and otherwise indexed as
+    overlapping character bigrams, which match sub-words without a
+    dictionary.
+    """
+    tokens = []
+    for match in _TOKEN_RE.findall(text.lower()):
+        if _THAI_RE.match(match) and len(match) > 2:
+            tokens.extend(_segment_thai(match))
+        else:
+            tokens.append(match)
+    return tokens
+
+
+def find_newer(
+    collection,
+    last_id: Any,
+    is_known: Callable[[Any], bool],
+    query: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    overlap: float = NEWER_OVERLAP_SECONDS,
+) -> List[Dict]:
+    """Documents matching `query` written since `last_id` was seen, in `_id`
+    order. The overlap window before `last_id` is only listed by `_id` (an
+    index-only scan), and documents there are fetched in full when
+    `is_known(_id)` says the caller doesn't have them yet."""
+    query = query or {}
+    if last_id is None:
+        return list(collection.find(query, projection).sort("_id", 1))
+    docs = list(collection.find({**query, "_id": {"$gt": last_id}}, projection).sort("_id", 1))
+    if isinstance(last_id, ObjectId):
+        since = ObjectId.from_datetime(last_id.generation_time - timedelta(seconds=overlap))
+        window = {**query, "_id": {"$gte": since, "$lte": last_id}}
+        missed = [doc["_id"] for doc in collection.find(window, {"_id": 1}) if not is_known(doc["_id"])]
+        if missed:
+            late = list(collection.find({**query, "_id": {"$in": missed}}, projection))
+            docs = sorted(late + docs, key=lambda doc: doc["_id"])
+    return docs
+
+
+def _flatten_text(value: Any) -> str:
+    """Collect every string/number in a document into one searchable string."""
+    if isinstance(value, dict):
+        return " ".join(_flatten_text(v) for k, v in value.items() if k != "_id")
+    if isinstance(value, (list, tuple)):
+        return " ".join(_flatten_text(v) for v in value)
+    if value is None or isinstance(value, bool):
+        return ""
+    return str(value)
+
+
+class TextIndex:
+    """In-memory BM25 inverted index over a single collection."""
+
+    def __init__(self, fields: Optional[List[str]] = None):
+        self.fields = fields
+        self.docs: Dict[str, Dict] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        # Insertion-ordered (dicts keep order), so removal is O(1)
+        self.order: Dict[str, None] = {}
+        self.total_length = 0
+
+    def _document_text(self, doc: Dict) -> str:
+        if self.fields is None:
+            return _flatten_text(doc)
+        return " ".join(_flatten_text(doc.get(field)) for field in self.fields)
+
+    def add(self, doc: Dict) -> None:
+        doc_id = str(doc["_id"])
+        if doc_id in self.docs:
+            self.remove(doc_id)
+
+        terms = tokenize(self._document_text(doc))
+        counts: Dict[str, int] = defaultdict(int)
+        for term in terms:
+            counts[term] += 1
+        for term, count in counts.items():
+            self.postings[term][doc_id] = count
+
+        self.docs[doc_id] = doc
+        self.doc_lengths[doc_id] = len(terms)
+        self.total_length += len(terms)
+        self.order[doc_id] = None
+
+    def remove(self, doc_id: str) -> None:
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in set(tokenize(self._document_text(doc))):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+        del self.order[doc_id]
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def search(
+        self,
+        query: str,
+        limit: int,
+        predicate: Optional[Callable[[Dict], bool]] = None,
+        min_match: float = 0.0,
+    ) -> List[Tuple[str, float]]:
+        """Return up to `limit` (doc_id, score) pairs, best first.
+
+        Only documents containing at least `min_match` of the query's
+        distinct terms (0.0-1.0) and accepted by `predicate` are returned.
+        """
+        if not self.docs:
+            return []
+        n_docs = len(self.docs)
+        avg_length = self.total_length / n_docs or 1.0
+        doc_lengths = self.doc_lengths
+        # BM25 length normalization is base + slope * document length
+        base = _K1 * (1 - _B)
+        slope = _K1 * _B / avg_length
+        scores: Dict[str, float] = {}
+        matched: Dict[str, int] = {}
+
+        terms = set(tokenize(query))
+        required = math.ceil(min_match * len(terms)) if min_match > 0 else 0
+        # Rarest terms first: a document missing from all of the rarest
+        # len(terms) - required + 1 terms can't reach `required` matches, so
+        # after those only already-seen documents need scoring
+        postings_by_term = sorted(
+            (self.postings.get(term) or {} for term in terms), key=len
+        )
+        open_terms = len(terms) - required + 1 if required else len(terms)
+
+        for position, postings in enumerate(postings_by_term):
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            weight = idf * (_K1 + 1)
+            if position < open_terms:
+                items = postings.items()
+            else:
+                items = [(doc_id, postings[doc_id]) for doc_id in scores if doc_id in postings]
+            for doc_id, tf in items:
+                score = weight * tf / (tf + base + slope * doc_lengths[doc_id])
+                if doc_id in scores:
+                    scores[doc_id] += score
+                    matched[doc_id] += 1
+                else:
+                    scores[doc_id] = score
+                    matched[doc_id] = 1
+
+        candidates = scores.items()
+        if required > 1:
+            candidates = [item for item in candidates if matched[item[0]] >= required]
+        if predicate is not None:
+            candidates = [item for item in candidates if predicate(self.docs[item[0]])]
+        return heapq.nlargest(limit, candidates, key=lambda item: item[1])
+
+    def recent(self, limit: int) -> List[str]:
+        """Most recently indexed document ids, newest first."""
+        return list(itertools.islice(reversed(self.order), limit)) if limit > 0 else []
+
+
+class DocumentRetriever:
+    """Selects the most relevant documents of a collection for a question.
+
+    One index is kept per collection and brought up to date incrementally by
+    fetching only documents whose `_id` is newer than the last one indexed
+    (less an overlap window, see find_newer).
+    """
+
+    def __init__(
+        self,
+        db,
+        top_k: int = RETRIEVAL_TOP_K,
+        token_budget: int = RETRIEVAL_TOKEN_BUDGET,
+        fields: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.db = db
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.fields = fields or {"data": ["description", "type", "time"]}
+        self.indexes: Dict[str, TextIndex] = {}
+        self.last_ids: Dict[str, Any] = {}
+        # Bumped by invalidate, so a refresh that overlapped one is redone
+        self.generation = 0
+        # Handlers call the analyzer from executor threads
+        self._lock = threading.RLock()
+
+    def refresh(self, collection_name: str) -> TextIndex:
+        """Bring a collection's index up to date.
+
+        MongoDB is queried without holding the lock, so searches on the
+        current index don't wait for it. A first build also fills the new
+        index outside the lock and swaps it in; later refreshes only add the
+        few new documents under the lock.
+        """
+        while True:
+            with self._lock:
+                index = self.indexes.get(collection_name)
+                last_id = self.last_ids.get(collection_name)
+                generation = self.generation
+
+            known = index.docs if index is not None else {}
+            docs = find_newer(
+                self.db[collection_name], last_id, lambda doc_id: str(doc_id) in known
+            )
+            if index is None:
+                index = TextIndex(self.fields.get(collection_name))
+                for doc in docs:
+                    index.add(doc)
+
+            with self._lock:
+                if self.generation != generation:
+                    # Invalidated while fetching: these documents may be stale
+                    continue
+                current = self.indexes.get(collection_name)
+                if current is None:
+                    self.indexes[collection_name] = index
+                    added = len(index)
+                else:
+                    # Refreshed (or first built) by another thread meanwhile,
+                    # or read again by the overlap window
+                    index = current
+                    added = 0
+                    for doc in docs:
+                        if str(doc["_id"]) not in index.docs:
+                            index.add(doc)
+                            added += 1
+                if docs:
+                    last_id = self.last_ids.get(collection_name)
+                    if last_id is None or docs[-1]["_id"] > last_id:
+                        self.last_ids[collection_name] = docs[-1]["_id"]
+
+            if added:
+                logging.info(
+                    f"Indexed {added} new documents from '{collection_name}' "
+                    f"({len(index)} total)"
+                )
+            return index
+
+    def invalidate(self, collection_name: Optional[str] = None) -> None:
+        """Drop an index (or all of them) so it is rebuilt on next use."""
+        with self._lock:
+            self.generation += 1
+            if collection_name is None:
+                self.indexes.clear()
+                self.last_ids.clear()
+            else:
+                self.indexes.pop(collection_name, None)
+                self.last_ids.pop(collection_name, None)
+
+    def retrieve(
+        self,
+        collection_name: str,
+        question: str,
+        top_k: Optional[int] = None,
+        token_budget: Optional[int] = None,
+        serialize=None,
+        refresh: bool = True,
+    ) -> List[Dict]:
+        """Return the top-K documents for `question` that fit the token budget.
+
+        Documents matching the question are ranked first; remaining slots are
+        filled with the most recent documents so generic questions ("what are
+        my tasks?") still get useful context. Pass `refresh=False` if
+        `refresh()` was just called for this collection.
+        """
+        top_k = self.top_k if top_k is None else top_k
+        token_budget = self.token_budget if token_budget is None else token_budget
+        serialize = serialize or dumps
+
+        index = self.indexes.get(collection_name)
+        if refresh or index is None:
+            index = self.refresh(collection_name)
+        with self._lock:
+            # The current index, unless it was invalidated since
+            index = self.indexes.get(collection_name, index)
+            candidates = [doc_id for doc_id, _ in index.search(question, top_k)]
+            if len(candidates) < top_k:
+                seen = set(candidates)
+                for doc_id in index.recent(top_k):
+                    if doc_id not in seen:
+                        candidates.append(doc_id)
+                        if len(candidates) >= top_k:
+                            break
+            docs = [index.docs[doc_id] for doc_id in candidates]
+            total = len(index)
+
+        selected = []
+        used_tokens = 0
+        for doc in docs:
+            cost = estimate_tokens(serialize(doc))
+            if selected and used_tokens + cost > token_budget:
+                break
+            selected.append(doc)
+            used_tokens += cost
+
+        logging.info(
+            f"Retrieved {len(selected)}/{total} documents from "
+            f"'{collection_name}' (~{used_tokens} tokens)"
+        )
+        return selected
+
+    def search(
+        self,
+        collection_name: str,
+        query: str,
+        limit: int,
+        predicate: Optional[Callable[[Dict], bool]] = None,
+        min_match: float = 0.0,
+        refresh: bool = True,
+    ) -> Tuple[List[Tuple[Dict, float]], int]:
+        """Ranked (document, score) matches for `query`, plus the number of
+        documents indexed. No recent-document padding, unlike `retrieve`."""
+        index = self.indexes.get(collection_name)
+        if refresh or index is None:
+            index = self.refresh(collection_name)
+        with self._lock:
+            index = self.indexes.get(collection_name, index)
+            ranked = index.search(query, limit, predicate, min_match)
+            return [(index.docs[doc_id], score) for doc_id, score in ranked], len(index)
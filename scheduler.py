@@ -0,0 +1,229 @@
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set, TypeVar
+
+T = TypeVar("T")
+
+# Scheduling settings (overridable from .env)
+CHAT_DEBOUNCE_SECONDS = float(os.getenv("CHAT_DEBOUNCE_SECONDS", "0.4"))
+GEMINI_RATE_PER_MINUTE = float(os.getenv("GEMINI_RATE_PER_MINUTE", "60"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "10"))
+
+
+class TokenBucket:
+    """Async token bucket. Callers over the limit wait in FIFO order instead
+    of failing, which slows producers down rather than dropping requests."""
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.waiting = 0
+        self.acquired = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        """Wait for a token; returns the time spent waiting."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    self._refill()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        break
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.acquired += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        return waited
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self.waiting,
+            "acquired": self.acquired,
+            "wait_avg_seconds": self.wait_total / self.acquired if self.acquired else 0.0,
+            "wait_max_seconds": self.wait_max,
+        }
+
+
+class ChatScheduler:
+    """Coalesces bursts of messages per chat into one LLM request.
+
+    Every new message restarts the chat's debounce timer and cancels a call
+    already in flight for that chat; the messages not yet answered are then
+    sent together as one question. Superseded callers get None back. With
+    `cached`, a question it can answer (e.g. from the answer cache) doesn't
+    take a token from the bucket.
+
+    `run` and `cached` call `replying(chat_id)` right before they send their
+    reply: from then on the messages they answer are no longer pending and
+    the call is no longer cancelled, so a reply is never sent twice.
+    """
+
+    def __init__(self, bucket: TokenBucket, debounce: float = CHAT_DEBOUNCE_SECONDS):
+        self.bucket = bucket
+        self.debounce = debounce
+        self.pending: Dict[int, List[str]] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+        # Calls in flight -> number of pending messages they answer
+        self.answering: Dict[asyncio.Task, int] = {}
+        self.replying_tasks: Set[asyncio.Task] = set()
+        self.submitted = 0
+        self.executed = 0
+        self.superseded = 0
+        self.cached = 0
+
+    async def submit(
+        self,
+        chat_id: int,
+        text: str,
+        run: Callable[[str], Awaitable[T]],
+        cached: Optional[Callable[[str], Awaitable[Optional[T]]]] = None,
+    ) -> Optional[T]:
+        self.submitted += 1
+        self.pending.setdefault(chat_id, []).append(text)
+
+        previous = self.tasks.get(chat_id)
+        if previous is not None and not previous.done() and previous not in self.replying_tasks:
+            previous.cancel()
+            self.superseded += 1
+
+        task = asyncio.create_task(self._run(chat_id, run, cached))
+        self.tasks[chat_id] = task
+        try:
+            # asyncio.wait doesn't raise when the task is cancelled by a newer
+            # message, only when this caller itself is cancelled
+            await asyncio.wait({task})
+        finally:
+            if self.tasks.get(chat_id) is task:
+                del self.tasks[chat_id]
+        if task.cancelled():
+            return None
+        return task.result()
+
+    async def _run(
+        self,
+        chat_id: int,
+        run: Callable[[str], Awaitable[T]],
+        cached: Optional[Callable[[str], Awaitable[Optional[T]]]],
+    ) -> T:
+        await asyncio.sleep(self.debounce)
+        texts = list(self.pending.get(chat_id, []))
+        question = "\n".join(texts)
+        task = asyncio.current_task()
+        self.answering[task] = len(texts)
+        try:
+            result = await cached(question) if cached is not None else None
+            if result is not None:
+                self.cached += 1
+            else:
+                await self.bucket.acquire()
+                result = await run(question)
+                self.executed += 1
+        except asyncio.CancelledError:
+            # Superseded before replying: these messages are answered by the
+            # next call
+            self.answering.pop(task, None)
+            raise
+        finally:
+            count = self.answering.pop(task, None)
+            if count is not None:
+                # Finished (or failed) without calling replying()
+                self._drop_answered(chat_id, count)
+            self.replying_tasks.discard(task)
+        return result
+
+    def replying(self, chat_id: int) -> None:
+        """Call from `run`/`cached` before sending the reply (see class docs)."""
+        task = asyncio.current_task()
+        count = self.answering.pop(task, None)
+        if count is None:
+            # Already marked, or not called from a scheduled call
+            return
+        self.replying_tasks.add(task)
+        self._drop_answered(chat_id, count)
+
+    def _drop_answered(self, chat_id: int, count: int) -> None:
+        # Messages that arrived during the call stay pending
+        remaining = self.pending.get(chat_id, [])[count:]
+        if remaining:
+            self.pending[chat_id] = remaining
+        else:
+            self.pending.pop(chat_id, None)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "submitted": self.submitted,
+            "executed": self.executed,
+            "superseded": self.superseded,
+            "cached": self.cached,
+            "active_chats": len(self.tasks),
+            **self.bucket.stats(),
+        }
+
+
+# Shared limiter for every Gemini call, and the per-chat scheduler on top of it
+gemini_bucket = TokenBucket(GEMINI_RATE_PER_MINUTE / 60.0, GEMINI_BURST)
+chat_scheduler = ChatScheduler(gemini_bucket)
+
+
+# Simulated burst benchmark: python scheduler.py
+if __name__ == "__main__":
+    import argparse
+    import random
+
+    parser = argparse.ArgumentParser(description="Simulated message bursts")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=4, help="messages per chat burst")
+    parser.add_argument("--gap", type=float, default=0.1, help="seconds between burst messages")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake LLM latency")
+    parser.add_argument("--rate", type=float, default=600, help="Gemini calls per minute")
+    args = parser.parse_args()
+
+    llm_calls = {"count": 0}
+
+    async def fake_llm(question: str) -> str:
+        llm_calls["count"] += 1
+        await asyncio.sleep(args.latency)
+        return f"answer to {question!r}"
+
+    async def chat(scheduler: ChatScheduler, chat_id: int) -> int:
+        answered = 0
+        await asyncio.sleep(random.random() * 0.2)
+        calls = []
+        for i in range(args.burst):
+            calls.append(asyncio.create_task(scheduler.submit(chat_id, f"msg {i}", fake_llm)))
+            await asyncio.sleep(args.gap)
+        for result in await asyncio.gather(*calls):
+            answered += result is not None
+        return answered
+
+    async def bench():
+        bucket = TokenBucket(args.rate / 60.0, GEMINI_BURST)
+        scheduler = ChatScheduler(bucket)
+        start = time.perf_counter()
+        answers = await asyncio.gather(*(chat(scheduler, i) for i in range(args.chats)))
+        elapsed = time.perf_counter() - start
+        messages = args.chats * args.burst
+        print(f"{messages} messages from {args.chats} chats in {elapsed:.2f}s")
+        print(f"LLM calls: {llm_calls['count']} (without coalescing: {messages})")
+        print(f"replies sent: {sum(answers)}")
+        print(f"scheduler: {scheduler.stats()}")
+
+    asyncio.run(bench())
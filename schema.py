@@ -0,0 +1,82 @@
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Union
+
+# Layouts seen in stored/parsed times ("2025-3-4 00:00", "2025-03-04T21:30", ...)
+_TIME_RE = re.compile(
+    r"^\s*(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?"
+)
+
+
+# Fields the app sets on stored documents for its own bookkeeping (reminder
+# claims); changing them doesn't change what a document says, so caches and
+# search indexes ignore updates that only touch these
+BOOKKEEPING_FIELDS = frozenset({"reminded_at"})
+
+
+def is_bookkeeping_update(change: Dict, fields=BOOKKEEPING_FIELDS) -> bool:
+    """True for a change-stream update event that only sets or unsets `fields`."""
+    if change.get("operationType") != "update":
+        return False
+    description = change.get("updateDescription") or {}
+    changed = {
+        path.split(".")[0]
+        for path in [
+            *(description.get("updatedFields") or {}),
+            *(description.get("removedFields") or []),
+        ]
+    }
+    return bool(changed) and changed <= fields
+
+
+def parse_time(value: Union[str, datetime, None]) -> Optional[datetime]:
+    """Normalize a stored or user-supplied time to a naive datetime.
+
+    Task times are wall-clock times as the user wrote them, so strings get no
+    timezone conversion; an aware datetime is converted to naive local time
+    so it compares with the rest. Returns None when the value can't be parsed.
+    """
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    if value is None or isinstance(value, datetime):
+        return value
+    match = _TIME_RE.match(str(value))
+    if not match:
+        return None
+    year, month, day, hour, minute, second = (int(g) if g else 0 for g in match.groups())
+    try:
+        return datetime(year, month, day, hour, minute, second)
+    except ValueError:
+        return None
+
+
+def local_time(utc: datetime) -> datetime:
+    """Naive local wall-clock time for a naive (or aware) UTC datetime."""
+    if utc.tzinfo is None:
+        utc = utc.replace(tzinfo=timezone.utc)
+    return utc.astimezone().replace(tzinfo=None)
+
+
+def build_document(
+    description: str,
+    doc_type: str,
+    time: Union[str, datetime, None] = None,
+    chat_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Create a document for the `data` collection in the normalized schema.
+
+    Every document has a BSON datetime `time` (defaulting to the creation time
+    for notes), a `created_at` timestamp and the originating `chat_id`. `time`
+    is local wall-clock time like parsed task times; only `created_at` is UTC.
+    """
+    created_at = datetime.utcnow()
+    normalized_time = parse_time(time)
+    if time is not None and normalized_time is None:
+        raise ValueError(f"Invalid time: {time}")
+    return {
+        "description": description,
+        "type": doc_type,
+        "time": normalized_time or local_time(created_at),
+        "created_at": created_at,
+        "chat_id": chat_id,
+    }
@@ -0,0 +1,233 @@
+import os
+import time
+import logging
+from typing import Any, Dict, List, Optional
+from database import get_db
+from metadata import CollectionMetadata, collection_metadata
+from retrieval import DocumentRetriever, tokenize
+
+# Search settings (overridable from .env)
+SEARCH_DEFAULT_LIMIT = int(os.getenv("SEARCH_DEFAULT_LIMIT", "10"))
+# Share of the query's terms a result must contain (1.0 = all of them)
+SEARCH_MIN_MATCH = float(os.getenv("SEARCH_MIN_MATCH", "0.75"))
+# Seconds between checks for documents written by other processes
+SEARCH_REFRESH_INTERVAL = float(os.getenv("SEARCH_REFRESH_INTERVAL", "2"))
+
+SEARCH_COLLECTION = "data"
+
+
+class NoteSearch:
+    """Keyword search over notes and tasks, answered from an in-memory BM25
+    index (see retrieval.TextIndex) without calling Gemini.
+
+    The index picks up new documents incrementally (`_id` newer than the
+    last one indexed). It is refreshed right after this process writes to
+    the collection (`mark_stale`, called by the write buffer) and at most
+    every `refresh_interval` seconds otherwise, so most searches don't touch
+    MongoDB at all. Edits and deletes (by any process) are picked up from
+    `metadata`, which the app keeps running whether or not it runs the bot.
+    """
+
+    def __init__(
+        self,
+        get_database=get_db,
+        min_match: float = SEARCH_MIN_MATCH,
+        refresh_interval: float = SEARCH_REFRESH_INTERVAL,
+        metadata: Optional[CollectionMetadata] = collection_metadata,
+    ):
+        self.get_database = get_database
+        self.min_match = min_match
+        self.refresh_interval = refresh_interval
+        self._retriever: Optional[DocumentRetriever] = None
+        self.stale = True
+        self.checked_at = 0.0
+        self.searches = 0
+        self.total_ms = 0.0
+        if metadata is not None:
+            metadata.add_listener(self._on_collection_change)
+
+    @property
+    def retriever(self) -> DocumentRetriever:
+        # Created on first use so importing this module doesn't connect
+        if self._retriever is None:
+            self._retriever = DocumentRetriever(self.get_database())
+        return self._retriever
+
+    def mark_stale(self, collection_name: str) -> None:
+        if collection_name == SEARCH_COLLECTION:
+            self.stale = True
+
+    def _on_collection_change(self, collection_name: str, operation: str) -> None:
+        if collection_name != SEARCH_COLLECTION:
+            return
+        if operation == "insert":
+            self.mark_stale(collection_name)
+        elif self._retriever is not None:
+            # The index only picks up new _ids incrementally
+            self._retriever.invalidate(collection_name)
+
+    def search(
+        self,
+        query: str,
+        limit: int = SEARCH_DEFAULT_LIMIT,
+        doc_type: Optional[str] = None,
+        chat_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Best matches for `query`, optionally of one type and/or one chat.
+
+        With `chat_id`, documents without a chat (added through the API)
+        are included too.
+        """
+        start = time.perf_counter()
+        now = time.monotonic()
+        refresh = self.stale or now - self.checked_at >= self.refresh_interval
+        if refresh:
+            self.stale = False
+            self.checked_at = now
+
+        def accept(doc: Dict) -> bool:
+            if doc_type is not None and doc.get("type") != doc_type:
+                return False
+            return chat_id is None or doc.get("chat_id") in (chat_id, None)
+
+        filtered = doc_type is not None or chat_id is not None
+        results, indexed = self.retriever.search(
+            SEARCH_COLLECTION,
+            query,
+            limit,
+            predicate=accept if filtered else None,
+            min_match=self.min_match,
+            refresh=refresh,
+        )
+        took_ms = (time.perf_counter() - start) * 1000
+        self.searches += 1
+        self.total_ms += took_ms
+        logging.info(f"Search {query!r}: {len(results)} results of {indexed} in {took_ms:.1f} ms")
+        return {"results": results, "indexed": indexed, "took_ms": took_ms}
+
+    def stats(self) -> Dict[str, Any]:
+        index = self._retriever.indexes.get(SEARCH_COLLECTION) if self._retriever else None
+        return {
+            "indexed": len(index) if index is not None else 0,
+            "terms": len(index.postings) if index is not None else 0,
+            "searches": self.searches,
+            "avg_ms": self.total_ms / self.searches if self.searches else 0.0,
+        }
+
+
+# Shared by /search, the bot's /find and (for the data collection) the
+# analyzer's retrieval, so the data is indexed once per process
+note_search = NoteSearch()
+
+
+def format_results(results: List, time_format: str = "%Y-%m-%d %H:%M") -> List[str]:
+    """One line per (document, score) result, for chat replies."""
+    lines = []
+    for doc, _ in results:
+        when = doc.get("time")
+        when = when.strftime(time_format) if hasattr(when, "strftime") else when
+        prefix = f"[{doc.get('type', 'data')}]" + (f" {when}" if when else "")
+        lines.append(f"• {prefix} - {doc.get('description', '')}")
+    return lines
+
+
+# Index build and query latency at 100k documents (mongomock or MONGODB_URI):
+# python search.py --docs 100000
+if __name__ == "__main__":
+    import random
+    import argparse
+    from datetime import datetime, timedelta
+    from bson import ObjectId
+
+    parser = argparse.ArgumentParser(description="Search benchmark")
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--mongo-uri", default="", help="default: mongomock")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        import pymongo
+
+        db = pymongo.MongoClient(args.mongo_uri)["search_bench"]
+    else:
+        import mongomock
+
+        db = mongomock.MongoClient()["search_bench"]
+
+    # Zipf-weighted vocabulary, so some terms are common and most are rare
+    english = (
+        "buy milk call bank meeting team dentist appointment pay rent ideas trip "
+        "report deadline email client invoice groceries gym flight hotel book "
+        "birthday gift mom dad kids school pickup car insurance doctor pharmacy "
+        "project review budget plan lunch dinner coffee friend garden repair "
+        "laptop phone password backup tax visa passport renew library movie"
+    ).split()
+    thai = (
+        "ซื้อ ของ บ้าน ประชุม ทีม นัด หมอ ฟัน โทร แม่ จ่าย ค่าไฟ ค่าน้ำ รับ ลูก "
+        "โรงเรียน ส่ง รายงาน ประจำเดือน ลูกค้า ใบแจ้งหนี้ ตลาด ออกกำลังกาย "
+        "เที่ยวบิน โรงแรม วันเกิด ของขวัญ ประกัน รถ ร้านยา โครงการ งบประมาณ "
+        "อาหารกลางวัน กาแฟ เพื่อน สวน ซ่อม คอมพิวเตอร์ โทรศัพท์ ภาษี วีซ่า "
+        "หนังสือเดินทาง ห้องสมุด หนัง"
+    ).split()
+    vocabulary = english + thai
+    rng = random.Random(0)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    rng.shuffle(vocabulary)
+
+    def description() -> str:
+        picked = rng.choices(vocabulary, weights, k=rng.randint(3, 8))
+        # Thai words are written without spaces between them
+        return "".join(w if w in thai else f" {w} " for w in picked).strip()
+
+    start_time = datetime(2025, 1, 1)
+    collection = db[SEARCH_COLLECTION]
+    collection.drop()
+    collection.insert_many(
+        {
+            # Written over time, as in real use (not all within the refresh
+            # overlap window, see retrieval.find_newer)
+            "_id": ObjectId.from_datetime(start_time + timedelta(minutes=i)),
+            "description": description(),
+            "type": rng.choice(["note", "task"]),
+            "time": start_time + timedelta(minutes=i),
+            "chat_id": rng.randrange(10),
+        }
+        for i in range(args.docs)
+    )
+
+    search = NoteSearch(lambda: db, metadata=None)
+    start = time.perf_counter()
+    search.search("warm up")
+    print(
+        f"index build (fetch + index), {args.docs} docs: {time.perf_counter() - start:.2f}s, "
+        f"{search.stats()['terms']} terms"
+    )
+    if not args.mongo_uri:
+        # mongomock has no _id index, so the periodic "newer _id" check
+        # scans the whole collection; leave it out of the query timings
+        search.refresh_interval = float("inf")
+
+    timings = []
+    for i in range(args.queries):
+        picked = rng.sample(vocabulary, rng.randint(1, 2))
+        query = "".join(w if w in thai else f" {w} " for w in picked).strip()
+        start = time.perf_counter()
+        search.search(query, chat_id=i % 10 if i % 2 else None)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(
+        f"{args.queries} random queries: p50 {timings[len(timings) // 2]:.1f} ms, "
+        f"p95 {timings[int(len(timings) * 0.95)]:.1f} ms, max {timings[-1]:.1f} ms"
+    )
+    # Worst case: the most frequent word matches a large share of all notes
+    common = vocabulary[0]
+    found = search.search(common)
+    print(f"most common word {common!r}: {found['took_ms']:.1f} ms")
+
+    # Incremental update: one new document is searchable on the next query
+    collection.insert_one({"description": "ต่อทะเบียนรถ", "type": "task", "time": datetime.now()})
+    search.mark_stale(SEARCH_COLLECTION)
+    start = time.perf_counter()
+    found = search.search("ทะเบียนรถ")["results"]
+    print(f"after insert (incl. MongoDB check): {len(found)} hit in {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(f"terms for 'นัดหมอฟัน': {tokenize('นัดหมอฟัน')}")
@@ -0,0 +1,129 @@
+import json
+import base64
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Optional
+from bson import ObjectId
+
+try:
+    # Optional fast encoder: pip install orjson
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _scalar(value: Any, datetime_format: Optional[str]) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.strftime(datetime_format) if datetime_format else value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    if isinstance(value, Decimal) or type(value).__name__ == "Decimal128":
+        return str(value)
+    return value
+
+
+def to_jsonable(value: Any, datetime_format: Optional[str] = None) -> Any:
+    """Convert a BSON document (or any nested value) to JSON-safe types in a
+    single pass: ObjectId -> str, datetime -> ISO string (or
+    `datetime_format`), bytes -> base64, Decimal128 -> str.
+    """
+    if isinstance(value, dict):
+        return {key: to_jsonable(item, datetime_format) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item, datetime_format) for item in value]
+    return _scalar(value, datetime_format)
+
+
+def _default(obj: Any) -> Any:
+    converted = _scalar(obj, None)
+    if converted is obj:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return converted
+
+
+def dumps(value: Any, indent: bool = False) -> str:
+    """Serialize BSON documents straight to a JSON string (no intermediate
+    conversion), using orjson when it is installed."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(value, default=_default, option=option).decode()
+    return json.dumps(
+        value,
+        default=_default,
+        ensure_ascii=False,
+        indent=2 if indent else None,
+        separators=None if indent else (",", ":"),
+    )
+
+
+# Micro-benchmark: python serialization.py
+if __name__ == "__main__":
+    import time
+    from typing import Iterable, Iterator
+
+    class JSONEncoder(json.JSONEncoder):
+        # The encoder fetch.py and /table used before dumps()
+        def default(self, obj):
+            if isinstance(obj, ObjectId):
+                return str(obj)
+            if isinstance(obj, datetime):
+                return obj.isoformat()
+            if hasattr(obj, '__dict__'):
+                return obj.__dict__
+            return super().default(obj)
+
+    def iter_json_array(docs: Iterable[Any]) -> Iterator[str]:
+        """A JSON array chunk by chunk, one document at a time."""
+        yield "["
+        first = True
+        for doc in docs:
+            yield dumps(doc) if first else "," + dumps(doc)
+            first = False
+        yield "]"
+
+    def make_doc(i: int) -> dict:
+        return {
+            "_id": ObjectId(),
+            "name": f"item {i}",
+            "created_at": datetime.utcnow(),
+            "tags": [f"tag{j}" for j in range(10)],
+            "history": [
+                {"at": datetime.utcnow(), "by": ObjectId(), "note": "x" * 50}
+                for _ in range(10)
+            ],
+            "nested": {"a": {"b": {"c": [1, 2, 3], "d": datetime.utcnow()}}},
+        }
+
+    docs = [make_doc(i) for i in range(5000)]
+
+    def old_path():
+        # What fetch.py + /table did: double round-trip, then dump again
+        formatted = []
+        for item in docs:
+            formatted_item = {}
+            for key, value in item.items():
+                if isinstance(value, ObjectId):
+                    formatted_item[key] = str(value)
+                elif isinstance(value, datetime):
+                    formatted_item[key] = value.isoformat()
+                elif isinstance(value, (dict, list)):
+                    formatted_item[key] = json.loads(json.dumps(value, cls=JSONEncoder))
+                else:
+                    formatted_item[key] = value
+            formatted.append(formatted_item)
+        return json.dumps(formatted, cls=JSONEncoder, indent=2)
+
+    def new_path():
+        return dumps(docs, indent=True)
+
+    def streamed():
+        return "".join(iter_json_array(docs))
+
+    encoder = "orjson" if orjson is not None else "json"
+    for name, func in [("old double round-trip", old_path), (f"dumps ({encoder})", new_path), ("iter_json_array", streamed)]:
+        start = time.perf_counter()
+        for _ in range(3):
+            func()
+        print(f"{name:24s} {(time.perf_counter() - start) / 3 * 1000:8.1f} ms for {len(docs)} docs")
@@ -0,0 +1,240 @@
+import os
+import re
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from serialization import dumps
+from retrieval import estimate_tokens
+from llm_backend import GEMINI_MODEL
+
+# Snapshot settings (overridable from .env)
+SNAPSHOT_COLLECTIONS = [
+    name.strip() for name in os.getenv("SNAPSHOT_COLLECTIONS", "about,menus").split(",") if name.strip()
+]
+SNAPSHOT_DROP_FIELDS = {
+    name.strip()
+    for name in os.getenv("SNAPSHOT_DROP_FIELDS", "_id,last_updated,created_at").split(",")
+    if name.strip()
+}
+# Larger collections go through retrieval instead
+SNAPSHOT_MAX_TOKENS = int(os.getenv("SNAPSHOT_MAX_TOKENS", "8000"))
+
+# Gemini context caching (only used for snapshots at least this large); the
+# cached model is the one answering (GEMINI_MODEL)
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "4096"))
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+
+LANGUAGES = ("th", "en")
+_THAI_RE = re.compile(r"[฀-๿]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def detect_language(text: str) -> str:
+    """'th' if the text contains Thai characters, else 'en'."""
+    return "th" if _THAI_RE.search(text) else "en"
+
+
+def compact_text(text: str) -> str:
+    """Drop markdown bold markers and collapse whitespace."""
+    return _SPACE_RE.sub(" ", text.replace("**", "")).strip()
+
+
+def localize(value: Any, language: str, drop_fields=SNAPSHOT_DROP_FIELDS) -> Any:
+    """Keep one language of a document and drop unneeded fields.
+
+    Handles both shapes used in this repo: `{"th": ..., "en": ...}` values
+    (about) and `field`/`fieldE` pairs (menus, where `fieldE` is English;
+    the kept variant is stored under `field`).
+    """
+    if isinstance(value, dict):
+        if value and set(value) <= set(LANGUAGES):
+            chosen = value.get(language, next(iter(value.values())))
+            return localize(chosen, language, drop_fields)
+        result = {}
+        for key, item in value.items():
+            if key in drop_fields:
+                continue
+            if key.endswith("E") and key[:-1] in value:
+                if language == "en":
+                    result[key[:-1]] = localize(item, language, drop_fields)
+                continue
+            if language == "en" and key + "E" in value:
+                continue
+            result[key] = localize(item, language, drop_fields)
+        return result
+    if isinstance(value, (list, tuple)):
+        return [localize(item, language, drop_fields) for item in value]
+    if isinstance(value, str):
+        return compact_text(value)
+    return value
+
+
+class Snapshot:
+    def __init__(self, text: str, version: int, source_chars: int):
+        self.text = text
+        self.version = version
+        self.tokens = estimate_tokens(text)
+        self.source_chars = source_chars
+        self.built_at = time.time()
+
+
+class GeminiContextCache:
+    """Keeps a Gemini cached-content model per snapshot, so the snapshot's
+    input tokens are billed at the cached rate on repeated questions.
+
+    Snapshots below `min_tokens` are skipped (Gemini rejects small caches).
+    After a failure caching is retried no sooner than 10 minutes later.
+    """
+
+    def __init__(
+        self,
+        model_name: str = GEMINI_MODEL,
+        ttl: int = GEMINI_CACHE_TTL,
+        min_tokens: int = GEMINI_CACHE_MIN_TOKENS,
+    ):
+        # Cached content names the model as "models/<name>"
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        # key -> (version, expires_at, cached content, model)
+        self.entries: Dict[Tuple[str, str], Tuple[int, float, Any, Any]] = {}
+        self.retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def model_for(self, key: Tuple[str, str], snapshot: Snapshot):
+        """Model bound to a cached copy of `snapshot`, or None."""
+        if snapshot.tokens < self.min_tokens:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(key)
+            # Renew a minute early so a request never races the expiry
+            if entry and entry[0] == snapshot.version and entry[1] - 60 > now:
+                return entry[3]
+            if now < self.retry_at:
+                return None
+            try:
+                import google.generativeai as genai
+                from google.generativeai import caching
+
+                if entry:
+                    try:
+                        entry[2].delete()
+                    except Exception:
+                        pass
+                cached = caching.CachedContent.create(
+                    model=self.model_name,
+                    display_name=f"{key[0]}-{key[1]}-v{snapshot.version}",
+                    contents=[snapshot.text],
+                    ttl=self.ttl,
+                )
+                model = genai.GenerativeModel.from_cached_content(cached)
+            except Exception as e:
+                logging.warning(f"Gemini context caching unavailable: {str(e)}")
+                self.entries.pop(key, None)
+                self.retry_at = now + 600
+                return None
+            self.entries[key] = (snapshot.version, now + self.ttl, cached, model)
+            logging.info(f"Created Gemini context cache for {key} (~{snapshot.tokens} tokens)")
+            return model
+
+
+class ContextSnapshots:
+    """Pre-rendered, minified prompt context per collection and language.
+
+    A snapshot is rebuilt only when the collection's metadata version
+    changes, so repeated questions about nearly static collections (about,
+    menus) don't re-fetch or re-serialize anything.
+    """
+
+    def __init__(
+        self,
+        db,
+        metadata,
+        collections: List[str] = SNAPSHOT_COLLECTIONS,
+        max_tokens: int = SNAPSHOT_MAX_TOKENS,
+        context_cache: Optional[GeminiContextCache] = None,
+    ):
+        self.db = db
+        self.metadata = metadata
+        self.collections = set(collections)
+        self.max_tokens = max_tokens
+        self.context_cache = context_cache
+        self.snapshots: Dict[Tuple[str, str], Snapshot] = {}
+        self.builds = 0
+        self._lock = threading.Lock()
+
+    def covers(self, collection_name: str) -> bool:
+        return collection_name in self.collections
+
+    def _build(self, collection_name: str, version: int) -> None:
+        docs = list(self.db[collection_name].find())
+        source_chars = len(dumps(docs, indent=True))
+        for language in LANGUAGES:
+            text = dumps([localize(doc, language) for doc in docs])
+            self.snapshots[(collection_name, language)] = Snapshot(text, version, source_chars)
+        self.builds += 1
+        logging.info(
+            f"Built context snapshots for '{collection_name}' v{version}: "
+            f"{source_chars} chars -> "
+            + ", ".join(
+                f"{language} {len(self.snapshots[(collection_name, language)].text)}"
+                for language in LANGUAGES
+            )
+        )
+
+    def get(self, collection_name: str, language: str) -> Optional[Snapshot]:
+        """Current snapshot, or None if the collection isn't snapshotted or
+        is too large for one."""
+        if not self.covers(collection_name):
+            return None
+        version = self.metadata.version(collection_name)
+        key = (collection_name, language)
+        with self._lock:
+            snapshot = self.snapshots.get(key)
+            if snapshot is None or snapshot.version != version:
+                self._build(collection_name, version)
+                snapshot = self.snapshots[key]
+        if snapshot.tokens > self.max_tokens:
+            return None
+        return snapshot
+
+    def model_for(self, collection_name: str, language: str, snapshot: Snapshot):
+        """Gemini model with the snapshot in its cached context, or None."""
+        if self.context_cache is None:
+            return None
+        return self.context_cache.model_for((collection_name, language), snapshot)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "builds": self.builds,
+                "snapshots": {
+                    f"{name}/{language}": {
+                        "version": snapshot.version,
+                        "chars": len(snapshot.text),
+                        "source_chars": snapshot.source_chars,
+                        "tokens": snapshot.tokens,
+                    }
+                    for (name, language), snapshot in self.snapshots.items()
+                },
+            }
+
+
+# Size comparison on the bundled menu export: python snapshots.py
+if __name__ == "__main__":
+    import json
+
+    with open("restaurant.menus.json", encoding="utf-8") as f:
+        menus = json.load(f)
+    before = dumps(menus, indent=True)
+    print(f"{'full, indent=2':16s} {len(before):7d} chars ~{estimate_tokens(before)} tokens")
+    for language in LANGUAGES:
+        text = dumps([localize(doc, language) for doc in menus])
+        print(f"{'snapshot ' + language:16s} {len(text):7d} chars ~{estimate_tokens(text)} tokens")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        dumps(menus, indent=True)
+    print(f"serialize per question (old): {(time.perf_counter() - start) * 10:.2f} ms")
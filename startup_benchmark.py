@@ -0,0 +1,118 @@
+"""Cold-start benchmark: import times and how soon the API answers.
+
+    python startup_benchmark.py
+    python startup_benchmark.py --mongo-uri mongodb://localhost:27017/
+
+Each measurement runs in a fresh interpreter. "live" is the time from
+spawning the server until /health/live answers, "ready" until /health/ready
+returns 200, once with BOT_STARTUP=background and once with blocking. Without
+--mongo-uri the server uses mongomock. Without a TELEGRAM_BOT_TOKEN bot setup
+stops right after importing the bot module, so with a real token (and the
+Bot API round-trips) "ready" comes later still.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+# Imported by the bot and analyzer, but not needed to serve HTTP
+HEAVY_MODULES = ["telegram", "google.generativeai", "pandas", "telegram_bot", "llm"]
+
+_SERVER = """
+import sys
+if not sys.argv[2]:
+    import mongomock
+    import database
+    database.set_client(mongomock.MongoClient())
+import uvicorn
+import main
+uvicorn.run(main.app, host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+"""
+
+
+def import_time(module: str, runs: int) -> float:
+    """Median seconds to import `module` in a fresh interpreter."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def loaded_by(module: str) -> list:
+    code = f"import sys, json; import {module}\n"
+    code += f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, start: float, timeout: float) -> float:
+    """Seconds since `start` until `url` returns 200."""
+    while time.perf_counter() - start < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - start
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def serve_times(mode: str, mongo_uri: str, timeout: float) -> tuple:
+    port = free_port()
+    env = {**os.environ, "BOT_STARTUP": mode, "BOT_RUNNER": "embedded"}
+    if mongo_uri:
+        env["MONGODB_URI"] = mongo_uri
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-c", _SERVER, str(port), mongo_uri],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        live = wait_for(f"http://127.0.0.1:{port}/health/live", start, timeout)
+        ready = wait_for(f"http://127.0.0.1:{port}/health/ready", start, timeout)
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health") as response:
+            bot = json.load(response)["bot"]
+        return live, ready, bot
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mongo-uri", default="", help="default: mongomock")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    for module in ("main", "telegram_bot"):
+        print(f"import {module}: {import_time(module, args.runs) * 1000:.0f} ms (median of {args.runs})")
+    print(f"heavy modules loaded by 'import main': {loaded_by('main') or 'none'}")
+
+    for mode in ("background", "blocking"):
+        results = [serve_times(mode, args.mongo_uri, args.timeout) for _ in range(args.runs)]
+        live = statistics.median(r[0] for r in results)
+        ready = statistics.median(r[1] for r in results)
+        print(f"BOT_STARTUP={mode}: live after {live * 1000:.0f} ms, ready after "
+              f"{ready * 1000:.0f} ms (bot: {results[-1][2]})")
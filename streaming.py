@@ -0,0 +1,160 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Callable, Iterable, List, Optional
+from concurrency import BoundedExecutor, llm_executor
+from metrics import metrics
+
+# Streaming settings (overridable from .env)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+# Telegram allows roughly one edit per second per chat
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+# Replaces a partly streamed answer that is cancelled (e.g. on shutdown)
+STREAM_CANCELLED_TEXT = os.getenv("STREAM_CANCELLED_TEXT", "⏹️ (Answer interrupted)")
+# Sent when the model streams no text at all (e.g. a safety-blocked answer)
+STREAM_EMPTY_TEXT = os.getenv(
+    "STREAM_EMPTY_TEXT", "Sorry, I couldn't come up with an answer to that. Please try rephrasing."
+)
+
+_DONE = object()
+
+
+async def iterate_in_executor(
+    make_iterator: Callable[[], Iterable[str]],
+    executor: BoundedExecutor = llm_executor,
+) -> AsyncIterator[str]:
+    """Consume a blocking iterator (e.g. a Gemini stream) in a worker thread
+    and yield its items on the event loop as they arrive. If the consumer
+    stops early (e.g. cancelled), the iterator is closed after its current
+    item instead of being read to the end."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stopped = threading.Event()
+
+    def produce():
+        iterator = None
+        try:
+            iterator = make_iterator()
+            for item in iterator:
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            if stopped.is_set() and hasattr(iterator, "close"):
+                # Generators (stream_collection_with_llm) stop pulling chunks
+                iterator.close()
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+    producer = asyncio.ensure_future(executor.run(produce))
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        await producer
+
+
+async def stream_to_message(
+    message,
+    chunks: AsyncIterator[str],
+    edit_interval: float = STREAM_EDIT_INTERVAL,
+    clock: Callable[[], float] = time.monotonic,
+    cancelled_text: str = STREAM_CANCELLED_TEXT,
+    empty_text: str = STREAM_EMPTY_TEXT,
+    on_reply: Optional[Callable[[], None]] = None,
+) -> str:
+    """Reply to `message` with the first chunk, then edit the reply as more
+    text arrives, at most once per `edit_interval` seconds.
+
+    Returns the full text. The final edit always happens, so the message ends
+    up complete even if the last chunks arrived inside the interval. If the
+    stream is cancelled, a reply already sent is replaced by `cancelled_text`
+    rather than left half-written. If the stream has no text at all,
+    `empty_text` is sent instead and "" returned. `on_reply` is called right
+    before the first message is sent (see ChatScheduler.replying).
+    """
+    text = ""
+    sent = None
+    shown = ""
+    last_edit = 0.0
+
+    try:
+        async for chunk in chunks:
+            text += chunk
+            if not text.strip():
+                continue
+            if sent is None:
+                if on_reply is not None:
+                    on_reply()
+                with metrics.timer("telegram_reply"):
+                    sent = await message.reply_text(text)
+                shown = text
+                last_edit = clock()
+            elif clock() - last_edit >= edit_interval and text != shown:
+                with metrics.timer("telegram_edit"):
+                    await sent.edit_text(text)
+                shown = text
+                last_edit = clock()
+    except asyncio.CancelledError:
+        if sent is not None:
+            try:
+                await sent.edit_text(cancelled_text)
+            except Exception as e:
+                logging.warning(f"Could not mark a cancelled reply: {str(e)}")
+        raise
+
+    if sent is None:
+        if on_reply is not None:
+            on_reply()
+        with metrics.timer("telegram_reply"):
+            await message.reply_text(empty_text)
+        return ""
+    if text != shown:
+        with metrics.timer("telegram_edit"):
+            await sent.edit_text(text)
+    return text
+
+
+# Demo: stream a fake answer into a fake Telegram message and show timings
+if __name__ == "__main__":
+    from llm_backend import FakeModel
+
+    class FakeMessage:
+        def __init__(self, started: float):
+            self.started = started
+            self.edits: List[str] = []
+
+        async def reply_text(self, text: str):
+            print(f"{time.perf_counter() - self.started:.2f}s reply: {text!r}")
+            return self
+
+        async def edit_text(self, text: str):
+            self.edits.append(text)
+            print(f"{time.perf_counter() - self.started:.2f}s edit:  {text!r}")
+            return self
+
+    async def demo():
+        model = FakeModel(
+            reply=" ".join(f"word{i}" for i in range(30)),
+            first_token_delay=0.5,
+            chunk_delay=0.1,
+        )
+        started = time.perf_counter()
+        message = FakeMessage(started)
+        chunks = iterate_in_executor(
+            lambda: (c.text for c in model.generate_content("q", stream=True))
+        )
+        await stream_to_message(message, chunks, edit_interval=1.0)
+        print(f"done in {time.perf_counter() - started:.2f}s, {len(message.edits)} edits")
+        llm_executor.shutdown()
+
+    asyncio.run(demo())
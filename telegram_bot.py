@@ -1,6 +1,8 @@
 import os
+import asyncio
 import logging
 from datetime import datetime
+from typing import Optional
 import re
 import json
 from dotenv import load_dotenv
@@ -13,6 +15,21 @@ from telegram.ext import (
     ContextTypes,
 )
 from llm import MongoDBLLMAnalyzer
+from answer_cache import answer_cache
+from database import get_client, MONGODB_URI, MONGODB_DB
+from schema import build_document
+from chat_memory import create_chat_memory
+from time_parser import parse_task, parser_stats, TASK_PARSER_MIN_CONFIDENCE
+from concurrency import run_llm, run_db, shutdown_executors
+from scheduler import chat_scheduler, gemini_bucket
+from metrics import metrics
+from write_buffer import write_buffer
+from search import note_search, format_results
+from metadata import collection_metadata
+from reminders import REMINDERS_ENABLED, reminder_scheduler, format_reminder
+from intent_router import intent_router, collection_for
+from bot_runner import BOT_MODE, WEBHOOK_SECRET
+from streaming import STREAM_RESPONSES, iterate_in_executor, stream_to_message
 
 # Enable logging
 logging.basicConfig(
@@ -23,29 +40,46 @@ logger = logging.getLogger(__name__)
 # Load environment variables from .env file
 load_dotenv()
 
-# Get token and allowed chat IDs from environment variables
+# Get token and allowed chat IDs from environment variables (the token is
+# checked in setup_bot, so the API can import this module without one)
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-if not TOKEN:
-    raise ValueError("No TOKEN provided in .env file")
 
 ALLOWED_CHAT_IDS = os.getenv("ALLOWED_CHAT_IDS", "").split(",")
 ALLOWED_CHAT_IDS = [
     int(chat_id.strip()) for chat_id in ALLOWED_CHAT_IDS if chat_id.strip()
 ]
 
+# Number of updates processed at once (python-telegram-bot handles them one by
+# one unless told otherwise)
+CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "32"))
+
+# Update ingestion (BOT_MODE, WEBHOOK_SECRET: see bot_runner)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Must match the route in main.py
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+
 # Global application variable
 application = None
 analyzer = None
+chat_memory = None
+update_queue = None
+update_workers = []
 
 
-def initialize_analyzer():
-    global analyzer
+def initialize_analyzer(model=None):
+    global analyzer, chat_memory
     try:
         analyzer = MongoDBLLMAnalyzer(
-            connection_string="mongodb://localhost:27017/",
-            db_name="telegram-secretary-bot",
+            connection_string=MONGODB_URI,
+            db_name=MONGODB_DB,
+            client=get_client(),
+            model=model,
+            retriever=note_search.retriever,
+            metadata=collection_metadata,
         )
         logger.info("MongoDB LLM Analyzer initialized successfully")
+        chat_memory = create_chat_memory(analyzer.db)
     except Exception as e:
         logger.error(f"Failed to initialize MongoDB LLM Analyzer: {str(e)}")
         raise
@@ -76,27 +110,82 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         chat_id = update.effective_chat.id
         if not ALLOWED_CHAT_IDS or chat_id in ALLOWED_CHAT_IDS:
             text = update.message.text
+            contexts = {}
 
-            # Get chat context from user data
-            if not context.user_data.get("chat_history"):
-                context.user_data["chat_history"] = []
-
-            # Add user message to history
-            context.user_data["chat_history"].append(f"User: {text}")
-
-            # Keep only last 10 messages for context
-            chat_history = context.user_data["chat_history"][-10:]
-            context_str = "\n".join(chat_history)
-
-            # Get response from LLM
-            response = analyzer.analyze_collection_with_llm(
-                collection_name="data", question=text, context=context_str
-            )
-
-            # Add bot response to history
-            context.user_data["chat_history"].append(f"Assistant: {response}")
+            async def memory_context(question: str) -> str:
+                # Bounded per-chat history (older turns are summarized)
+                if question not in contexts:
+                    contexts[question] = await run_db(
+                        chat_memory.context, chat_id, f"User: {question}"
+                    )
+                return contexts[question]
+
+            async def reply(question: str, response: str) -> str:
+                # From here on a newer message no longer cancels this answer
+                chat_scheduler.replying(chat_id)
+                with metrics.timer("telegram_reply"):
+                    await update.message.reply_text(response)
+                # Add the exchange to history
+                await run_db(chat_memory.record_exchange, chat_id, question, response)
+                return response
+
+            async def cached(question: str) -> Optional[str]:
+                # Checked before a Gemini rate-limit token is taken
+                response = answer_cache.get(
+                    collection_for(question), question, await memory_context(question)
+                )
+                if response is None:
+                    return None
+                logger.info(f"Answer cache hit for question: {question}")
+                return await reply(question, response)
+
+            async def answer(question: str) -> str:
+                context_str = await memory_context(question)
+                # Restaurant menu/about questions are answered from RESTAURANT_DB
+                collection_name = collection_for(question)
+                if not STREAM_RESPONSES:
+                    # Get response from LLM
+                    response = await run_llm(
+                        analyzer.analyze_collection_with_llm,
+                        collection_name=collection_name,
+                        question=question,
+                        context=context_str,
+                        check_cache=False,
+                    )
+                    return await reply(question, response)
+
+                # Stream the answer, editing the reply as chunks arrive
+                chunks = iterate_in_executor(
+                    lambda: analyzer.stream_collection_with_llm(
+                        collection_name=collection_name,
+                        question=question,
+                        context=context_str,
+                        check_cache=False,
+                    )
+                )
+                response = await stream_to_message(
+                    update.message, chunks, on_reply=lambda: chat_scheduler.replying(chat_id)
+                )
+                if response:
+                    # Not when only the fallback for an empty answer was sent
+                    await run_db(chat_memory.record_exchange, chat_id, question, response)
+                return response
+
+            # Structured lookups are answered from MongoDB without the LLM
+            routed = await run_db(intent_router.route, text, chat_id)
+            if routed is not None:
+                with metrics.timer("telegram_reply"):
+                    await update.message.reply_text(routed.reply)
+                await run_db(chat_memory.record_exchange, chat_id, text, routed.reply)
+                logger.info(f"Message from {chat_id} answered by route '{routed.intent}'")
+                return
+
+            # Bursts from one chat are merged into a single rate-limited call
+            response = await chat_scheduler.submit(chat_id, text, answer, cached)
+            if response is None:
+                logger.info(f"Message from {chat_id} merged into a newer request")
+                return
 
-            await update.message.reply_text(response)
             logger.info(f"Message from {chat_id}: {text}")
             logger.info(f"Response: {response}")
     except Exception as e:
@@ -132,11 +221,11 @@ async def note_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
             if note_text:
                 # Create note document
-                note_doc = {"description": note_text, "type": "note"}
+                note_doc = build_document(note_text, "note", chat_id=chat_id)
 
-                # Save to MongoDB
-                data_collection = analyzer.db["data"]
-                data_collection.insert_one(note_doc)
+                # Save to MongoDB (batched; returns once the note is written)
+                with metrics.timer("mongo_insert"):
+                    await write_buffer.insert("data", note_doc)
 
                 # Store in user_data and log
                 context.user_data["note"] = note_text
@@ -154,20 +243,44 @@ async def note_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         logger.error(f"Error in note_command: {str(e)}")
 
 
-async def task_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Save a task when the command /task is issued."""
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Search this chat's notes and tasks when the command /find is issued."""
     try:
         chat_id = update.effective_chat.id
         if not ALLOWED_CHAT_IDS or chat_id in ALLOWED_CHAT_IDS:
-            # Get the text after "/task "
-            task_text = update.message.text[6:].strip()
+            query = " ".join(context.args or []).strip()
+
+            if query:
+                # Answered from the local search index, no Gemini call
+                found = await run_db(note_search.search, query, chat_id=chat_id)
+                if found["results"]:
+                    lines = format_results(found["results"])
+                    reply = f"Found {len(lines)} for \"{query}\":\n" + "\n".join(lines)
+                else:
+                    reply = f"Nothing found for \"{query}\""
+                logger.info(f"Find from chat ID {chat_id}: {query} ({len(found['results'])} results)")
+                await update.message.reply_text(reply)
+            else:
+                await update.message.reply_text("Please provide some words after /find")
+
+        else:
+            await update.message.reply_text(
+                "Sorry, you're not authorized to use this bot."
+            )
+            logger.warning(f"Unauthorized access attempt from chat ID: {chat_id}")
+    except Exception as e:
+        logger.error(f"Error in find_command: {str(e)}")
+        await update.message.reply_text(
+            "Sorry, I encountered an error searching your notes."
+        )
 
-            if task_text:
-                # Get current date
-                today = datetime.now().strftime("%Y-%m-%d")
 
-                # Get response from LLM to parse time
-                prompt = f"""You are a task parser. Parse this Thai task with time: "{task_text}"
+async def parse_task_with_llm(task_text: str, today: str) -> dict:
+    """Ask Gemini to split a task into description and time.
+
+    Raises json.JSONDecodeError or ValueError if the reply can't be used.
+    """
+    prompt = f"""You are a task parser. Parse this Thai task with time: "{task_text}"
 Today's date is: {today}
 Return ONLY a valid JSON object in this exact format, nothing else:
 {{
@@ -181,57 +294,92 @@ Rules:
 - Always convert Thai time words to 24-hour format
 - Time must be in HH:mm format"""
 
-                response = analyzer.model.generate_content(
-                    prompt,
-                    generation_config={
-                        "temperature": 0,
-                        "candidate_count": 1,
-                    },
-                )
+    await gemini_bucket.acquire()
+    with metrics.timer("task_model_call"):
+        response = await run_llm(
+            analyzer.model.generate_content,
+            prompt,
+            generation_config={
+                "temperature": 0,
+                "candidate_count": 1,
+            },
+        )
+    metrics.record_call("task_parse", prompt, response.text, response)
+
+    try:
+        # Clean the response text by removing markdown code block
+        cleaned_response = response.text.strip()
+        if cleaned_response.startswith("```"):
+            cleaned_response = cleaned_response.split("\n", 1)[1]
+        if cleaned_response.endswith("```"):
+            cleaned_response = cleaned_response.rsplit("\n", 1)[0]
+        cleaned_response = cleaned_response.strip()
+        if cleaned_response.startswith("json"):
+            cleaned_response = cleaned_response[4:].strip()
+
+        parsed = json.loads(cleaned_response)
+        # Validate required fields
+        if not all(
+            key in parsed for key in ["description", "time", "has_explicit_date"]
+        ):
+            raise ValueError("Missing required fields in response")
+    except (json.JSONDecodeError, ValueError):
+        logger.error(f"Failed to parse LLM response: {response.text}")
+        raise
+
+    # If no explicit date was mentioned, ensure we're using today's date
+    if not parsed["has_explicit_date"]:
+        time_part = parsed["time"].split(" ")[1]
+        parsed["time"] = f"{today} {time_part}"
+
+    return parsed
+
+
+async def task_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Save a task when the command /task is issued."""
+    try:
+        chat_id = update.effective_chat.id
+        if not ALLOWED_CHAT_IDS or chat_id in ALLOWED_CHAT_IDS:
+            # Get the text after "/task "
+            task_text = update.message.text[6:].strip()
+
+            if task_text:
+                # Get current date
+                today = datetime.now().strftime("%Y-%m-%d")
 
                 try:
-                    # Clean the response text by removing markdown code block
-                    cleaned_response = response.text.strip()
-                    if cleaned_response.startswith("```"):
-                        cleaned_response = cleaned_response.split("\n", 1)[1]
-                    if cleaned_response.endswith("```"):
-                        cleaned_response = cleaned_response.rsplit("\n", 1)[0]
-                    cleaned_response = cleaned_response.strip()
-                    if cleaned_response.startswith("json"):
-                        cleaned_response = cleaned_response[4:].strip()
-
-                    parsed = json.loads(cleaned_response)
-                    # Validate required fields
-                    if not all(
-                        key in parsed
-                        for key in ["description", "time", "has_explicit_date"]
-                    ):
-                        raise ValueError("Missing required fields in response")
-
-                    # If no explicit date was mentioned, ensure we're using today's date
-                    if not parsed["has_explicit_date"]:
-                        time_part = parsed["time"].split(" ")[1]
-                        parsed["time"] = f"{today} {time_part}"
+                    # Parse common time phrases locally, the LLM handles the rest
+                    with metrics.timer("task_parse_local"):
+                        local = parse_task(task_text)
+                    if local is not None and local.confidence >= TASK_PARSER_MIN_CONFIDENCE:
+                        parser_stats.record(local=True)
+                        parsed = {
+                            "description": local.description,
+                            "time": local.time.strftime("%Y-%m-%d %H:%M"),
+                            "has_explicit_date": local.has_explicit_date,
+                        }
+                    else:
+                        parser_stats.record(local=False)
+                        parsed = await parse_task_with_llm(task_text, today)
 
                     # Create task document
-                    task_doc = {
-                        "description": parsed["description"],
-                        "type": "task",
-                        "time": parsed["time"],
-                    }
+                    task_doc = build_document(
+                        parsed["description"], "task", parsed["time"], chat_id=chat_id
+                    )
 
-                    # Save to MongoDB
-                    data_collection = analyzer.db["data"]
-                    data_collection.insert_one(task_doc)
+                    # Save to MongoDB (batched; returns once the task is written)
+                    with metrics.timer("mongo_insert"):
+                        await write_buffer.insert("data", task_doc)
+                    reminder_scheduler.add(task_doc)
 
                     # Store in user_data and log
                     context.user_data["task"] = task_text
                     logger.info(f"Task from chat ID {chat_id}: {task_text}")
                     await update.message.reply_text(
-                        f"Task saved: {parsed['description']} at {parsed['time']}"
+                        f"Task saved: {parsed['description']} at "
+                        f"{task_doc['time'].strftime('%Y-%m-%d %H:%M')}"
                     )
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse LLM response: {response.text}")
+                except (json.JSONDecodeError, ValueError) as e:
                     await update.message.reply_text(
                         "Sorry, I couldn't understand the time format. Please try again."
                     )
@@ -275,6 +423,13 @@ Note Taking:
 Example:
 - /note Remember to call John
 
+Search:
+• /find [words] - Find notes and tasks instantly
+Example:
+- /find dentist
+
+⏰ You'll get a reminder here when a task comes due.
+
 💡 You can also chat normally for searching your notes and tasks!"""
 
             await update.message.reply_text(help_text)
@@ -291,15 +446,26 @@ Example:
         )
 
 
-async def setup_bot():
-    """Setup the bot without running polling."""
+async def setup_bot(request=None, model=None):
+    """Setup the bot without running polling.
+
+    `request` replaces the HTTP layer to the Bot API and `model` the LLM
+    backend; both are for offline runs (see loadtest.py).
+    """
     global application
 
-    # Initialize the analyzer
-    initialize_analyzer()
+    if not TOKEN:
+        raise ValueError("No TOKEN provided in .env file")
+
+    # Initialize the analyzer (pings MongoDB and loads collection metadata)
+    # off the event loop, so the API keeps answering meanwhile
+    await run_db(initialize_analyzer, model)
 
     # Create application
-    application = Application.builder().token(TOKEN).build()
+    builder = Application.builder().token(TOKEN).concurrent_updates(CONCURRENT_UPDATES)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
 
     try:
         # Add command handlers
@@ -308,6 +474,7 @@ async def setup_bot():
         application.add_handler(CommandHandler("mychatid", get_chat_id))
         application.add_handler(CommandHandler("note", note_command))
         application.add_handler(CommandHandler("task", task_command))
+        application.add_handler(CommandHandler("find", find_command))
 
         # Add message handler
         application.add_handler(
@@ -342,12 +509,90 @@ async def start_polling():
         logger.info("Polling started!")
 
 
-async def shutdown_bot():
-    """Shutdown the bot."""
-    global application, analyzer
+async def _process_updates():
+    """Feed queued webhook updates to the application."""
+    while True:
+        update = await update_queue.get()
+        try:
+            await application.process_update(update)
+        except Exception as e:
+            logger.error(f"Error processing update {update.update_id}: {str(e)}")
+        finally:
+            update_queue.task_done()
+
+
+async def start_webhook():
+    """Register the webhook with Telegram and start the update workers."""
+    global update_queue, update_workers
+    if not (application and application.running):
+        return
+    update_queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+    update_workers = [
+        asyncio.create_task(_process_updates()) for _ in range(CONCURRENT_UPDATES)
+    ]
+    if WEBHOOK_URL:
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info(f"Webhook set to {WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH}")
+    else:
+        logger.warning("WEBHOOK_URL not set, only accepting locally posted updates")
+
+
+def enqueue_update(data: dict) -> bool:
+    """Queue a Telegram update received by the webhook route.
+
+    Returns False when the queue is full (or the bot isn't ready) so the
+    route can answer with an error and Telegram retries later.
+    """
+    if update_queue is None or application is None:
+        return False
+    try:
+        update_queue.put_nowait(Update.de_json(data, application.bot))
+        return True
+    except asyncio.QueueFull:
+        logger.warning("Webhook update queue full, rejecting update")
+        return False
+
+
+async def send_reminder(task: dict) -> None:
+    await application.bot.send_message(chat_id=task["chat_id"], text=format_reminder(task))
+    logger.info(f"Reminder sent to chat ID {task['chat_id']}: {task.get('description')}")
+
+
+async def start_bot(request=None, model=None):
+    """Set up the bot and start receiving updates the BOT_MODE way."""
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+        # Without it anyone could post forged updates to /telegram/webhook
+        raise ValueError("BOT_MODE=webhook requires WEBHOOK_SECRET")
+    bot = await setup_bot(request=request, model=model)
+    if BOT_MODE == "webhook":
+        # Updates arrive through /telegram/webhook
+        await start_webhook()
+    else:
+        await start_polling()
+    if REMINDERS_ENABLED:
+        # Task reminders are sent from wherever the bot runs
+        reminder_scheduler.start(send_reminder)
+    logger.info(f"Telegram bot started ({BOT_MODE} mode)")
+    return bot
+
+
+async def stop_bot():
+    """Stop receiving and handling updates, keeping process-wide resources
+    (executors, write buffer) usable, e.g. when another process takes over."""
+    global application, analyzer, update_queue, update_workers
+    await reminder_scheduler.stop()
+    for worker in update_workers:
+        worker.cancel()
+    update_workers = []
+    update_queue = None
     if application and application.running:
         try:
-            await application.updater.stop()
+            if application.updater and application.updater.running:
+                await application.updater.stop()
             await application.stop()
             await application.shutdown()
             logger.info("Bot shutdown completed")
@@ -356,6 +601,16 @@ async def shutdown_bot():
 
     if analyzer:
         analyzer.close_connection()
+        analyzer = None
+
+
+async def shutdown_bot():
+    """Shutdown the bot."""
+    await stop_bot()
+
+    # Write out notes/tasks still waiting for their batch
+    await write_buffer.close()
+    shutdown_executors()
 
 
 async def main():
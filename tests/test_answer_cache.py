@@ -0,0 +1,43 @@
+from answer_cache import AnswerCache, is_follow_up
+from chat_memory import ChatMemory
+
+
+def ask(cache, memory, question, answer):
+    """One chat turn: cache lookup, else "compute" and store the answer."""
+    context = memory.context(1, f"User: {question}")
+    response = cache.get("data", question, context)
+    if response is None:
+        response = answer
+        cache.put("data", question, response, context=context)
+    memory.record_exchange(1, question, response)
+    return response
+
+
+def test_same_question_twice_in_one_chat_is_a_hit():
+    cache = AnswerCache(similarity=0)
+    memory = ChatMemory()
+    assert ask(cache, memory, "What meetings do I have on Friday?", "Standup at 9") == "Standup at 9"
+    assert ask(cache, memory, "what meetings do I have on friday", "recomputed") == "Standup at 9"
+    assert cache.hits == 1
+
+
+def test_follow_up_is_keyed_on_the_conversation():
+    cache = AnswerCache(similarity=0)
+    cache.put("data", "and tomorrow?", "Dentist at 10", context="User: meetings today?")
+    assert cache.get("data", "and tomorrow?", "User: meetings today?") == "Dentist at 10"
+    assert cache.get("data", "and tomorrow?", "User: any notes about rent?") is None
+
+
+def test_is_follow_up():
+    assert is_follow_up("and tomorrow")
+    assert is_follow_up("what about that one")
+    assert is_follow_up("แล้วพรุ่งนี้ล่ะ")
+    assert not is_follow_up("what meetings do i have on friday")
+    assert not is_follow_up("พรุ่งนี้มีประชุมอะไรบ้าง")
+
+
+def test_write_invalidates():
+    cache = AnswerCache()
+    cache.put("data", "what meetings do i have on friday", "Standup at 9")
+    cache.invalidate("data")
+    assert cache.get("data", "what meetings do i have on friday") is None
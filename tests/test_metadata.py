@@ -0,0 +1,41 @@
+import mongomock
+from metadata import CollectionMetadata
+
+
+class CountingMetadata(CollectionMetadata):
+    samples = 0
+
+    def _sample_keys(self, collection):
+        self.samples += 1
+        return super()._sample_keys(collection)
+
+
+def test_poll_only_samples_keys_after_a_change():
+    db = mongomock.MongoClient()["metadata_test"]
+    db["data"].insert_one({"description": "a"})
+    changes = []
+    metadata = CountingMetadata(db)
+    metadata.add_listener(lambda name, operation: changes.append((name, operation)))
+
+    metadata.refresh("data")
+    for _ in range(3):
+        # Polling ticks without a change
+        metadata.refresh("data")
+    assert metadata.samples == 1
+    assert metadata.version("data") == 0
+    assert changes == []
+
+    db["data"].insert_one({"description": "b", "type": "note"})
+    metadata.refresh("data")
+    assert metadata.samples == 2
+    assert metadata.version("data") == 1
+    assert "type" in metadata.get("data")["sample_keys"]
+    assert changes == [("data", "insert")]
+
+
+def test_empty_collection_is_not_sampled():
+    db = mongomock.MongoClient()["metadata_test"]
+    db.create_collection("empty")
+    metadata = CountingMetadata(db)
+    assert metadata.get("empty")["sample_keys"] is None
+    assert metadata.samples == 0
@@ -0,0 +1,181 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import mongomock
+from bson import ObjectId
+from reminders import FakeClock, ReminderScheduler
+from schema import build_document
+
+START = datetime(2025, 1, 1, 8, 0)
+
+
+def _task(minutes: float, chat_id: int = 1, **fields):
+    return {
+        "_id": ObjectId(),
+        "description": f"task at +{minutes}m",
+        "type": "task",
+        "time": START + timedelta(minutes=minutes),
+        "chat_id": chat_id,
+        **fields,
+    }
+
+
+def _run(scenario, sync_interval: float = 600, retry_delay: float = 60):
+    """Run `scenario(scheduler, collection, clock, sent)` against a started
+    scheduler on a fake clock; returns the (time, task) reminders sent."""
+    collection = mongomock.MongoClient()["reminders_test"]["data"]
+    sent = []
+
+    async def main():
+        clock = FakeClock(START, timeout=10)
+
+        async def send(task):
+            sent.append((clock.now(), task))
+
+        scheduler = ReminderScheduler(
+            lambda: collection,
+            clock=clock,
+            sync_interval=sync_interval,
+            retry_delay=retry_delay,
+        )
+        scheduler.start(send)
+        await clock.wait_for_sleep(0)
+        try:
+            await scenario(scheduler, collection, clock, sent)
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(main())
+    return sent
+
+
+def test_task_is_reminded_once_when_due():
+    task = _task(30)
+
+    async def scenario(scheduler, collection, clock, sent):
+        collection.insert_one(dict(task))
+        scheduler.add(task)
+        await clock.advance(29 * 60)
+        assert sent == []
+        await clock.advance(60)
+        assert [(at, t["_id"]) for at, t in sent] == [(task["time"], task["_id"])]
+        await clock.advance(3600)
+        assert len(sent) == 1
+        assert collection.find_one({"_id": task["_id"]})["reminded_at"] is not None
+
+    _run(scenario)
+
+
+def test_rescheduled_task_is_reminded_at_new_time_only():
+    task = _task(30)
+    later = START + timedelta(minutes=90)
+
+    async def scenario(scheduler, collection, clock, sent):
+        collection.insert_one(dict(task))
+        scheduler.add(task)
+        collection.update_one({"_id": task["_id"]}, {"$set": {"time": later}})
+        scheduler.add({**task, "time": later})
+        await clock.advance(60 * 60)
+        assert sent == []
+        await clock.advance(60 * 60)
+        assert [(at, t["time"]) for at, t in sent] == [(later, later)]
+
+    _run(scenario)
+
+
+def test_task_rescheduled_elsewhere_is_not_reminded_at_old_time():
+    task = _task(30)
+
+    async def scenario(scheduler, collection, clock, sent):
+        collection.insert_one(dict(task))
+        scheduler.add(task)
+        # Another process moves it; this one still has the old time queued
+        collection.update_one(
+            {"_id": task["_id"]}, {"$set": {"time": START + timedelta(days=2)}}
+        )
+        await clock.advance(60 * 60)
+        assert sent == []
+        assert scheduler.skipped == 1
+
+    _run(scenario)
+
+
+def test_deleted_task_is_skipped():
+    task = _task(30)
+
+    async def scenario(scheduler, collection, clock, sent):
+        collection.insert_one(dict(task))
+        scheduler.add(task)
+        collection.delete_one({"_id": task["_id"]})
+        await clock.advance(60 * 60)
+        assert sent == []
+        assert scheduler.skipped == 1
+        assert scheduler.stats()["scheduled"] == 0
+
+    _run(scenario)
+
+
+def test_task_written_elsewhere_is_picked_up_by_sync():
+    task = _task(30)
+
+    async def scenario(scheduler, collection, clock, sent):
+        collection.insert_one(dict(task))
+        await clock.advance(20 * 60)
+        assert scheduler.syncs >= 1
+        await clock.advance(20 * 60)
+        assert [t["_id"] for _, t in sent] == [task["_id"]]
+
+    _run(scenario, sync_interval=600)
+
+
+def test_failed_reminder_is_retried():
+    task = _task(10)
+    attempts = []
+
+    async def scenario(scheduler, collection, clock, sent):
+        async def flaky_send(reminder):
+            attempts.append(clock.now())
+            if len(attempts) == 1:
+                raise RuntimeError("Telegram unavailable")
+            sent.append((clock.now(), reminder))
+
+        scheduler.send = flaky_send
+        collection.insert_one(dict(task))
+        scheduler.add(task)
+        await clock.advance(15 * 60)
+        assert attempts == [task["time"], task["time"] + timedelta(seconds=60)]
+        assert len(sent) == 1
+        assert scheduler.failed == 1
+
+    _run(scenario, retry_delay=60)
+
+
+def test_notes_and_tasks_without_chat_are_not_scheduled():
+    async def scenario(scheduler, collection, clock, sent):
+        for doc in (_task(10, type="note"), _task(10, chat_id=None)):
+            collection.insert_one(dict(doc))
+            scheduler.add(doc)
+        await clock.advance(30 * 60)
+        assert sent == []
+        assert scheduler.stats()["scheduled"] == 0
+
+    _run(scenario)
+
+
+def test_add_never_raises_and_sync_picks_the_task_up():
+    task = _task(30)
+
+    async def scenario(scheduler, collection, clock, sent):
+        collection.insert_one(dict(task))
+        # An aware time doesn't compare with the scheduler's naive times
+        scheduler.add({**task, "time": task["time"].replace(tzinfo=timezone.utc)})
+        await clock.advance(31 * 60)
+        assert [t["_id"] for _, t in sent] == [task["_id"]]
+
+    _run(scenario, sync_interval=60)
+
+
+def test_aware_times_are_stored_as_naive_local_time():
+    aware = datetime(2025, 1, 1, 8, 0, tzinfo=timezone.utc)
+    stored = build_document("call", "task", aware)["time"]
+    assert stored.tzinfo is None
+    assert stored == aware.astimezone().replace(tzinfo=None)
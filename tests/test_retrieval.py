@@ -0,0 +1,112 @@
+import threading
+import mongomock
+from bson import ObjectId
+from metadata import CollectionMetadata
+from retrieval import DocumentRetriever, TextIndex
+from search import NoteSearch
+
+
+def test_recent_after_remove_and_readd():
+    index = TextIndex(["description"])
+    ids = [ObjectId() for _ in range(4)]
+    for i, doc_id in enumerate(ids):
+        index.add({"_id": doc_id, "description": f"note {i}"})
+    index.remove(str(ids[1]))
+    # Re-adding (an update) moves a document to the newest position
+    index.add({"_id": ids[0], "description": "note 0 edited"})
+    assert index.recent(10) == [str(ids[0]), str(ids[3]), str(ids[2])]
+    assert index.recent(1) == [str(ids[0])]
+    assert index.recent(0) == []
+
+
+class BlockingCollection:
+    """Wraps a collection so `find` waits until released."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def find(self, *args, **kwargs):
+        self.started.set()
+        assert self.release.wait(5)
+        return self.collection.find(*args, **kwargs)
+
+
+def test_search_is_not_blocked_by_a_refresh_in_progress():
+    db = mongomock.MongoClient()["retrieval_test"]
+    db["data"].insert_one({"description": "dentist appointment", "type": "task"})
+    retriever = DocumentRetriever(db)
+    retriever.refresh("data")
+
+    blocking = BlockingCollection(db["data"])
+    db["data"].insert_one({"description": "dentist follow-up", "type": "task"})
+    retriever.db = {"data": blocking}
+    refresher = threading.Thread(target=retriever.refresh, args=("data",))
+    refresher.start()
+    assert blocking.started.wait(5)
+
+    # Served from the current index while MongoDB is being read
+    results, indexed = retriever.search("data", "dentist", 10, refresh=False)
+    assert indexed == 1 and len(results) == 1
+
+    blocking.release.set()
+    refresher.join(5)
+    results, indexed = retriever.search("data", "dentist", 10, refresh=False)
+    assert indexed == 2 and len(results) == 2
+
+
+def test_invalidate_during_refresh_refetches():
+    db = mongomock.MongoClient()["retrieval_test"]
+    db["data"].insert_one({"description": "old text", "type": "note"})
+    retriever = DocumentRetriever(db)
+
+    blocking = BlockingCollection(db["data"])
+    retriever.db = {"data": blocking}
+    refresher = threading.Thread(target=retriever.refresh, args=("data",))
+    refresher.start()
+    assert blocking.started.wait(5)
+    # The document changes and the index is invalidated mid-fetch
+    db["data"].update_one({}, {"$set": {"description": "new text"}})
+    retriever.invalidate("data")
+    blocking.release.set()
+    refresher.join(5)
+
+    results, _ = retriever.search("data", "new", 10, refresh=False)
+    assert [doc["description"] for doc, _ in results] == ["new text"]
+
+
+def test_document_committed_out_of_id_order_is_indexed():
+    db = mongomock.MongoClient()["retrieval_test"]
+    # _id made first, but written after a newer document was indexed
+    late_id = ObjectId()
+    db["data"].insert_one({"description": "first note", "type": "note"})
+    retriever = DocumentRetriever(db)
+    retriever.refresh("data")
+
+    db["data"].insert_one({"_id": late_id, "description": "late note", "type": "note"})
+    retriever.refresh("data")
+    results, indexed = retriever.search("data", "late", 10, refresh=False)
+    assert indexed == 2
+    assert [doc["_id"] for doc, _ in results] == [late_id]
+
+
+def test_search_drops_deleted_and_edited_notes_without_the_bot():
+    db = mongomock.MongoClient()["search_test"]
+    kept, deleted = ObjectId(), ObjectId()
+    db["data"].insert_many([
+        {"_id": kept, "description": "buy milk", "type": "note"},
+        {"_id": deleted, "description": "buy bread", "type": "note"},
+    ])
+    # An API-only worker: only the app's metadata instance, no analyzer
+    metadata = CollectionMetadata(db)
+    search = NoteSearch(lambda: db, refresh_interval=3600, metadata=metadata)
+    metadata.refresh("data")
+    assert len(search.search("buy")["results"]) == 2
+
+    # Written by another process, then noticed by the metadata refresh
+    db["data"].delete_one({"_id": deleted})
+    db["data"].update_one({"_id": kept}, {"$set": {"description": "buy oat milk"}})
+    metadata.refresh("data", "update")
+    results = search.search("buy")["results"]
+    assert [(doc["_id"], doc["description"]) for doc, _ in results] == [(kept, "buy oat milk")]
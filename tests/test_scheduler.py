@@ -0,0 +1,77 @@
+import asyncio
+from scheduler import ChatScheduler, TokenBucket
+
+
+def test_cached_answer_takes_no_token():
+    bucket = TokenBucket(rate_per_second=1.0, capacity=1)
+    scheduler = ChatScheduler(bucket, debounce=0)
+    calls = []
+
+    async def run(question):
+        calls.append(question)
+        return f"answer to {question}"
+
+    async def cached(question):
+        return "cached" if question == "hello" else None
+
+    async def main():
+        first = await scheduler.submit(1, "hello", run, cached)
+        second = await scheduler.submit(1, "other", run, cached)
+        return first, second
+
+    assert asyncio.run(main()) == ("cached", "answer to other")
+    assert calls == ["other"]
+    assert bucket.acquired == 1
+    assert scheduler.stats()["cached"] == 1
+
+
+def test_newer_message_supersedes_call_in_flight():
+    scheduler = ChatScheduler(TokenBucket(rate_per_second=100.0, capacity=10), debounce=0)
+    started = []
+
+    async def run(question):
+        started.append(question)
+        await asyncio.sleep(0.05)
+        return question
+
+    async def main():
+        first = asyncio.create_task(scheduler.submit(1, "a", run))
+        while not started:
+            await asyncio.sleep(0)
+        second = await scheduler.submit(1, "b", run)
+        return await first, second
+
+    assert asyncio.run(main()) == (None, "a\nb")
+    assert scheduler.superseded == 1
+
+
+def test_call_that_started_replying_is_not_cancelled():
+    scheduler = ChatScheduler(TokenBucket(rate_per_second=100.0, capacity=10), debounce=0)
+    replied = []
+    recording = asyncio.Event()
+    questions = []
+
+    async def run(question):
+        questions.append(question)
+        scheduler.replying(1)
+        replied.append(question)
+        # e.g. recording the exchange after the reply was sent
+        if question == "a":
+            await recording.wait()
+        return question
+
+    async def main():
+        first = asyncio.create_task(scheduler.submit(1, "a", run))
+        while not replied:
+            await asyncio.sleep(0)
+        second = asyncio.create_task(scheduler.submit(1, "b", run))
+        while len(replied) < 2:
+            await asyncio.sleep(0)
+        recording.set()
+        return await first, await second
+
+    assert asyncio.run(main()) == ("a", "b")
+    # "a" was answered once; the newer call only got the new message
+    assert questions == ["a", "b"]
+    assert scheduler.superseded == 0
+    assert scheduler.pending == {} and scheduler.answering == {} and not scheduler.replying_tasks
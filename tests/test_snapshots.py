@@ -0,0 +1,32 @@
+import mongomock
+from intent_router import collection_for
+from llm import MongoDBLLMAnalyzer
+from llm_backend import FakeModel
+from snapshots import GeminiContextCache
+
+
+def test_menu_questions_use_restaurant_snapshots():
+    client = mongomock.MongoClient()
+    client["restaurant"]["menus"].insert_one({"name": "ต้มยำ", "nameE": "Tom Yum", "price": 80})
+    client["secretary"]["data"].insert_one({"description": "buy rice", "type": "note"})
+    analyzer = MongoDBLLMAnalyzer(
+        "", "secretary", client=client, model=FakeModel(), restaurant_db_name="restaurant"
+    )
+    try:
+        question = "what's spicy on the menu?"
+        assert collection_for(question) == "menus"
+        prompt, reply, _ = analyzer.build_prompt(collection_for(question), question)
+        assert reply is None and "Tom Yum" in prompt and "ต้มยำ" not in prompt
+        assert analyzer.snapshots.stats()["builds"] == 1
+
+        question = "what did I note about rice?"
+        assert collection_for(question) == "data"
+        prompt, _, _ = analyzer.build_prompt(collection_for(question), question)
+        assert "buy rice" in prompt
+    finally:
+        analyzer.close_connection()
+
+
+def test_context_cache_uses_the_answering_model():
+    assert GeminiContextCache("gemini-2.0-flash").model_name == "models/gemini-2.0-flash"
+    assert GeminiContextCache("models/gemini-1.5-pro-002").model_name == "models/gemini-1.5-pro-002"
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+from typing import List
+from concurrency import BoundedExecutor
+from streaming import STREAM_EMPTY_TEXT, iterate_in_executor, stream_to_message
+
+
+class FakeMessage:
+    """Records what stream_to_message sends to Telegram."""
+
+    def __init__(self):
+        self.replies: List[str] = []
+        self.edits: List[str] = []
+
+    async def reply_text(self, text: str):
+        self.replies.append(text)
+        return self
+
+    async def edit_text(self, text: str):
+        self.edits.append(text)
+        return self
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def _chunks(items, clock=None, step=0.0):
+    for item in items:
+        if clock is not None:
+            clock.now += step
+        yield item
+
+
+def _stream(items, edit_interval=1.0, step=0.0):
+    message = FakeMessage()
+    clock = FakeTime()
+    text = asyncio.run(
+        stream_to_message(message, _chunks(items, clock, step), edit_interval, clock=clock)
+    )
+    return message, text
+
+
+def test_replies_with_first_chunk_and_finishes_with_full_text():
+    message, text = _stream(["Hello", " wor", "ld"])
+    assert text == "Hello world"
+    assert message.replies == ["Hello"]
+    # All chunks arrived within the interval: one final edit
+    assert message.edits == ["Hello world"]
+
+
+def test_edits_at_most_once_per_interval():
+    message, text = _stream([f"w{i} " for i in range(10)], edit_interval=1.0, step=0.4)
+    assert message.replies == ["w0 "]
+    # A chunk every 0.4s: every third one is edited in, the last one included
+    assert message.edits == ["w0 w1 w2 w3 ", "w0 w1 w2 w3 w4 w5 w6 ", text]
+
+
+def test_no_edit_when_last_edit_is_complete():
+    message, text = _stream(["a", "b"], edit_interval=0.0)
+    assert message.replies == ["a"]
+    assert message.edits == ["ab"]
+
+
+def test_leading_whitespace_is_not_sent_alone():
+    message, text = _stream([" ", "\n", "Hi"])
+    assert message.replies == [" \nHi"]
+    assert message.edits == []
+
+
+def test_empty_answer_sends_fallback():
+    # e.g. a safety-blocked answer: no text at all
+    message, text = _stream(["", "  "])
+    assert text == ""
+    assert message.replies == [STREAM_EMPTY_TEXT]
+    assert message.edits == []
+
+
+def test_cancelled_stream_replaces_partial_reply():
+    message = FakeMessage()
+
+    async def main():
+        release = asyncio.Event()
+
+        async def chunks():
+            yield "Half an ans"
+            await release.wait()
+            yield "wer"
+
+        task = asyncio.create_task(
+            stream_to_message(message, chunks(), cancelled_text="(cancelled)")
+        )
+        while not message.replies:
+            await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return task
+
+    task = asyncio.run(main())
+    assert task.cancelled()
+    assert message.replies == ["Half an ans"]
+    assert message.edits == ["(cancelled)"]
+
+
+def test_abandoned_iterator_is_closed():
+    closed = threading.Event()
+    produced = []
+
+    def generate():
+        try:
+            for i in range(1000):
+                produced.append(i)
+                yield f"{i} "
+                # A slow model: the consumer stops long before the end
+                time.sleep(0.01)
+        finally:
+            closed.set()
+
+    async def main():
+        chunks = iterate_in_executor(generate, executor=BoundedExecutor(1, "test"))
+        async for _ in chunks:
+            break
+        await chunks.aclose()
+
+    asyncio.run(main())
+    assert closed.wait(5)
+    assert len(produced) < 1000
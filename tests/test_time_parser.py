@@ -0,0 +1,40 @@
+from datetime import datetime
+import pytest
+from time_parser import CORPUS, FALLBACK_CORPUS, TASK_PARSER_MIN_CONFIDENCE, parse_task
+
+# Tuesday, the reference time of the corpus
+NOW = datetime(2025, 3, 4, 9, 0)
+
+
+@pytest.mark.parametrize("text, description, expected, explicit", CORPUS)
+def test_corpus(text, description, expected, explicit):
+    result = parse_task(text, NOW)
+    assert result is not None
+    assert result.confidence >= TASK_PARSER_MIN_CONFIDENCE
+    assert result.description == description
+    assert result.time.strftime("%Y-%m-%d %H:%M") == expected
+    assert result.has_explicit_date == explicit
+
+
+@pytest.mark.parametrize("text", FALLBACK_CORPUS)
+def test_fallback_corpus(text):
+    result = parse_task(text, NOW)
+    assert result is None or result.confidence < TASK_PARSER_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Standup 9.15 น.", "2025-03-04 09:15"),
+        ("ประชุม เวลา 9.30", "2025-03-04 09:30"),
+        ("Meeting at 10:00", "2025-03-04 10:00"),
+    ],
+)
+def test_dotted_time_needs_marker_or_connector(text, expected):
+    result = parse_task(text, NOW)
+    assert result.confidence >= TASK_PARSER_MIN_CONFIDENCE
+    assert result.time.strftime("%Y-%m-%d %H:%M") == expected
+
+
+def test_only_time_is_not_a_task():
+    assert parse_task("at 10am", NOW) is None
@@ -0,0 +1,109 @@
+import asyncio
+import time
+from pymongo.errors import AutoReconnect, BulkWriteError
+from write_buffer import WriteBuffer
+
+
+class FakeCollection:
+    """Records insert_many calls; `errors` are raised by the next calls, in
+    order (None writes the batch)."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+        self.stored = {}
+
+    def insert_many(self, documents, ordered=True):
+        self.calls.append((time.monotonic(), [doc["_id"] for doc in documents]))
+        error = self.errors.pop(0) if self.errors else None
+        if error is None or getattr(error, "written", False):
+            for document in documents:
+                self.stored[document["_id"]] = document
+        if error is not None:
+            raise error
+
+
+def _lost_ack():
+    # The write went through, but the acknowledgement never arrived
+    error = AutoReconnect("connection reset")
+    error.written = True
+    return error
+
+
+def _duplicates(count):
+    return BulkWriteError({
+        "writeErrors": [
+            {"index": i, "code": 11000, "errmsg": "E11000 duplicate key error"}
+            for i in range(count)
+        ]
+    })
+
+
+def _buffer(collection, **kwargs):
+    return WriteBuffer(lambda name: collection, backoff=0, **kwargs)
+
+
+def test_flushes_when_batch_is_full():
+    collection = FakeCollection()
+    buffer = _buffer(collection, batch_size=3, window=60)
+
+    async def main():
+        return await asyncio.gather(*(buffer.insert("data", {"n": i}) for i in range(3)))
+
+    start = time.monotonic()
+    ids = asyncio.run(main())
+    # Written right away, not after the 60s window
+    assert time.monotonic() - start < 5
+    assert [call_ids for _, call_ids in collection.calls] == [ids]
+    assert buffer.stats()["batches"] == 1
+
+
+def test_flushes_after_window():
+    collection = FakeCollection()
+    buffer = _buffer(collection, batch_size=100, window=0.05)
+
+    async def main():
+        start = time.monotonic()
+        ids = await asyncio.gather(*(buffer.insert("data", {"n": i}) for i in range(2)))
+        return start, ids
+
+    start, ids = asyncio.run(main())
+    assert len(collection.calls) == 1
+    written_at, written = collection.calls[0]
+    assert written == ids
+    assert written_at - start >= 0.05
+
+
+def test_transient_error_is_retried():
+    collection = FakeCollection(errors=[AutoReconnect("failover"), None])
+    buffer = _buffer(collection, window=0)
+    document_id = asyncio.run(buffer.insert("data", {"n": 1}))
+    assert len(collection.calls) == 2
+    assert list(collection.stored) == [document_id]
+    assert buffer.stats()["retries"] == 1
+    assert buffer.stats()["failures"] == 0
+
+
+def test_duplicate_key_on_retry_counts_as_written():
+    collection = FakeCollection(errors=[_lost_ack(), _duplicates(2)])
+    buffer = _buffer(collection, window=0)
+
+    async def main():
+        return await buffer.insert_many("data", [{"n": 1}, {"n": 2}], return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert results == list(collection.stored)
+    assert buffer.stats()["documents"] == 2
+    assert buffer.stats()["failures"] == 0
+
+
+def test_duplicate_key_on_first_attempt_fails():
+    collection = FakeCollection(errors=[_duplicates(1)])
+    buffer = _buffer(collection, window=0)
+
+    async def main():
+        return await buffer.insert_many("data", [{"n": 1}], return_exceptions=True)
+
+    [result] = asyncio.run(main())
+    assert isinstance(result, Exception)
+    assert buffer.stats()["failures"] == 1
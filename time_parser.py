@@ -0,0 +1,412 @@
+import os
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+# Results below this confidence are sent to the LLM instead (overridable from .env)
+TASK_PARSER_MIN_CONFIDENCE = float(os.getenv("TASK_PARSER_MIN_CONFIDENCE", "0.8"))
+
+_THAI_DIGITS = str.maketrans("๐๑๒๓๔๕๖๗๘๙", "0123456789")
+
+# Longest first so "สิบเอ็ด" wins over "สิบ"
+_THAI_NUMBERS = {
+    "สิบสอง": 12, "สิบเอ็ด": 11, "สิบ": 10, "เก้า": 9, "แปด": 8, "เจ็ด": 7,
+    "หก": 6, "ห้า": 5, "สี่": 4, "สาม": 3, "สอง": 2, "หนึ่ง": 1, "เอ็ด": 1,
+}
+_NUM = r"(\d{1,2}|" + "|".join(_THAI_NUMBERS) + r")"
+
+# Full names only: abbreviations like "sun"/"sat" are ordinary English words
+_WEEKDAYS = {
+    "monday": 0, "จันทร์": 0,
+    "tuesday": 1, "อังคาร": 1,
+    "wednesday": 2, "พุธ": 2,
+    "thursday": 3, "พฤหัสบดี": 3, "พฤหัส": 3,
+    "friday": 4, "ศุกร์": 4,
+    "saturday": 5, "เสาร์": 5,
+    "sunday": 6, "อาทิตย์": 6,
+}
+_WEEKDAY_RE = "|".join(sorted(_WEEKDAYS, key=len, reverse=True))
+
+_MONTHS = {
+    "january": 1, "jan": 1, "มกราคม": 1, "ม.ค.": 1,
+    "february": 2, "feb": 2, "กุมภาพันธ์": 2, "ก.พ.": 2,
+    "march": 3, "mar": 3, "มีนาคม": 3, "มี.ค.": 3,
+    "april": 4, "apr": 4, "เมษายน": 4, "เม.ย.": 4,
+    "may": 5, "พฤษภาคม": 5, "พ.ค.": 5,
+    "june": 6, "jun": 6, "มิถุนายน": 6, "มิ.ย.": 6,
+    "july": 7, "jul": 7, "กรกฎาคม": 7, "ก.ค.": 7,
+    "august": 8, "aug": 8, "สิงหาคม": 8, "ส.ค.": 8,
+    "september": 9, "sep": 9, "sept": 9, "กันยายน": 9, "ก.ย.": 9,
+    "october": 10, "oct": 10, "ตุลาคม": 10, "ต.ค.": 10,
+    "november": 11, "nov": 11, "พฤศจิกายน": 11, "พ.ย.": 11,
+    "december": 12, "dec": 12, "ธันวาคม": 12, "ธ.ค.": 12,
+}
+_MONTH_RE = "|".join(re.escape(m) for m in sorted(_MONTHS, key=len, reverse=True))
+
+# Word boundary that also works next to Thai characters (which \b does not)
+_L = r"(?<![a-z0-9])"
+_R = r"(?![a-z0-9])"
+
+
+def _c(pattern: str) -> "re.Pattern":
+    return re.compile(pattern, re.IGNORECASE)
+
+
+# Time expressions: (pattern, kind). Order matters, first match wins.
+_TIME_PATTERNS = [
+    (_c(r"อีก\s*" + _NUM + r"\s*(ชั่วโมง|ชม\.?|นาที)"), "relative"),
+    (_c(_L + r"in\s+(\d{1,3})\s*(hours?|hrs?|minutes?|mins?)" + _R), "relative"),
+    (_c(r"เที่ยงคืน"), "midnight"),
+    (_c(r"เที่ยง(?:วัน)?(?:\s*ครึ่ง)?"), "noon"),
+    (_c(_L + r"(noon|midday)" + _R), "noon"),
+    (_c(_L + r"midnight" + _R), "midnight"),
+    (_c(_L + r"(\d{1,2})[:.](\d{2})\s*(a\.?m\.?|p\.?m\.?)" + _R), "clock_ampm"),
+    (_c(_L + r"(\d{1,2})\s*(a\.?m\.?|p\.?m\.?)" + _R), "hour_ampm"),
+    (_c(_L + r"(\d{1,2})\s*นาฬิกา(?:\s*(\d{1,2})\s*นาที)?"), "clock24"),
+    (_c(_L + r"(\d{1,2}):(\d{2})(?:\s*น\.)?" + _R), "clock24"),
+    # "9.00 น." or "at 9.00"; a bare "2.50" may as well be a price
+    (_c(_L + r"(\d{1,2})\.(\d{2})(\s*น\.)?" + _R), "clock_dot"),
+    (_c(r"บ่าย\s*" + _NUM + r"?\s*โมง(?:\s*(ครึ่ง))?"), "afternoon"),
+    (_c(_NUM + r"\s*โมง\s*เย็น(?:\s*(ครึ่ง))?"), "evening"),
+    (_c(_NUM + r"\s*โมง\s*เช้า(?:\s*(ครึ่ง))?"), "morning"),
+    (_c(_NUM + r"\s*โมง(?:\s*(ครึ่ง))?"), "thai_hour"),
+    (_c(_NUM + r"\s*ทุ่ม(?:\s*(ครึ่ง))?"), "night"),
+    (_c(r"ตี\s*" + _NUM + r"(?:\s*(ครึ่ง))?"), "early"),
+]
+
+# Date expressions: (pattern, kind)
+_DATE_PATTERNS = [
+    (_c(_L + r"(\d{4})-(\d{1,2})-(\d{1,2})" + _R), "iso"),
+    (_c(_L + r"(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?" + _R), "dmy"),
+    (_c(_L + r"(\d{1,2})\s*(" + _MONTH_RE + r")(?:\s*(\d{4}))?(?![a-zก-๙])"), "day_month"),
+    (_c(_L + r"(" + _MONTH_RE + r")\s*(\d{1,2})(?:,?\s*(\d{4}))?" + _R), "month_day"),
+    (_c(_L + r"day after tomorrow" + _R), "plus2"),
+    (_c(r"มะรืน(?:นี้)?"), "plus2"),
+    (_c(_L + r"tomorrow" + _R), "plus1"),
+    (_c(r"พรุ่งนี้"), "plus1"),
+    (_c(_L + r"(today|tonight)" + _R), "plus0"),
+    (_c(r"วันนี้|คืนนี้"), "plus0"),
+    (_c(_L + r"next\s+(" + _WEEKDAY_RE + r")" + _R), "next_weekday"),
+    (_c(r"(?:วัน)?(" + _WEEKDAY_RE + r")\s*หน้า"), "next_weekday"),
+    (_c(r"(?:" + _L + r"(?:this|on)\s+)?" + _L + r"(" + _WEEKDAY_RE + r")" + _R + r"(?:\s*นี้)?"), "weekday"),
+    (_c(r"วัน(" + _WEEKDAY_RE + r")(?:\s*นี้)?"), "weekday"),
+]
+
+# Connector words left dangling once the date/time is removed (whole words
+# only, so "Press button" keeps its "on")
+_CONNECTOR_WORDS = r"(?:at|on|by|in|for|ตอน|เวลา|วันที่|วัน|ใน|ช่วง)"
+# Thai connectors that are written attached to the word before them
+# ("มีนัดตอนสิบโมง"), but not the "ตอน" of "ขั้นตอน"
+_ATTACHED_CONNECTORS = r"(?:(?<!ขั้น)ตอน|เวลา|วันที่)"
+_CONNECTORS = _c(
+    r"^(?:\s|" + _CONNECTOR_WORDS + r"(?=\s|$))+"
+    r"|(?:\s|,|(?<!\S)" + _CONNECTOR_WORDS + r"|" + _ATTACHED_CONNECTORS + r")+$"
+)
+# A connector right before a date/time is removed with it ("Gym at 7pm
+# every day" -> "Gym every day")
+_PRECEDING_CONNECTOR = _c(
+    r"(?:(?<!\S)" + _CONNECTOR_WORDS + r"|" + _ATTACHED_CONNECTORS + r")\s*$"
+)
+
+
+@dataclass
+class ParsedTask:
+    description: str
+    time: datetime
+    has_explicit_date: bool
+    confidence: float
+
+
+def _number(token: Optional[str]) -> Optional[int]:
+    if token is None:
+        return None
+    if token in _THAI_NUMBERS:
+        return _THAI_NUMBERS[token]
+    return int(token)
+
+
+def _parse_time(text: str, now: datetime) -> Optional[Tuple[Tuple[int, int], Tuple[int, int], float, Optional[datetime]]]:
+    """Return ((hour, minute), span, confidence, absolute) for the first time
+    expression in `text`. `absolute` is set for relative times ("in 2 hours")."""
+    for pattern, kind in _TIME_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        g = match.groups()
+        confidence = 1.0
+        minute = 0
+
+        if kind == "relative":
+            amount = _number(g[0])
+            unit = g[1].lower()
+            if unit.startswith(("h", "ชั่วโมง", "ชม")):
+                delta = timedelta(hours=amount)
+            else:
+                delta = timedelta(minutes=amount)
+            at = (now + delta).replace(second=0, microsecond=0)
+            return (at.hour, at.minute), match.span(), confidence, at
+        if kind == "noon":
+            hour, minute = 12, 30 if "ครึ่ง" in match.group(0) else 0
+        elif kind == "midnight":
+            hour = 0
+        elif kind == "clock_ampm":
+            hour, minute = int(g[0]), int(g[1])
+            if hour > 12:
+                continue
+            hour = hour % 12 + (12 if g[2].lower().startswith("p") else 0)
+        elif kind == "hour_ampm":
+            hour = int(g[0])
+            if hour > 12:
+                continue
+            hour = hour % 12 + (12 if g[1].lower().startswith("p") else 0)
+        elif kind == "clock24":
+            hour, minute = int(g[0]), int(g[1] or 0)
+        elif kind == "clock_dot":
+            hour, minute = int(g[0]), int(g[1])
+            if g[2] is None and not _PRECEDING_CONNECTOR.search(text[: match.start()]):
+                confidence = 0.5
+        else:
+            n = _number(g[0])
+            half = g[-1] is not None
+            minute = 30 if half else 0
+            if kind == "afternoon":
+                # "บ่ายโมง" = 13:00, "บ่าย 2 โมง" = 14:00
+                hour = 12 + (n or 1)
+            elif kind == "evening":
+                hour = n + 12 if n < 12 else n
+            elif kind == "morning":
+                hour = n
+            elif kind == "night":
+                # "1 ทุ่ม" = 19:00 ... "6 ทุ่ม" = midnight
+                hour = (n + 18) % 24
+            elif kind == "early":
+                hour = n
+            else:
+                # Bare "N โมง": 7-12 is morning/noon; 1-6 usually means the
+                # afternoon/evening but is ambiguous
+                if n >= 7:
+                    hour = n
+                else:
+                    hour = n + 12
+                    confidence = 0.6
+
+        if not (0 <= hour <= 23 and 0 <= minute <= 59):
+            continue
+        return (hour, minute), match.span(), confidence, None
+    return None
+
+
+def _parse_date(text: str, now: datetime) -> Optional[Tuple[datetime, Tuple[int, int]]]:
+    """Return (date, span) for the first date expression in `text`."""
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    for pattern, kind in _DATE_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        g = match.groups()
+        try:
+            if kind == "iso":
+                date = datetime(_year(g[0]), int(g[1]), int(g[2]))
+            elif kind == "dmy":
+                year = _year(g[2]) if g[2] else now.year
+                date = datetime(year, int(g[1]), int(g[0]))
+                if not g[2] and date < today:
+                    date = date.replace(year=year + 1)
+            elif kind in ("day_month", "month_day"):
+                day, month = (g[0], g[1]) if kind == "day_month" else (g[1], g[0])
+                year = _year(g[2]) if g[2] else now.year
+                date = datetime(year, _MONTHS[month.lower()], int(day))
+                if not g[2] and date < today:
+                    date = date.replace(year=year + 1)
+            elif kind.startswith("plus"):
+                date = today + timedelta(days=int(kind[4:]))
+            else:
+                weekday = _WEEKDAYS[g[0].lower()]
+                days = (weekday - today.weekday()) % 7
+                if kind == "next_weekday" and days == 0:
+                    days = 7
+                date = today + timedelta(days=days)
+        except ValueError:
+            continue
+        return date, match.span()
+    return None
+
+
+def find_date(text: str, now: Optional[datetime] = None) -> Optional[Tuple[datetime, Tuple[int, int]]]:
+    """First date expression in `text` ("tomorrow", "วันศุกร์", "3 มี.ค."),
+    as (midnight of that day, span in `text`)."""
+    return _parse_date(text.translate(_THAI_DIGITS), now or datetime.now())
+
+
+def _year(token: str) -> int:
+    year = int(token)
+    if year < 100:
+        year += 2000
+    elif year > 2400:
+        # Buddhist Era
+        year -= 543
+    return year
+
+
+def _remove_spans(text: str, spans: List[Tuple[int, int]]) -> str:
+    for start, end in sorted(spans, reverse=True):
+        connector = _PRECEDING_CONNECTOR.search(text[:start])
+        if connector:
+            start = connector.start()
+        text = text[:start] + " " + text[end:]
+    return text
+
+
+def parse_task(text: str, now: Optional[datetime] = None) -> Optional[ParsedTask]:
+    """Parse a task like "Meeting tomorrow at 10am" or "ประชุม พรุ่งนี้ 10 โมง".
+
+    Returns None when no time is found; otherwise a ParsedTask whose
+    `confidence` says whether the result can be trusted without the LLM.
+    """
+    now = now or datetime.now()
+    normalized = text.translate(_THAI_DIGITS)
+
+    parsed_time = _parse_time(normalized, now)
+    if parsed_time is None:
+        return None
+    (hour, minute), time_span, confidence, absolute = parsed_time
+    spans = [time_span]
+
+    # Look for a date in what's left so the two matches can't overlap
+    remaining = _remove_spans(normalized, spans)
+    parsed_date = _parse_date(remaining, now)
+    has_explicit_date = parsed_date is not None or absolute is not None
+    if absolute is not None:
+        when = absolute
+    else:
+        date = parsed_date[0] if parsed_date else now
+        when = date.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if parsed_date is None and when < now:
+            # Without a date, a time already past today is the next one
+            # ("6 ทุ่ม", "12am", "ตี 2")
+            when += timedelta(days=1)
+    if parsed_date:
+        remaining = _remove_spans(remaining, [parsed_date[1]])
+
+    description = _CONNECTORS.sub("", re.sub(r"\s+", " ", remaining)).strip()
+    if not description:
+        return None
+    if re.search(r"\d", description):
+        # Leftover numbers may be an unparsed part of the date/time
+        confidence = min(confidence, 0.5)
+
+    return ParsedTask(description, when, has_explicit_date, confidence)
+
+
+class ParserStats:
+    """Counts how often /task is parsed locally vs. sent to the LLM."""
+
+    def __init__(self):
+        self.local = 0
+        self.fallback = 0
+        self._lock = threading.Lock()
+
+    def record(self, local: bool) -> None:
+        with self._lock:
+            if local:
+                self.local += 1
+            else:
+                self.fallback += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.local + self.fallback
+            return {
+                "local": self.local,
+                "fallback": self.fallback,
+                "fallback_rate": self.fallback / total if total else 0.0,
+            }
+
+
+parser_stats = ParserStats()
+
+
+# Corpus check and benchmark: python time_parser.py
+# Reference time is Tuesday 2025-03-04 09:00.
+CORPUS = [
+    ("Buy groceries at 14:30", "Buy groceries", "2025-03-04 14:30", False),
+    ("Meeting tomorrow at 10am", "Meeting", "2025-03-05 10:00", True),
+    ("Dentist appointment next monday 15:00", "Dentist appointment", "2025-03-10 15:00", True),
+    ("Call mom at 7:45 pm", "Call mom", "2025-03-04 19:45", False),
+    ("Lunch with Ann at noon", "Lunch with Ann", "2025-03-04 12:00", False),
+    ("Submit report on friday 9am", "Submit report", "2025-03-07 09:00", True),
+    ("Pay rent 2025-04-01 08:00", "Pay rent", "2025-04-01 08:00", True),
+    ("Flight 12/3 6:30am", "Flight", "2025-03-12 06:30", True),
+    ("Check oven in 30 minutes", "Check oven", "2025-03-04 09:30", True),
+    ("Party on march 8 at 8pm", "Party", "2025-03-08 20:00", True),
+    ("ประชุม พรุ่งนี้ 10 โมง", "ประชุม", "2025-03-05 10:00", True),
+    ("ไปดูดาว 21:30", "ไปดูดาว", "2025-03-04 21:30", False),
+    ("ไปทะเล วันเสาร์ 9 โมงเช้า", "ไปทะเล", "2025-03-08 09:00", True),
+    ("กินข้าวกับแม่ เที่ยง", "กินข้าวกับแม่", "2025-03-04 12:00", False),
+    ("ไปหาหมอ บ่าย 2 โมง", "ไปหาหมอ", "2025-03-04 14:00", False),
+    ("ออกกำลังกาย 5 โมงเย็น", "ออกกำลังกาย", "2025-03-04 17:00", False),
+    ("ดูหนัง 2 ทุ่มครึ่ง", "ดูหนัง", "2025-03-04 20:30", False),
+    ("ส่งงาน วันจันทร์หน้า 9.00 น.", "ส่งงาน", "2025-03-10 09:00", True),
+    ("จ่ายค่าไฟ มะรืนนี้ สิบโมง", "จ่ายค่าไฟ", "2025-03-06 10:00", True),
+    ("โทรหาลูกค้า อีก 2 ชั่วโมง", "โทรหาลูกค้า", "2025-03-04 11:00", True),
+    ("ทำบุญ 15 เมษายน 8 โมงเช้า", "ทำบุญ", "2025-04-15 08:00", True),
+    ("ดูบอล ตี 2", "ดูบอล", "2025-03-05 02:00", False),
+    ("ประชุม ๑๔:๐๐ น.", "ประชุม", "2025-03-04 14:00", False),
+    # Words that merely look like dates or connectors must survive
+    ("Watch the sun rise at 6am", "Watch the sun rise", "2025-03-05 06:00", False),
+    ("Press the button 18:00", "Press the button", "2025-03-04 18:00", False),
+    ("ทำการบ้านทุกวัน 19:00", "ทำการบ้านทุกวัน", "2025-03-04 19:00", False),
+    ("Gym at 7pm every day", "Gym every day", "2025-03-04 19:00", False),
+    ("Standup at 9.15", "Standup", "2025-03-04 09:15", False),
+    # Midnight without a date is tonight's, not the one already past
+    ("ประชุม 6 ทุ่ม", "ประชุม", "2025-03-05 00:00", False),
+    ("Meet at 12am", "Meet", "2025-03-05 00:00", False),
+    ("Book flight for may 5 at 14:00", "Book flight", "2025-05-05 14:00", True),
+    ("มีนัดตอนสิบโมง", "มีนัด", "2025-03-04 10:00", False),
+    ("ตรวจขั้นตอน 10 โมง", "ตรวจขั้นตอน", "2025-03-04 10:00", False),
+]
+
+# Inputs the parser must hand to the LLM (no time, or ambiguous)
+FALLBACK_CORPUS = [
+    "Buy milk",
+    "ซื้อของ",
+    "เจอเพื่อน 4 โมง",
+    "Meeting sometime next week",
+    "Buy milk 2.50",
+]
+
+if __name__ == "__main__":
+    import time
+
+    now = datetime(2025, 3, 4, 9, 0)
+    failures = 0
+    for text, description, expected, explicit in CORPUS:
+        result = parse_task(text, now)
+        got = (
+            (result.description, result.time.strftime("%Y-%m-%d %H:%M"), result.has_explicit_date)
+            if result and result.confidence >= TASK_PARSER_MIN_CONFIDENCE
+            else None
+        )
+        if got != (description, expected, explicit):
+            failures += 1
+            print(f"FAIL {text!r}: expected {(description, expected, explicit)}, got {got}")
+    for text in FALLBACK_CORPUS:
+        result = parse_task(text, now)
+        if result is not None and result.confidence >= TASK_PARSER_MIN_CONFIDENCE:
+            failures += 1
+            print(f"FAIL {text!r}: expected LLM fallback, got {result}")
+    total = len(CORPUS) + len(FALLBACK_CORPUS)
+    print(f"{total - failures}/{total} corpus cases passed")
+
+    inputs = [text for text, *_ in CORPUS] + FALLBACK_CORPUS
+    rounds = 200
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in inputs:
+            parse_task(text, now)
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed / (rounds * len(inputs)) * 1e6:.1f} µs per parse")
+
+    raise SystemExit(1 if failures else 0)
@@ -0,0 +1,83 @@
+"""POST synthetic Telegram updates to a locally running server.
+
+Start the app with BOT_MODE=webhook (WEBHOOK_URL can stay empty), then:
+
+    python webhook_harness.py --text "/note hello" --count 10
+
+Replies go out through the real Bot API, so use a chat ID your bot can reach.
+"""
+import os
+import json
+import time
+import argparse
+import itertools
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_update_ids = itertools.count(int(time.time()))
+
+
+def make_update(chat_id: int, text: str, update_id: int = None) -> dict:
+    """Minimal Telegram Update JSON for a private text message."""
+    update_id = next(_update_ids) if update_id is None else update_id
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Harness"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split(" ", 1)[0]
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(command)}
+        ]
+    return {"update_id": update_id, "message": message}
+
+
+def post_update(url: str, update: dict, secret: str = "") -> int:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    if secret:
+        request.add_header("X-Telegram-Bot-Api-Secret-Token", secret)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", default="http://localhost:8000/telegram/webhook")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    parser.add_argument("--chat-id", type=int, default=int(
+        (os.getenv("ALLOWED_CHAT_IDS", "") or "1").split(",")[0]
+    ))
+    parser.add_argument("--text", default="/help")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        statuses = list(
+            pool.map(
+                lambda _: post_update(
+                    args.url, make_update(args.chat_id, args.text), args.secret
+                ),
+                range(args.count),
+            )
+        )
+    elapsed = time.perf_counter() - start
+
+    counts = {status: statuses.count(status) for status in set(statuses)}
+    print(f"Posted {args.count} updates in {elapsed:.2f}s, status codes: {counts}")
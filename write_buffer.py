@@ -0,0 +1,240 @@
+import os
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError, WriteError
+from answer_cache import answer_cache
+from concurrency import run_db
+from database import get_db
+from live_updates import live_feed
+from response_cache import response_cache
+from search import note_search
+
+# Write batching settings (overridable from .env)
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+WRITE_BATCH_WINDOW = float(os.getenv("WRITE_BATCH_WINDOW", "0.05"))
+WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", "3"))
+WRITE_RETRY_BACKOFF = float(os.getenv("WRITE_RETRY_BACKOFF", "0.2"))
+
+
+def is_transient(error: Exception) -> bool:
+    """Network errors, failovers and anything MongoDB labels retryable."""
+    if isinstance(error, ConnectionFailure):
+        return True
+    return isinstance(error, PyMongoError) and error.has_error_label("RetryableWriteError")
+
+
+class WriteBuffer:
+    """Async write-behind buffer that groups inserts into `insert_many`.
+
+    Documents for the same collection are flushed together once
+    `batch_size` are waiting or `window` seconds after the first one.
+    `insert` only returns once the batch holding the document has been
+    written (acknowledged per the client's write concern), so callers can
+    confirm to the user afterwards. Transient errors are retried with
+    exponential backoff; `_id`s are assigned up front, so a retry after a
+    lost acknowledgement can't write a document twice.
+    """
+
+    def __init__(
+        self,
+        get_collection: Callable[[str], Any],
+        batch_size: int = WRITE_BATCH_SIZE,
+        window: float = WRITE_BATCH_WINDOW,
+        max_retries: int = WRITE_MAX_RETRIES,
+        backoff: float = WRITE_RETRY_BACKOFF,
+        on_flush: Optional[Callable[[str, List[Dict]], None]] = None,
+    ):
+        self.get_collection = get_collection
+        self.batch_size = batch_size
+        self.window = window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.on_flush = on_flush
+        self.pending: Dict[str, List[Tuple[Dict, asyncio.Future]]] = {}
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+        self.flushes: Set[asyncio.Task] = set()
+        self.closed = False
+        self.batches = 0
+        self.documents = 0
+        self.retries = 0
+        self.failures = 0
+
+    async def insert(self, collection_name: str, document: Dict) -> ObjectId:
+        """Queue one document and wait until it is written; returns its _id."""
+        return (await self.insert_many(collection_name, [document]))[0]
+
+    async def insert_many(
+        self, collection_name: str, documents: List[Dict], return_exceptions: bool = False
+    ) -> List[Any]:
+        """Queue documents and wait until all are written.
+
+        With `return_exceptions` a failed document yields its exception in
+        the result list instead of raising.
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        queue = self.pending.setdefault(collection_name, [])
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+            future = loop.create_future()
+            queue.append((document, future))
+            futures.append(future)
+
+        if self.closed or len(queue) >= self.batch_size:
+            self._start_flush(collection_name)
+        elif collection_name not in self.timers:
+            self.timers[collection_name] = loop.call_later(
+                self.window, self._start_flush, collection_name
+            )
+        return await asyncio.gather(*futures, return_exceptions=return_exceptions)
+
+    def _start_flush(self, collection_name: str) -> None:
+        timer = self.timers.pop(collection_name, None)
+        if timer is not None:
+            timer.cancel()
+        queue = self.pending.pop(collection_name, [])
+        for start in range(0, len(queue), self.batch_size):
+            task = asyncio.ensure_future(
+                self._flush(collection_name, queue[start : start + self.batch_size])
+            )
+            self.flushes.add(task)
+            task.add_done_callback(self.flushes.discard)
+
+    async def _flush(self, collection_name: str, batch: List[Tuple[Dict, asyncio.Future]]) -> None:
+        documents = [document for document, _ in batch]
+        try:
+            failures = await self._write(collection_name, documents)
+        except Exception as e:
+            logging.error(
+                f"Failed to write {len(batch)} documents to '{collection_name}': {str(e)}"
+            )
+            failures = {index: e for index in range(len(batch))}
+
+        self.batches += 1
+        self.documents += len(batch) - len(failures)
+        self.failures += len(failures)
+        if len(failures) < len(batch) and self.on_flush:
+            written = [document for index, document in enumerate(documents) if index not in failures]
+            try:
+                self.on_flush(collection_name, written)
+            except Exception as e:
+                logging.error(f"Write buffer on_flush failed for '{collection_name}': {str(e)}")
+
+        for index, (document, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in failures:
+                future.set_exception(failures[index])
+            else:
+                future.set_result(document["_id"])
+
+    async def _write(self, collection_name: str, documents: List[Dict]) -> Dict[int, Exception]:
+        """insert_many with retries; returns the failed documents by index."""
+        collection = self.get_collection(collection_name)
+        attempt = 0
+        while True:
+            try:
+                await run_db(collection.insert_many, documents, ordered=False)
+                return {}
+            except BulkWriteError as e:
+                failures = {}
+                for error in e.details.get("writeErrors", []):
+                    if error.get("code") == 11000 and attempt > 0:
+                        # Written by an earlier attempt whose ack was lost
+                        continue
+                    failures[error["index"]] = WriteError(
+                        error.get("errmsg", "write error"), error.get("code"), error
+                    )
+                return failures
+            except PyMongoError as e:
+                if attempt >= self.max_retries or not is_transient(e):
+                    raise
+                attempt += 1
+                self.retries += 1
+                delay = self.backoff * 2 ** (attempt - 1)
+                logging.warning(
+                    f"Transient error writing to '{collection_name}' "
+                    f"(retry {attempt}/{self.max_retries} in {delay:.2f}s): {str(e)}"
+                )
+                await asyncio.sleep(delay)
+
+    async def flush(self) -> None:
+        """Write everything queued so far and wait for it."""
+        for collection_name in list(self.pending):
+            self._start_flush(collection_name)
+        while self.flushes:
+            await asyncio.gather(*list(self.flushes), return_exceptions=True)
+
+    async def close(self) -> None:
+        """Flush and write later inserts immediately (used on shutdown)."""
+        self.closed = True
+        await self.flush()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "pending": sum(len(queue) for queue in self.pending.values()),
+            "in_flight_batches": len(self.flushes),
+            "batches": self.batches,
+            "documents": self.documents,
+            "avg_batch_size": self.documents / self.batches if self.batches else 0.0,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+
+def _on_flush(collection_name: str, documents: List[Dict]) -> None:
+    answer_cache.invalidate(collection_name)
+    response_cache.invalidate(collection_name)
+    note_search.mark_stale(collection_name)
+    live_feed.publish(collection_name, documents)
+
+
+# Shared by the bot handlers and /add-data. After each written batch, cached
+# answers and responses for the collection are invalidated, its search index
+# is marked for refresh and open dashboards get the new documents.
+write_buffer = WriteBuffer(lambda name: get_db()[name], on_flush=_on_flush)
+
+
+# Insert throughput: one insert_one per document vs. the buffer (mongomock or
+# MONGODB_URI): python write_buffer.py --docs 2000
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Insert throughput benchmark")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--mongo-uri", default="", help="default: mongomock")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        import pymongo
+
+        db = pymongo.MongoClient(args.mongo_uri)["write_buffer_bench"]
+    else:
+        import mongomock
+
+        db = mongomock.MongoClient()["write_buffer_bench"]
+
+    async def bench():
+        collection = db["data"]
+        collection.drop()
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(run_db(collection.insert_one, {"n": i}) for i in range(args.docs))
+        )
+        single = time.perf_counter() - start
+
+        collection.drop()
+        buffer = WriteBuffer(lambda name: db[name])
+        start = time.perf_counter()
+        await asyncio.gather(*(buffer.insert("data", {"n": i}) for i in range(args.docs)))
+        batched = time.perf_counter() - start
+        await buffer.close()
+
+        print(f"insert_one x{args.docs}: {single:.2f}s ({args.docs / single:.0f} docs/s)")
+        print(f"write buffer:       {batched:.2f}s ({args.docs / batched:.0f} docs/s)")
+        print(f"buffer stats: {buffer.stats()}, stored: {collection.count_documents({})}")
+
+    asyncio.run(bench())